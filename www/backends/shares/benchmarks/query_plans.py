@@ -0,0 +1,207 @@
+"""
+Query plan regression check for the hot lookups.
+
+Builds the schema (create_all + migrations) in a throwaway database, seeds the hot tables
+with generated rows, runs ANALYZE, then EXPLAINs every query in `HOT_QUERIES`. The queries
+are compiled from the statement builders the services themselves call, so the check follows
+the code. A plan reading one of the seeded tables with a sequential scan means a filter has
+lost its index. `tests/test_query_plans.py` runs the check when `QUERY_PLAN_DATABASE_URL`
+is set; by hand it prints every plan and exits with status 1 on a regression:
+
+    QUERY_PLAN_DATABASE_URL=postgresql+asyncpg://.../nextstocks_plans \\
+        python -m benchmarks.query_plans --rows 50000 --show
+
+The database is dropped and recreated table by table. Never point it at real data.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List
+
+from sqlalchemy import Enum as SAEnum
+from sqlalchemy import Table, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlmodel import SQLModel
+
+from src.apps.accounts.services import known_ip_statement
+from src.apps.accounts.tenants import tenant_statement
+from src.apps.portfolios.alerts import holding_statement
+from src.apps.transactions.dependencies import TransactionListParams
+from src.apps.transactions.enums import TransactionStatus
+from src.apps.transactions.services import transaction_list_statement
+from src.db.migrations import apply_migrations
+from src.utils.pagination import DEFAULT_PAGE_SIZE, encode_cursor
+
+USERS = 1000
+# One user uid out of the seeded pool, `i % USERS` picks it in SQL
+SAMPLE_USER = uuid.UUID(int=42)
+SEEDED_TABLES = ("known_ips", "domains", "transactions", "investment_subscription", "portfolio")
+
+# Column overrides giving the seeded rows realistic selectivity, as SQL over `i`
+USER_UID_SQL = "('00000000-0000-0000-0000-' || lpad((i % {users})::text, 12, '0'))::uuid"
+OVERRIDES: Dict[str, Dict[str, str]] = {
+    "known_ips": {
+        "userUid": USER_UID_SQL,
+        "ip": "'10.' || (i % 250) || '.' || (i / 250 % 250) || '.' || (i % 7)",
+    },
+    "domains": {
+        "userUid": USER_UID_SQL,
+        "domain": "'https://tenant' || (i % 50) || '.example.com'",
+    },
+    "transactions": {
+        "payerUid": USER_UID_SQL,
+        "createdAt": "now() - (i || ' minutes')::interval",
+        "status": "CASE WHEN i % 20 = 0 THEN 'PENDING' ELSE 'CONFIRMED' END",
+    },
+    "investment_subscription": {
+        "userUid": USER_UID_SQL,
+        "expiryDate": "now() + ((i % 730) - 365 || ' days')::interval",
+        "status": "CASE WHEN i % 10 = 0 THEN 'CONFIRMED' ELSE 'CANCELLED' END",
+    },
+    "portfolio": {
+        "userUid": USER_UID_SQL,
+        "assetSymbol": "'SYM' || (i % 300)",
+    },
+}
+
+
+def _default_sql(column) -> str:
+    """A value for any NOT NULL column, by type."""
+    if isinstance(column.type, SAEnum):
+        return f"'{column.type.enums[0]}'"
+    python_type = None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        pass
+    if python_type is uuid.UUID:
+        return "gen_random_uuid()"
+    if python_type in (datetime,) or "TIMESTAMP" in str(column.type):
+        return "now()"
+    if python_type is bool:
+        return "false"
+    if python_type in (int, float) or "NUMERIC" in str(column.type):
+        return "(i % 1000)"
+    return "md5(i::text)"
+
+
+def seed_sql(table: Table, rows: int) -> str:
+    overrides = OVERRIDES.get(table.name, {})
+    columns, values = [], []
+    for column in table.columns:
+        if column.name in overrides:
+            value = overrides[column.name].format(users=USERS)
+        elif column.primary_key:
+            value = "gen_random_uuid()"
+        elif column.nullable:
+            continue
+        else:
+            value = _default_sql(column)
+        columns.append(f'"{column.name}"')
+        values.append(value)
+    return (
+        f'INSERT INTO "{table.name}" ({", ".join(columns)}) '
+        f"SELECT {', '.join(values)} FROM generate_series(1, {rows}) AS i"
+    )
+
+
+# The statements the services run, from their own builders, with representative parameters
+HOT_QUERIES: Dict[str, Callable[[], object]] = {
+    "known_ip_lookup": lambda: known_ip_statement(SAMPLE_USER, "10.42.0.0"),
+    "tenant_lookup": lambda: tenant_statement("https://tenant7.example.com"),
+    "transaction_history_first_page": lambda: transaction_list_statement(SAMPLE_USER, list_params()),
+    "transaction_history_keyset_page": lambda: transaction_list_statement(
+        SAMPLE_USER, list_params(cursor=encode_cursor(datetime.utcnow() - timedelta(days=20), uuid.UUID(int=0)))
+    ),
+    "transaction_history_filtered": lambda: transaction_list_statement(
+        SAMPLE_USER, list_params(status=TransactionStatus.PENDING, createdAfter=datetime.utcnow() - timedelta(days=90))
+    ),
+    "portfolio_holding": lambda: holding_statement(SAMPLE_USER, "SYM42"),
+}
+
+
+def list_params(**overrides) -> TransactionListParams:
+    params = dict(
+        cursor=None, limit=DEFAULT_PAGE_SIZE, status=None, transactionType=None,
+        method=None, createdAfter=None, createdBefore=None,
+    )
+    params.update(overrides)
+    return TransactionListParams(**params)
+
+
+def walk(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def sequential_scans(plan: dict) -> List[str]:
+    """Seeded tables (or their partitions) read with a sequential scan."""
+    return [
+        node["Relation Name"]
+        for node in walk(plan)
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith(SEEDED_TABLES)
+    ]
+
+
+async def explain(connection: AsyncConnection, statement) -> dict:
+    compiled = statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    result = await connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+    return result.scalar()[0]["Plan"]
+
+
+async def check_plans(url: str, rows: int = 50000, show: bool = False) -> Dict[str, List[str]]:
+    """
+    Seeds the database behind `url` and EXPLAINs every hot query. Returns the seeded
+    tables each query reads with a sequential scan, by query name.
+    """
+    engine = create_async_engine(url)
+    tables = [SQLModel.metadata.tables[name] for name in SEEDED_TABLES]
+
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.drop_all)
+        await connection.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+        await connection.run_sync(SQLModel.metadata.create_all)
+    await apply_migrations(engine)
+
+    async with engine.begin() as connection:
+        # Foreign keys point at users that are not seeded
+        await connection.execute(text("SET LOCAL session_replication_role = replica"))
+        for table in tables:
+            await connection.execute(text(seed_sql(table, rows)))
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text(f"ANALYZE {', '.join(SEEDED_TABLES)}"))
+
+    scans_by_query: Dict[str, List[str]] = {}
+    async with engine.connect() as connection:
+        for name, build in HOT_QUERIES.items():
+            plan = await explain(connection, build())
+            scans = sequential_scans(plan)
+            status = "SEQ SCAN on " + ", ".join(scans) if scans else "ok"
+            print(f"{name:36} {plan['Node Type']:24} cost={plan['Total Cost']:<10} {status}")
+            if show:
+                for node in walk(plan):
+                    print(f"    {node['Node Type']} {node.get('Index Name') or node.get('Relation Name') or ''}")
+            if scans:
+                scans_by_query[name] = scans
+    await engine.dispose()
+    return scans_by_query
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.environ.get("QUERY_PLAN_DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--show", action="store_true", help="print every plan node")
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("set QUERY_PLAN_DATABASE_URL or pass --url (a throwaway database)")
+    regressed = asyncio.run(check_plans(args.url, args.rows, args.show))
+    if regressed:
+        print(f"\n{len(regressed)} queries regressed to sequential scans", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark for the security-code helpers in `src.db.redis`.
+
+Counts the network round trips each helper makes against a live Redis (the
+one configured by REDIS_URL) and the mean latency per call, next to the
+sequential command sequence the helpers used to issue.
+
+    python -m benchmarks.redis_round_trips --iterations 1000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import redis.asyncio as aioredis
+from redis.asyncio.connection import Connection
+
+from src.db import redis as redis_helpers
+
+
+class CountingConnection(Connection):
+    """Connection that counts every packet written to the socket (one per round trip)."""
+
+    round_trips = 0
+
+    async def send_packed_command(self, command, check_health: bool = True) -> None:
+        CountingConnection.round_trips += 1
+        await super().send_packed_command(command, check_health)
+
+
+async def legacy_store_verification_code(client: aioredis.Redis, user_id: uuid.UUID, code: str):
+    await client.hset(f"verification_code:{user_id}", mapping={"code": code, "verified": "false"})
+    await client.expire(f"verification_code:{user_id}", redis_helpers.VERIFICATION_CODE_EXPIRY)
+
+
+async def legacy_store_allowed_ip(client: aioredis.Redis, user_id: uuid.UUID, ip: str):
+    if await client.get(f"new_ip:{user_id}:{ip}"):
+        await client.delete(f"new_ip:{user_id}:{ip}")
+    await client.set(f"allowed:{user_id}:{ip}", ip)
+
+
+async def legacy_tokens_in_blocklist(client: aioredis.Redis, jtis):
+    return {jti: await client.exists(jti) == 1 for jti in jtis}
+
+
+async def measure(name: str, iterations: int, call) -> None:
+    CountingConnection.round_trips = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<40} {CountingConnection.round_trips / iterations:>6.2f} round trips/call"
+        f" {elapsed / iterations * 1e6:>10.1f} us/call"
+    )
+
+
+async def main(iterations: int, batch: int) -> None:
+    pool = aioredis.ConnectionPool.from_url(redis_helpers.broker_url, connection_class=CountingConnection)
+    client = aioredis.Redis(connection_pool=pool)
+    # Route the helpers through the counting pool as well.
+    redis_helpers.redis_client.connection_pool = pool
+
+    user_id = uuid.uuid4()
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(batch)]
+    jtis = [str(uuid.uuid4()) for _ in range(batch)]
+    await redis_helpers.store_new_ip(user_id, ips[0], 1)
+
+    # Warm up the script cache so EVALSHA never falls back to EVAL during the run.
+    await redis_helpers.store_allowed_ip(user_id, ips[0])
+    await redis_helpers.mark_email_verified(user_id)
+
+    await measure("legacy store_verification_code", iterations,
+                  lambda: legacy_store_verification_code(client, user_id, "123456"))
+    await measure("store_verification_code", iterations,
+                  lambda: redis_helpers.store_verification_code(user_id, "123456"))
+    await measure("legacy store_allowed_ip", iterations,
+                  lambda: legacy_store_allowed_ip(client, user_id, ips[0]))
+    await measure("store_allowed_ip", iterations,
+                  lambda: redis_helpers.store_allowed_ip(user_id, ips[0]))
+    await measure(f"legacy token_in_blocklist x{batch}", iterations,
+                  lambda: legacy_tokens_in_blocklist(client, jtis))
+    await measure(f"tokens_in_blocklist x{batch}", iterations,
+                  lambda: redis_helpers.tokens_in_blocklist(jtis))
+    await measure(f"get_ip_security_status x{batch}", iterations,
+                  lambda: redis_helpers.get_ip_security_status(user_id, ips))
+
+    await client.delete(
+        f"verification_code:{user_id}",
+        *[f"allowed:{user_id}:{ip}" for ip in ips],
+        *[f"new_ip:{user_id}:{ip}" for ip in ips],
+    )
+    await pool.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.batch))
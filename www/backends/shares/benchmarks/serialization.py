@@ -0,0 +1,93 @@
+"""
+Serialization micro-benchmark for large lists of read schemas.
+
+Compares the generic FastAPI path (jsonable_encoder + json.dumps in JSONResponse)
+with FastJSONResponse (orjson) and the precompiled `Serializer`s, starting from
+ORM-like rows as a service would return them.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from src.apps.portfolios.schemas import PortfolioRead, portfolio_read_serializer
+from src.apps.transactions.enums import TransactionPaymentMethod, TransactionPaymentType, TransactionStatus
+from src.apps.transactions.schemas import TransactionHistoryRead, transaction_history_read_serializer
+from src.utils.responses import FastJSONResponse
+
+
+def portfolio_rows(count: int):
+    now = datetime.utcnow()
+    return [
+        SimpleNamespace(
+            uid=uuid.uuid4(), assetName="Apple Inc.", assetSymbol="AAPL", symbol="AAPL",
+            walletAddress=None, exchange="NASDAQ", dividendYield=Decimal("0.005400"),
+            isCrypto=False, isStocks=True, domainUid=uuid.uuid4(), userUid=uuid.uuid4(),
+            purchaseDate=now, createdAt=now, updatedAt=now,
+        )
+        for _ in range(count)
+    ]
+
+
+def transaction_rows(count: int):
+    now = datetime.utcnow()
+    return [
+        SimpleNamespace(
+            uid=uuid.uuid4(), transactionId=f"TX-{i:012d}", amountPaid=Decimal("1250.50"),
+            status=TransactionStatus.CONFIRMED, transactionType=TransactionPaymentType.SUBSCRIPTION,
+            method=TransactionPaymentMethod.CREDITCARD, payerUid=uuid.uuid4(), createdAt=now, updatedAt=now,
+        )
+        for i in range(count)
+    ]
+
+
+def generic_path(schema, rows) -> bytes:
+    models = [schema.model_validate(row, from_attributes=True) for row in rows]
+    return JSONResponse(jsonable_encoder(models)).body
+
+
+def orjson_path(schema, rows) -> bytes:
+    models = [schema.model_validate(row, from_attributes=True) for row in rows]
+    return FastJSONResponse(models).body
+
+
+def precompiled_path(serializer, rows) -> bytes:
+    return serializer.list_response(rows).body
+
+
+def bench(label: str, repeat: int, call) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<40} {best * 1000:>9.1f} ms")
+    return best
+
+
+def main(rows: int, repeat: int) -> None:
+    cases = [
+        ("PortfolioRead", PortfolioRead, portfolio_read_serializer, portfolio_rows(rows)),
+        ("TransactionHistoryRead", TransactionHistoryRead, transaction_history_read_serializer, transaction_rows(rows)),
+    ]
+    for name, schema, serializer, data in cases:
+        print(f"{name} x{rows}")
+        baseline = bench("jsonable_encoder + json.dumps", repeat, lambda: generic_path(schema, data))
+        bench("model_validate + orjson", repeat, lambda: orjson_path(schema, data))
+        fast = bench("precompiled Serializer", repeat, lambda: precompiled_path(serializer, data))
+        print(f"  speed-up {baseline / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
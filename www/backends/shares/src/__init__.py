@@ -1,12 +1,22 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
 
-from src.db.db import init_db
-from src.utils.logger import LOGGER
+from src.db.cloudinary import shutdown_upload_pools
+from src.db.db import init_db, replica_router
+from src.utils.logger import LOGGER, stop_logger
 from src.errors import register_all_errors
 from src.middleware import register_middleware
 from src.config.settings import Config
 from src.apps.accounts.views import auth_router
+from src.apps.analytics.ingestion import page_view_buffer
+from src.apps.analytics.views import analytics_router
+from src.apps.monitoring.views import monitoring_router
+from src.apps.portfolios.ticks import tick_bus
+from src.apps.portfolios.views import portfolios_router
+from src.apps.transactions.views import transactions_router
+from src.utils.metrics import METRICS
+from src.utils.responses import FastJSONResponse
 
 version = Config.VERSION
 
@@ -59,8 +69,11 @@ There are two methods for authentication:
 * **Error Messages:** Error messages will be provided in the JSON response body.
 
 ### Rate Limiting
-* **None
-The API may have rate limits to prevent abuse. Please refer to the official Next Stocks API documentation for specific rate limits.
+
+* Every route is rate limited per client IP and, for authenticated calls, per user.
+* Authentication routes (`/auth/token`, `/auth/signup`) have stricter limits to prevent credential stuffing.
+* Each response carries `RateLimit-Limit`, `RateLimit-Remaining`, `RateLimit-Reset` and `RateLimit-Policy` headers.
+* Requests over the limit receive `429 Too Many Requests` with a `Retry-After` header.
 
 ### Additional Notes
 
@@ -75,8 +88,18 @@ version_prefix = f"/{version}"
 async def life_span(app: FastAPI):
     LOGGER.info("Server is running")
     await init_db()
+    METRICS.start()
+    replica_router.start()
+    page_view_buffer.start()
+    tick_bus.start()
     yield
+    await tick_bus.stop()
+    await page_view_buffer.stop()
+    await replica_router.stop()
+    await METRICS.stop()
+    shutdown_upload_pools()
     LOGGER.info("Server has stopped")
+    stop_logger()
 
 
 app = FastAPI(
@@ -84,6 +107,7 @@ app = FastAPI(
     description=description,
     version=version,
     lifespan=life_span,
+    default_response_class=FastJSONResponse,
     license_info={
         "name": "MIT License",
         "url": "https://github.com/david-jerry/next-stocks-api/blob/main/LICENSE",
@@ -106,6 +130,12 @@ register_middleware(app)
 
 # app.include_router(book_router, prefix=f"{version_prefix}/books", tags=["books"])
 app.include_router(auth_router, prefix=f"{version_prefix}/auth", tags=["auth"])
+app.include_router(analytics_router, prefix=f"{version_prefix}/analytics", tags=["analytics"])
+app.include_router(transactions_router, prefix=f"{version_prefix}/transactions", tags=["transactions"])
+app.include_router(portfolios_router, prefix=f"{version_prefix}/portfolios", tags=["portfolios"])
+app.include_router(monitoring_router, prefix=f"{version_prefix}/monitoring", tags=["monitoring"])
+if Config.MEDIA_STORAGE == "local":
+    app.mount(Config.MEDIA_URL, StaticFiles(directory=Config.MEDIA_ROOT, check_dir=False), name="media")
 # app.include_router(user_router, prefix=f"{version_prefix}/users", tags=["users"])
 # app.include_router(
 #     business_router, prefix=f"{version_prefix}/businesses", tags=["businesses"]
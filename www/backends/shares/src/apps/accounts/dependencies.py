@@ -1,15 +1,97 @@
-from typing import Any, List, Annotated
+from typing import Any, List, Annotated, Optional
+import uuid
 
-from src.db.db import get_session
+from src.apps.accounts.tenants import Tenant, tenant_resolver
+from src.db.db import get_read_session, get_session
+from src.db.models import User
+from src.db.redis import token_in_blocklist
+from src.errors import AccessTokenRequired, DomainNotFound, InsufficientPermission, InvalidToken, RevokedToken, UserNotFound
 from src.config.settings import Config
+from src.utils.hashing import decode_token
 
 from fastapi import Depends, Request, status
 from fastapi.exceptions import HTTPException
 from fastapi.security import HTTPBearer, OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.security.http import HTTPAuthorizationCredentials
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl=f"/{Config.VERSION}/auth/token")
 db_dependency = Annotated[AsyncSession, Depends(get_session)]
+# For dashboards, analytics and listings: served by a replica when one is available
+read_db_dependency = Annotated[AsyncSession, Depends(get_read_session)]
 
 
+async def get_user_from_token(token: str, session: AsyncSession) -> User:
+    """Resolves an access token to its user, rejecting refresh and revoked tokens."""
+    token_data: Optional[dict] = decode_token(token)
+    if token_data is None:
+        raise InvalidToken()
+    if token_data.get("refresh"):
+        raise AccessTokenRequired()
+    if await token_in_blocklist(token_data["jti"]):
+        raise RevokedToken()
+
+    db_result = await session.exec(select(User).where(User.uid == uuid.UUID(token_data["user"]["user_uid"])))
+    user = db_result.first()
+    if user is None:
+        raise UserNotFound()
+    return user
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)], session: db_dependency) -> User:
+    return await get_user_from_token(token, session)
+
+
+async def get_current_read_user(token: Annotated[str, Depends(oauth2_bearer)], session: read_db_dependency) -> User:
+    """`get_current_user` for read-only routes, loaded through the request's read session so it opens no primary one."""
+    return await get_user_from_token(token, session)
+
+
+async def get_admin_user(user: Annotated[User, Depends(get_current_user)]) -> User:
+    if not (user.isAdmin or user.isSuperuser):
+        raise InsufficientPermission()
+    return user
+
+
+async def get_optional_tenant(request: Request) -> Optional[Tenant]:
+    """The tenant named by the `Domain` header, resolved from cache. None for unknown domains."""
+    tenant = await tenant_resolver.resolve(request.headers.get("Domain"))
+    request.state.tenant = tenant
+    return tenant
+
+
+async def get_tenant(tenant: Annotated[Optional[Tenant], Depends(get_optional_tenant)]) -> Tenant:
+    if tenant is None:
+        raise DomainNotFound()
+    return tenant
+
+
+def ensure_tenant_admin(tenant: Tenant, user: User) -> User:
+    if not (user.isSuperuser or tenant.ownerUid == user.uid):
+        raise InsufficientPermission()
+    return user
+
+
+async def get_tenant_admin(
+    tenant: Annotated[Tenant, Depends(get_tenant)], user: Annotated[User, Depends(get_current_user)]
+) -> User:
+    """The signed in user when they own the tenant of the request. Admins of other tenants are refused."""
+    return ensure_tenant_admin(tenant, user)
+
+
+async def get_read_tenant_admin(
+    tenant: Annotated[Tenant, Depends(get_tenant)], user: Annotated[User, Depends(get_current_read_user)]
+) -> User:
+    """`get_tenant_admin` for read-only routes."""
+    return ensure_tenant_admin(tenant, user)
+
+
+current_user_dependency = Annotated[User, Depends(get_current_user)]
+admin_user_dependency = Annotated[User, Depends(get_admin_user)]
+tenant_admin_dependency = Annotated[User, Depends(get_tenant_admin)]
+# Read-only routes: the user is loaded through the same read session as the route's queries
+read_user_dependency = Annotated[User, Depends(get_current_read_user)]
+read_tenant_admin_dependency = Annotated[User, Depends(get_read_tenant_admin)]
+tenant_dependency = Annotated[Tenant, Depends(get_tenant)]
+optional_tenant_dependency = Annotated[Optional[Tenant], Depends(get_optional_tenant)]
@@ -1,7 +1,7 @@
 import uuid
 
 from fastapi import UploadFile
-from pydantic import AnyHttpUrl, BaseModel, EmailStr, Field, FileUrl, IPvAnyAddress, constr
+from pydantic import AnyHttpUrl, BaseModel, EmailStr, Field, IPvAnyAddress, constr
 from pydantic_extra_types.phone_numbers import PhoneNumber
 from pydantic_extra_types.routing_number import ABARoutingNumber
 from pydantic_extra_types.payment import PaymentCardBrand, PaymentCardNumber
@@ -12,6 +12,7 @@ from typing import Optional, List, Annotated
 from src.apps.accounts.enums import UserGender, UserMaritalStatus
 from src.apps.portfolios.schemas import PortfolioRead
 from src.apps.transactions.schemas import SubscriptionRead
+from src.utils.responses import Serializer
 
 
 class Message(BaseModel):
@@ -142,8 +143,9 @@ class CreateOrUpdateVerifiedDocument(BaseModel):
 class VerifiedDocumentRead(BaseModel):
     uid: uuid.UUID
     name: Annotated[str, constr(to_lower=True, strip_whitespace=True)]
-    file: FileUrl
-    domainUid: uuid.UUID
+    # Storage URLs are https:// (Cloudinary) or relative to MEDIA_URL, never file://
+    file: str
+    domainUid: Optional[uuid.UUID]
     userUid: uuid.UUID
     approved: bool
 
@@ -151,6 +153,17 @@ class VerifiedDocumentRead(BaseModel):
         from_attributes = True
 
 
+class DocumentUploadFailure(BaseModel):
+    name: str
+    message: str
+    error_code: str
+
+
+class VerifiedDocumentsIngestRead(BaseModel):
+    documents: List[VerifiedDocumentRead] = []
+    failed: List[DocumentUploadFailure] = []
+
+
 # Pydantic model for BankAccount
 class BankAccountBase(BaseModel):
     bankName: Optional[Annotated[str, constr(max_length=255)]]
@@ -202,3 +215,12 @@ class CardRead(BaseModel):
     def expired(self) -> bool:
         return self.expirationDate < date.today()
 
+
+# Precompiled JSON serializers, see src.utils.responses
+user_read_serializer = Serializer(UserRead)
+token_serializer = Serializer(Token)
+known_domains_read_serializer = Serializer(KnownDomainsRead)
+verified_document_read_serializer = Serializer(VerifiedDocumentRead)
+verified_documents_ingest_serializer = Serializer(VerifiedDocumentsIngestRead)
+bank_account_read_serializer = Serializer(BankAccountRead)
+card_read_serializer = Serializer(CardRead)
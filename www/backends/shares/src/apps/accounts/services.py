@@ -1,3 +1,4 @@
+import asyncio
 import random
 import uuid
 
@@ -7,20 +8,97 @@ from uuid import UUID
 
 from fastapi import Depends, HTTPException, UploadFile
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import insert
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 # from src.app.auth.mails import send_card_pin, send_new_bank_account_details
-from src.apps.accounts.schemas import BankAccountCreate, CreateOrUpdateVerifiedDocument, Token, UserCreateOrLoginSchema, UserUpdateSchema
-from src.db.cloudinary import upload_image
+from src.apps.accounts.schemas import (
+    BankAccountCreate,
+    CreateOrUpdateVerifiedDocument,
+    Token,
+    UserCreateOrLoginSchema,
+    UserRead,
+    UserUpdateSchema,
+)
+from src.apps.accounts.tenants import normalize_domain
+from src.db.cloudinary import upload_document, upload_image
 from src.db.models import BankAccount, KnownDomains, KnownIps, User, VerifiedDocuments
 from src.db.redis import store_allowed_ip, store_verification_code
-from src.errors import BankAccountNotFound, InsufficientPermission, InvalidCredentials, UnknownIpConflict, UserAlreadyExists, UserNotFound
+from src.errors import (
+    BankAccountNotFound,
+    ImageTooLarge,
+    InsufficientPermission,
+    InvalidCredentials,
+    InvalidImage,
+    UnknownIpConflict,
+    UserAlreadyExists,
+    UserNotFound,
+)
 from src.utils.hashing import create_access_token, generate_verification_code, generateHashKey, verifyHashKey
 from src.utils.logger import LOGGER
 from src.config.settings import Config
 
 
+# Reported for documents that could not be stored, matching the registered error handlers
+UPLOAD_FAILURES = {
+    InvalidImage: ("The uploaded file is not a valid image", "invalid_image"),
+    ImageTooLarge: ("The uploaded image is too large", "image_too_large"),
+}
+
+
+class DocumentIngestionService:
+    """
+    Stores a KYC submission: every file is uploaded concurrently (bounded by
+    `UPLOAD_CONCURRENCY` per worker), then the documents that made it are inserted with a
+    single INSERT. Failed uploads are reported back and do not affect the others, so a
+    submission takes about as long as its slowest file.
+    """
+
+    async def ingest(
+        self,
+        documents: List[CreateOrUpdateVerifiedDocument],
+        user_uid: uuid.UUID,
+        domain_uid: Optional[uuid.UUID],
+        session: AsyncSession,
+    ):
+        folder = f"documents/{user_uid}"
+        results = await asyncio.gather(
+            *(upload_document(document.file, folder) for document in documents),
+            return_exceptions=True,
+        )
+
+        rows, failed = [], []
+        for document, result in zip(documents, results):
+            if isinstance(result, BaseException):
+                message, error_code = UPLOAD_FAILURES.get(type(result), ("Unable to upload this document", "upload_failed"))
+                if error_code == "upload_failed":
+                    LOGGER.error(f"Uploading document {document.name!r} for {user_uid} failed: {result!r}")
+                failed.append({"name": document.name, "message": message, "error_code": error_code})
+                continue
+            rows.append({
+                "uid": uuid.uuid4(),
+                "name": document.name,
+                "file": result,
+                "approved": False,
+                "userUid": user_uid,
+                "domainUid": domain_uid,
+            })
+
+        if rows:
+            await session.execute(insert(VerifiedDocuments).values(rows))
+            await session.commit()
+        return {"documents": rows, "failed": failed}
+
+
+document_ingestion_service = DocumentIngestionService()
+
+
+def known_ip_statement(user_uid: UUID, ip: str):
+    """Served by the (userUid, ip) index."""
+    return select(KnownIps).where(KnownIps.userUid == user_uid).where(KnownIps.ip == ip)
+
+
 class UserService:
     async def does_user_exist(self, email: Optional[str], uid: Optional[uuid.UUID], session: AsyncSession) -> User | None:
         if email is not None:
@@ -32,18 +110,16 @@ class UserService:
         return user
 
     async def does_ip_exist(self, user: User, ip: str, session: AsyncSession):
-        db_result = await session.exec(select(KnownIps).where(KnownIps.userUid == user.uid).where(KnownIps.ip == ip))
+        db_result = await session.exec(known_ip_statement(user.uid, ip))
         new_ip = db_result.first()
         if new_ip is None:
             return False
         return True
 
     async def does_domain_exist(self, user: User, domain: str, session: AsyncSession):
-        db_result = await session.exec(select(KnownDomains).where(KnownDomains.userUid == user.uid).where(KnownDomains.domain == domain))
-        new_ip = db_result.first()
-        if new_ip is None:
-            return False
-        return True
+        # `user.domains` is loaded with the user (selectin), no need for another query
+        domain = normalize_domain(domain)
+        return any(normalize_domain(str(known.domain)) == domain for known in user.domains)
 
     async def authenticate_user(self, form_data: UserCreateOrLoginSchema, ip: str, domain: str, session: AsyncSession):
         user: Optional[User] = await self.does_user_exist(email=form_data.email, session=session)
@@ -81,7 +157,7 @@ class UserService:
                 return {
                         "message": "Authenticated successfully",
                         "code": code,
-                        "user": user.model_dump_json(),
+                        "user": UserRead.model_validate(user),
                         "access_token": access_token,
                         "refresh_token": refresh_token,
                         "valid_ip": valid_ip,
@@ -178,7 +254,7 @@ class UserService:
         if user is None:
             raise UserNotFound()
 
-        user.image = await upload_image(image)
+        user.image = await upload_image(image, folder="users")
 
         await session.commit()
         await session.refresh(user)
@@ -202,27 +278,20 @@ class UserService:
         await session.add(new_ip)
         await session.commit()
 
-    async def add_verified_documents(self, form_data: List[CreateOrUpdateVerifiedDocument], user_uid: uuid.UUID, ip: str, session: AsyncSession):
+    async def add_verified_documents(
+        self,
+        form_data: List[CreateOrUpdateVerifiedDocument],
+        user_uid: uuid.UUID,
+        ip: str,
+        session: AsyncSession,
+        domain_uid: Optional[uuid.UUID] = None,
+    ):
         user: Optional[User] = await self.does_user_exist(uid=user_uid, session=session)
 
         if user is None:
             raise UserNotFound()
 
-        # Process each item in form_data
-        for document_data in form_data:
-            # Convert each form_data item to a dictionary
-            data_dict = document_data.model_dump()
-
-            # Add user_uid to establish the relationship with the user
-            data_dict["user_uid"] = user_uid
-            data_dict["user"] = user
-
-            # Create a new VerifiedDocuments object using the converted data
-            new_document = VerifiedDocuments(**data_dict)
-
-            # Add the new document to the session
-            await session.add(new_document)
-        await session.commit()
+        return await document_ingestion_service.ingest(form_data, user.uid, domain_uid, session)
 
     async def update_verified_documents(self, user_uid: uuid.UUID, document_id: uuid.UUID, form_data: CreateOrUpdateVerifiedDocument, session: AsyncSession):
         user: Optional[User] = await self.does_user_exist(uid=user_uid, session=session)
@@ -0,0 +1,156 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import orjson
+from sqlalchemy import inspect
+from sqlmodel import select
+
+from src.config.settings import Config
+from src.db.db import async_session_factory
+from src.db.models import KnownDomains, User
+from src.db.redis import cache_generation, invalidate_cached, redis_client, store_cached
+from src.utils.caching import SingleFlight, invalidate_after_commit
+
+# A hash with the serialized tenant under "tenant"
+TENANT_KEY = "tenants:{}"
+LOCAL_CACHE_MAX_SIZE = 5000
+
+# Cached for unknown domains so repeated lookups do not reach the database
+_MISSING = b""
+
+
+class Tenant(NamedTuple):
+    uid: uuid.UUID
+    domain: str
+    ownerUid: Optional[uuid.UUID]
+    ownerIsAdmin: bool
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def normalize_domain(domain: Optional[str]) -> str:
+    """Cache key for a domain: lower case, without surrounding spaces or a trailing slash."""
+    return (domain or "").strip().lower().rstrip("/")
+
+
+def tenant_statement(key: str):
+    """
+    Every user who signed up on a domain has a `KnownDomains` row for it. The tenant is
+    the row owned by an admin (the site owner) when there is one, else the oldest row.
+    Served by the (domain) index.
+    """
+    return (
+        select(KnownDomains.uid, KnownDomains.domain, KnownDomains.userUid, User.isAdmin, User.isSuperuser)
+        .outerjoin(User, User.uid == KnownDomains.userUid)
+        .where(KnownDomains.domain.in_(list({key, f"{key}/"})))
+        .order_by(User.isSuperuser.desc().nulls_last(), User.isAdmin.desc().nulls_last(), User.joined)
+        .limit(1)
+    )
+
+
+class TenantResolver:
+    """
+    Maps `Domain` header values to the tenant they belong to.
+
+    Lookups go through a small per-worker cache (`TENANT_LOCAL_TTL` seconds), then Redis
+    (`TENANT_CACHE_TTL`), then the database. Unknown domains are cached too, for
+    `TENANT_NEGATIVE_CACHE_TTL`, so a client sending garbage cannot turn every request into
+    a query. Concurrent misses for the same domain share one query.
+    """
+
+    def __init__(self):
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._fills = SingleFlight()
+        # Bumped by every invalidation in this worker, a fill that saw another value does not keep its result
+        self._generations: Dict[str, int] = {}
+
+    async def resolve(self, domain: Optional[str]) -> Optional[Tenant]:
+        key = normalize_domain(domain)
+        if not key:
+            return None
+
+        cached = self._local.get(key)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+
+        async with self._fills.lock(key):
+            cached = self._local.get(key)
+            if cached is not None and time.monotonic() < cached[1]:
+                return cached[0]
+
+            local_generation = self._generations.get(key, 0)
+            stored = await redis_client.hget(TENANT_KEY.format(key), "tenant")
+            if stored is not None:
+                tenant = self._load(stored)
+                cacheable = True
+            else:
+                generation = await cache_generation(TENANT_KEY.format(key))
+                tenant = await self.lookup(key)
+                ttl = Config.TENANT_CACHE_TTL if tenant else Config.TENANT_NEGATIVE_CACHE_TTL
+                # Invalidated during the lookup: the result may predate the change, use it without caching it
+                cacheable = await store_cached(TENANT_KEY.format(key), generation, {"tenant": self._dump(tenant)}, ttl)
+        if not cacheable or self._generations.get(key, 0) != local_generation:
+            return tenant
+
+        local_ttl = Config.TENANT_LOCAL_TTL if tenant else min(Config.TENANT_LOCAL_TTL, Config.TENANT_NEGATIVE_CACHE_TTL)
+        self._remember(key, tenant, local_ttl)
+        return tenant
+
+    def _remember(self, key: str, tenant: Optional[Tenant], ttl: float) -> None:
+        self._local.pop(key, None)
+        self._local[key] = (tenant, time.monotonic() + ttl)
+        if len(self._local) > LOCAL_CACHE_MAX_SIZE:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _dump(tenant: Optional[Tenant]) -> bytes:
+        return orjson.dumps(tenant.as_dict()) if tenant else _MISSING
+
+    @staticmethod
+    def _load(stored: bytes) -> Optional[Tenant]:
+        if stored == _MISSING:
+            return None
+        data = orjson.loads(stored)
+        return Tenant(
+            uid=uuid.UUID(data["uid"]),
+            domain=data["domain"],
+            ownerUid=uuid.UUID(data["ownerUid"]) if data["ownerUid"] else None,
+            ownerIsAdmin=data["ownerIsAdmin"],
+        )
+
+    async def lookup(self, key: str) -> Optional[Tenant]:
+        async with async_session_factory() as session:
+            db_result = await session.exec(tenant_statement(key))
+            row = db_result.first()
+        if row is None:
+            return None
+        uid, domain, owner_uid, is_admin, is_superuser = row
+        return Tenant(uid, normalize_domain(str(domain)), owner_uid, bool(is_admin or is_superuser))
+
+    async def invalidate(self, domains: Iterable[str]) -> None:
+        keys = {normalize_domain(domain) for domain in domains}
+        keys.discard("")
+        if not keys:
+            return
+        for key in keys:
+            self._local.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+        await invalidate_cached(TENANT_KEY.format(key) for key in keys)
+
+
+tenant_resolver = TenantResolver()
+
+
+# Invalidation, also clears negative entries once a domain gets its first row. Changes to
+# the owner's admin flags are picked up when the entry expires.
+def _changed_domains(obj: object) -> Iterable[str]:
+    if not isinstance(obj, KnownDomains):
+        return ()
+    previous = inspect(obj).attrs.domain.history.deleted
+    return [str(domain) for domain in (obj.domain, *previous) if domain is not None]
+
+
+invalidate_after_commit("Domains", _changed_domains, tenant_resolver.invalidate)
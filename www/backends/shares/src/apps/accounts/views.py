@@ -7,7 +7,8 @@ from fastapi.responses import JSONResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.db.db import get_session
-from src.apps.accounts.schemas import Message, Token, UserCreateOrLoginSchema, Verification
+from src.apps.accounts.dependencies import optional_tenant_dependency
+from src.apps.accounts.schemas import Message, Token, UserCreateOrLoginSchema, Verification, token_serializer
 from src.apps.accounts.services import UserService
 from src.errors import InvalidCredentials, UserAlreadyExists, UserNotFound
 from src.config.settings import Config
@@ -24,9 +25,21 @@ user_service = UserService()
 auth_router = APIRouter()
 
 
-@auth_router.post("/signup", status_code=status.HTTP_201_CREATED, response_model=Verification, responses={status.HTTP_404_NOT_FOUND: {"model": Message}})
-async def register(permission: Optional[str], form_data: Annotated[UserCreateOrLoginSchema, Depends()], request: Request, db_dependency):
-    domain = request.headers.get("Domain") or "http://localhost:3000"
+@auth_router.post(
+    "/signup",
+    status_code=status.HTTP_201_CREATED,
+    response_model=Verification,
+    responses={status.HTTP_404_NOT_FOUND: {"model": Message}},
+)
+async def register(
+    permission: Optional[str],
+    form_data: Annotated[UserCreateOrLoginSchema, Depends()],
+    request: Request,
+    tenant: optional_tenant_dependency,
+    db_dependency,
+):
+    # Signing up is how a new domain gets its first row, so unknown domains are allowed here
+    domain = tenant.domain if tenant else request.headers.get("Domain") or "http://localhost:3000"
     ip = request.headers.get("Ip") or "127.0.0.1"
 
     try:
@@ -43,11 +56,17 @@ async def register(permission: Optional[str], form_data: Annotated[UserCreateOrL
         )
 
 @auth_router.post("/token", status_code=status.HTTP_200_OK, response_model=Token, responses={status.HTTP_404_NOT_FOUND: {"model": Message}})
-async def login(form_data: Annotated[UserCreateOrLoginSchema, Depends()], request: Request, db_dependency):
-    domain = request.headers.get("Domain") or "http://localhost:3000"
+async def login(
+    form_data: Annotated[UserCreateOrLoginSchema, Depends()],
+    request: Request,
+    tenant: optional_tenant_dependency,
+    db_dependency,
+):
+    domain = tenant.domain if tenant else request.headers.get("Domain") or "http://localhost:3000"
     ip = request.headers.get("Ip") or "127.0.0.1"
     try:
-        await user_service.authenticate_user(form_data, ip, domain, db_dependency)
+        token = await user_service.authenticate_user(form_data, ip, domain, db_dependency)
+        return token_serializer.response(token)
     except UserNotFound:
         raise JSONResponse(
             status_code=status.HTTP_404_NOT_FOUND,
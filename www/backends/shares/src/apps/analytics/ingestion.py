@@ -0,0 +1,348 @@
+"""
+Write-behind ingestion of page views.
+
+Requests only append events to a per-worker buffer and return. A background task writes
+the buffer with `COPY` (one round trip for thousands of rows) as soon as
+`ANALYTICS_BATCH_SIZE` events are waiting, and at least every `ANALYTICS_FLUSH_INTERVAL`
+seconds otherwise. The `Analytics` row of each (domain, pathname) is upserted once and
+its uid kept in memory, so steady traffic costs one COPY per flush. The same transaction
+adds the batch to the daily dwell time and button rollup tables. Written events are then
+added to the live counters of `src.apps.analytics.rollups`.
+
+Events that fail to be written stay buffered and are retried on the next flush, up to
+`ANALYTICS_MAX_FLUSH_ATTEMPTS` times in a row. A batch Postgres refuses for its data would
+fail the same way forever, so it is split in halves until the bad events are alone, and
+those are dropped. Dropped events are counted in `analytics_events_dropped`. Once
+`ANALYTICS_MAX_PENDING` events are waiting new ones are refused with `AnalyticsBacklogFull`
+instead of growing the worker's memory without bound. Buffered events are lost if a worker
+is killed, which is acceptable for analytics.
+"""
+import asyncio
+import time
+import uuid
+import zlib
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import asyncpg
+import orjson
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.apps.analytics.rollups import analytics_rollups
+from src.config.settings import Config
+from src.db.db import async_engine
+from src.db.models import Analytics, PageButtonDailyRollup, PageDwellDailyRollup, PageView
+from src.errors import AnalyticsBacklogFull, EventBatchTooLarge, InvalidEventBatch
+from src.utils.logger import LOGGER
+from src.utils.metrics import METRICS
+
+PAGE_VIEW_COLUMNS = ("uid", "ip", "buttonsClicked", "timeSpentInSeconds", "date", "analyticsUid")
+# Rows per COPY when a backlog is drained
+COPY_CHUNK_SIZE = 10000
+ANALYTICS_UIDS_MAX_SIZE = 10000
+MAX_NAME_LENGTH = 2048
+# zlib window bits accepting a gzip header
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# Refusals caused by the rows themselves, a retry would fail the same way. COPY goes through
+# the asyncpg connection, so its errors are not wrapped by SQLAlchemy.
+DATA_ERRORS = (DataError, IntegrityError, asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+class PageViewEvent(NamedTuple):
+    domainUid: uuid.UUID
+    pathname: str
+    ip: str
+    buttonsClicked: List[str]
+    timeSpentInSeconds: int
+    date: date
+
+
+class PageViewBuffer:
+    def __init__(self):
+        self._pending: List[PageViewEvent] = []
+        self._analytics_uids: Dict[Tuple[uuid.UUID, str], uuid.UUID] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Failed flushes in a row of the batch at the front
+        self._failed_attempts = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, events: List[PageViewEvent]) -> int:
+        """Buffers the events, all or none. Returns how many were accepted."""
+        if len(self._pending) + len(events) > Config.ANALYTICS_MAX_PENDING:
+            raise AnalyticsBacklogFull()
+        self._pending.extend(events)
+        if len(self._pending) >= Config.ANALYTICS_BATCH_SIZE:
+            self._wakeup.set()
+        return len(events)
+
+    async def flush(self) -> int:
+        """Writes everything buffered so far. Returns the number of rows written."""
+        written = 0
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:COPY_CHUNK_SIZE]
+                del self._pending[:COPY_CHUNK_SIZE]
+                started = time.perf_counter()
+                stored: List[PageViewEvent] = []
+                dropped: List[PageViewEvent] = []
+                failure = None
+                try:
+                    await self._write_isolating(batch, stored, dropped)
+                except asyncio.CancelledError:
+                    self._pending[:0] = self._unfinished(batch, stored, dropped)
+                    raise
+                except Exception as e:
+                    failure = e
+
+                if stored:
+                    METRICS.observe("analytics_flush_seconds", (), time.perf_counter() - started)
+                    written += len(stored)
+                    try:
+                        await analytics_rollups.record(stored)
+                    except Exception as e:
+                        # The rows are stored, only the live counters miss them
+                        LOGGER.warning(f"Unable to update the analytics rollups: {e!r}")
+
+                if failure is not None:
+                    unfinished = self._unfinished(batch, stored, dropped)
+                    self._failed_attempts += 1
+                    if self._failed_attempts < Config.ANALYTICS_MAX_FLUSH_ATTEMPTS:
+                        # Back in front so the order is kept, retried on the next flush
+                        self._pending[:0] = unfinished
+                        LOGGER.warning(
+                            f"Unable to write {len(unfinished)} page views, {len(self._pending)} pending: {failure!r}"
+                        )
+                        break
+                    self._drop(unfinished, failure)
+                self._failed_attempts = 0
+        METRICS.set_gauge("analytics_events_pending", len(self._pending))
+        return written
+
+    async def _write_isolating(
+        self, batch: List[PageViewEvent], stored: List[PageViewEvent], dropped: List[PageViewEvent]
+    ) -> None:
+        """
+        Writes the batch. When Postgres refuses it for its data, writes each half on its own,
+        recursively, and drops the events refused alone. Collects what was stored and dropped.
+        """
+        try:
+            await self._write(batch)
+        except DATA_ERRORS as e:
+            if len(batch) == 1:
+                self._drop(batch, e)
+                dropped.extend(batch)
+                return
+            middle = len(batch) // 2
+            await self._write_isolating(batch[:middle], stored, dropped)
+            await self._write_isolating(batch[middle:], stored, dropped)
+        else:
+            stored.extend(batch)
+
+    @staticmethod
+    def _unfinished(
+        batch: List[PageViewEvent], stored: List[PageViewEvent], dropped: List[PageViewEvent]
+    ) -> List[PageViewEvent]:
+        # By identity, identical events can be sent twice
+        done = {id(event) for event in stored} | {id(event) for event in dropped}
+        return [event for event in batch if id(event) not in done]
+
+    @staticmethod
+    def _drop(events: List[PageViewEvent], error: Exception) -> None:
+        METRICS.inc_gauge("analytics_events_dropped", len(events))
+        LOGGER.error(f"Dropped {len(events)} page views that cannot be written: {error!r}")
+
+    async def _write(self, batch: List[PageViewEvent]) -> None:
+        async with async_engine.connect() as connection:
+            async with connection.begin():
+                analytics_uids = await self._resolve_analytics(
+                    connection, {(event.domainUid, event.pathname) for event in batch}
+                )
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_records_to_table(
+                    PageView.__tablename__,
+                    columns=PAGE_VIEW_COLUMNS,
+                    records=[
+                        (
+                            uuid.uuid4(),
+                            event.ip,
+                            event.buttonsClicked,
+                            event.timeSpentInSeconds,
+                            event.date,
+                            analytics_uids[(event.domainUid, event.pathname)],
+                        )
+                        for event in batch
+                    ],
+                )
+                await self._update_daily_rollups(connection, batch)
+        # Only uids of committed rows are remembered, a rolled back upsert created nothing
+        self._remember_analytics(analytics_uids)
+
+    async def _update_daily_rollups(self, connection: AsyncConnection, batch: List[PageViewEvent]) -> None:
+        """
+        Adds the batch to the dwell time and button rollups, in the transaction of its COPY so
+        the rollups always match `page_views`. Rows are upserted in key order so concurrent
+        flushes from several workers cannot deadlock.
+        """
+        dwell: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+        clicks: Counter = Counter()
+        for event in batch:
+            key = (event.domainUid, event.pathname, event.date)
+            dwell[key][0] += 1
+            dwell[key][1] += event.timeSpentInSeconds
+            clicks.update((*key, button) for button in event.buttonsClicked)
+
+        table = PageDwellDailyRollup.__table__
+        statement = pg_insert(table).values([
+            {"domainUid": domain_uid, "pathname": pathname, "day": day, "views": views, "totalSeconds": seconds}
+            for (domain_uid, pathname, day), (views, seconds) in sorted(dwell.items())
+        ])
+        await connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.domainUid, table.c.pathname, table.c.day],
+            set_={
+                "views": table.c.views + statement.excluded.views,
+                "totalSeconds": table.c.totalSeconds + statement.excluded.totalSeconds,
+            },
+        ))
+
+        if clicks:
+            table = PageButtonDailyRollup.__table__
+            statement = pg_insert(table).values([
+                {"domainUid": domain_uid, "pathname": pathname, "day": day, "button": button, "clicks": count}
+                for (domain_uid, pathname, day, button), count in sorted(clicks.items())
+            ])
+            await connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.domainUid, table.c.pathname, table.c.day, table.c.button],
+                set_={"clicks": table.c.clicks + statement.excluded.clicks},
+            ))
+
+    async def _resolve_analytics(
+        self, connection: AsyncConnection, keys: Set[Tuple[uuid.UUID, str]]
+    ) -> Dict[Tuple[uuid.UUID, str], uuid.UUID]:
+        """Analytics uid of every (domain, pathname), upserting the unknown ones in one statement."""
+        resolved = {key: self._analytics_uids[key] for key in keys if key in self._analytics_uids}
+        # Sorted so concurrent upserts from several workers lock the rows in the same order
+        missing = sorted(key for key in keys if key not in resolved)
+        if missing:
+            table = Analytics.__table__
+            statement = pg_insert(table).values([
+                {"uid": uuid.uuid4(), "domainUid": domain_uid, "pathname": pathname, "createdAt": datetime.utcnow()}
+                for domain_uid, pathname in missing
+            ])
+            # The no-op update makes RETURNING include the rows that already existed
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.domainUid, table.c.pathname],
+                set_={"pathname": statement.excluded.pathname},
+            ).returning(table.c.uid, table.c.domainUid, table.c.pathname)
+            for uid, domain_uid, pathname in await connection.execute(statement):
+                resolved[(domain_uid, pathname)] = uid
+        return resolved
+
+    def _remember_analytics(self, analytics_uids: Dict[Tuple[uuid.UUID, str], uuid.UUID]) -> None:
+        if len(self._analytics_uids) + len(analytics_uids) > ANALYTICS_UIDS_MAX_SIZE:
+            self._analytics_uids.clear()
+        self._analytics_uids.update(analytics_uids)
+
+    async def _flush_forever(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), Config.ANALYTICS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._stopping = False
+            self._flusher = asyncio.create_task(self._flush_forever())
+
+    async def stop(self) -> None:
+        """Lets a flush in progress finish, then writes what is left."""
+        if self._flusher is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+
+def page_view_events(domain_uid: uuid.UUID, ip: str, rows: Iterable[Tuple[str, List[str], int]]) -> List[PageViewEvent]:
+    """Turns validated (pathname, buttonsClicked, timeSpentInSeconds) rows into buffered events."""
+    today = datetime.utcnow().date()
+    return [PageViewEvent(domain_uid, pathname, ip, buttons, seconds, today) for pathname, buttons, seconds in rows]
+
+
+def read_event_batch(body: bytes, encoding: Optional[str]) -> List[Tuple[str, List[str], int]]:
+    """
+    Decodes a columnar event batch, gzip compressed when `encoding` says so.
+
+    Pathnames and button names are sent once in `paths` and `buttons`, events refer to them
+    by index. Event `i` is made of `path[i]`, `seconds[i]` and `clicks[i]`:
+
+        {"paths": ["/", "/pricing"], "buttons": ["signup", "faq"],
+         "path": [0, 1, 1], "seconds": [12, 40, 3], "clicks": [[], [0, 1], [0]]}
+
+    The whole batch is rejected if any column is malformed or any event is out of the bounds
+    `PageViewEventCreate` enforces on single events.
+    """
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=GZIP_WBITS)
+        try:
+            body = decompressor.decompress(body, Config.ANALYTICS_MAX_BATCH_BYTES)
+        except zlib.error:
+            raise InvalidEventBatch()
+        if decompressor.unconsumed_tail:
+            raise EventBatchTooLarge()
+    elif encoding not in (None, "identity"):
+        raise InvalidEventBatch()
+
+    try:
+        batch = orjson.loads(body)
+        paths, buttons = batch["paths"], batch["buttons"]
+        path, seconds, clicks = batch["path"], batch["seconds"], batch.get("clicks") or [[]] * len(batch["path"])
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        raise InvalidEventBatch()
+    if not all(isinstance(column, list) for column in (paths, buttons, path, seconds, clicks)):
+        raise InvalidEventBatch()
+    if len(path) > Config.ANALYTICS_MAX_EVENTS_PER_REQUEST:
+        raise EventBatchTooLarge()
+    if not len(path) == len(seconds) == len(clicks):
+        raise InvalidEventBatch()
+    # Postgres text cannot hold NUL, one would fail the whole COPY batch
+    if not all(
+        isinstance(name, str) and 0 < len(name) <= MAX_NAME_LENGTH and "\x00" not in name
+        for name in (*paths, *buttons)
+    ):
+        raise InvalidEventBatch()
+    # Absolute, so no page can take the site-wide rollup's pathname
+    if not all(pathname.startswith("/") for pathname in paths):
+        raise InvalidEventBatch()
+
+    rows = []
+    try:
+        for path_index, spent, clicked in zip(path, seconds, clicks):
+            if type(path_index) is not int or path_index < 0:
+                raise InvalidEventBatch()
+            if type(spent) is not int or not 0 <= spent <= Config.ANALYTICS_MAX_DWELL_SECONDS:
+                raise InvalidEventBatch()
+            if len(clicked) > Config.ANALYTICS_MAX_CLICKS_PER_EVENT:
+                raise InvalidEventBatch()
+            # Negative indexes would silently wrap around
+            if any(type(index) is not int or index < 0 for index in clicked):
+                raise InvalidEventBatch()
+            rows.append((paths[path_index], [buttons[index] for index in clicked], spent))
+    except (IndexError, TypeError):
+        raise InvalidEventBatch()
+    return rows
+
+
+page_view_buffer = PageViewBuffer()
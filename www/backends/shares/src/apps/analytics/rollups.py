@@ -0,0 +1,156 @@
+"""
+Live page view counters per (domain, pathname, day) in Redis.
+
+Every flushed batch of page views adds, in one pipelined round trip:
+
+- `views` hash: pathname -> views
+- one HyperLogLog of visitor IPs per pathname, and one for the whole site (about 12 KB each
+  whatever the number of visitors, counts within ~1%)
+- `top_pages` / `top_buttons` sorted sets, ranked with ZREVRANGE
+
+A dashboard reads a day in O(number of pathnames), never touching `page_views`. The
+`persist_analytics_rollups` task copies the counters into `page_view_daily_rollups` so days
+past `ANALYTICS_ROLLUP_TTL` are still served, from the table.
+"""
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Set
+
+from redis.asyncio import Redis
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config.settings import Config
+from src.db.models import PageViewDailyRollup
+from src.db.redis import redis_client
+
+DOMAINS_KEY = "analytics:domains:{day}"
+VIEWS_KEY = "analytics:views:{domain}:{day}"
+VISITORS_KEY = "analytics:visitors:{domain}:{day}:{pathname}"
+TOP_PAGES_KEY = "analytics:top_pages:{domain}:{day}"
+TOP_BUTTONS_KEY = "analytics:top_buttons:{domain}:{day}"
+# Pathname of the rollup row counting the whole site. Page pathnames are checked to start with
+# "/" when they are ingested, so no page can be counted in it.
+SITE_PATHNAME = "*"
+
+
+class AnalyticsRollups:
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    async def record(self, events: Iterable) -> None:
+        """Adds flushed `PageViewEvent`s to the counters of their day."""
+        views: Dict[tuple, Counter] = defaultdict(Counter)
+        buttons: Dict[tuple, Counter] = defaultdict(Counter)
+        visitors: Dict[tuple, Set[str]] = defaultdict(set)
+        for event in events:
+            key = (event.domainUid, event.date.isoformat())
+            views[key][event.pathname] += 1
+            buttons[key].update(event.buttonsClicked)
+            visitors[(*key, event.pathname)].add(event.ip)
+            visitors[(*key, SITE_PATHNAME)].add(event.ip)
+
+        ttl = Config.ANALYTICS_ROLLUP_TTL
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for (domain, day), counts in views.items():
+                pipe.sadd(DOMAINS_KEY.format(day=day), str(domain))
+                pipe.expire(DOMAINS_KEY.format(day=day), ttl)
+                views_key = VIEWS_KEY.format(domain=domain, day=day)
+                pages_key = TOP_PAGES_KEY.format(domain=domain, day=day)
+                for pathname, count in counts.items():
+                    pipe.hincrby(views_key, pathname, count)
+                    pipe.zincrby(pages_key, count, pathname)
+                pipe.expire(views_key, ttl)
+                pipe.expire(pages_key, ttl)
+            for (domain, day), counts in buttons.items():
+                if counts:
+                    buttons_key = TOP_BUTTONS_KEY.format(domain=domain, day=day)
+                    for button, count in counts.items():
+                        pipe.zincrby(buttons_key, count, button)
+                    pipe.expire(buttons_key, ttl)
+            for (domain, day, pathname), ips in visitors.items():
+                visitors_key = VISITORS_KEY.format(domain=domain, day=day, pathname=pathname)
+                pipe.pfadd(visitors_key, *ips)
+                pipe.expire(visitors_key, ttl)
+            await pipe.execute()
+
+    async def pages(self, domain_uid: uuid.UUID, day: date) -> List[dict]:
+        """Views and unique visitors of every page of the day, site total under `SITE_PATHNAME`."""
+        views = await self.redis.hgetall(VIEWS_KEY.format(domain=domain_uid, day=day.isoformat()))
+        pathnames = [pathname.decode() for pathname in views]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for pathname in (*pathnames, SITE_PATHNAME):
+                pipe.pfcount(VISITORS_KEY.format(domain=domain_uid, day=day.isoformat(), pathname=pathname))
+            unique = await pipe.execute()
+        pages = [
+            {"pathname": pathname, "views": int(views[pathname.encode()]), "uniqueVisitors": count}
+            for pathname, count in zip(pathnames, unique)
+        ]
+        if pages:
+            pages.append({
+                "pathname": SITE_PATHNAME,
+                "views": sum(page["views"] for page in pages),
+                "uniqueVisitors": unique[-1],
+            })
+        return pages
+
+    async def top(self, domain_uid: uuid.UUID, day: date, limit: int) -> Dict[str, List[dict]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrange(TOP_PAGES_KEY.format(domain=domain_uid, day=day.isoformat()), 0, limit - 1, withscores=True)
+            pipe.zrevrange(TOP_BUTTONS_KEY.format(domain=domain_uid, day=day.isoformat()), 0, limit - 1, withscores=True)
+            pages, buttons = await pipe.execute()
+        return {
+            "topPages": [{"name": name.decode(), "count": int(score)} for name, score in pages],
+            "topButtons": [{"name": name.decode(), "count": int(score)} for name, score in buttons],
+        }
+
+    async def dashboard(self, domain_uid: uuid.UUID, day: date, session: AsyncSession, limit: int = 10) -> dict:
+        """The counters of a day, from Redis while they live and from the rollup table after."""
+        pages = await self.pages(domain_uid, day)
+        if pages:
+            return {"day": day, "pages": pages, **await self.top(domain_uid, day, limit)}
+
+        statement = select(PageViewDailyRollup).where(
+            PageViewDailyRollup.domainUid == domain_uid, PageViewDailyRollup.day == day
+        )
+        rollups = (await session.exec(statement)).all()
+        pages = [{"pathname": row.pathname, "views": row.views, "uniqueVisitors": row.uniqueVisitors} for row in rollups]
+        top_pages = sorted((page for page in pages if page["pathname"] != SITE_PATHNAME), key=lambda page: -page["views"])
+        return {
+            "day": day,
+            "pages": pages,
+            "topPages": [{"name": page["pathname"], "count": page["views"]} for page in top_pages[:limit]],
+            # Button counts are only kept for the live days
+            "topButtons": [],
+        }
+
+    async def persist(self, engine: AsyncEngine, day: date) -> int:
+        """Upserts the counters of `day` into the rollup table. Returns the number of rows written."""
+        domains = await self.redis.smembers(DOMAINS_KEY.format(day=day.isoformat()))
+        rows = []
+        for domain in domains:
+            domain_uid = uuid.UUID(domain.decode())
+            for page in await self.pages(domain_uid, day):
+                rows.append({**page, "domainUid": domain_uid, "day": day, "updatedAt": datetime.utcnow()})
+        if not rows:
+            return 0
+
+        statement = pg_insert(PageViewDailyRollup.__table__).values(rows)
+        # The Redis counters are the day's running totals, so the latest values replace the stored ones
+        statement = statement.on_conflict_do_update(
+            index_elements=["domainUid", "pathname", "day"],
+            set_={
+                "views": statement.excluded.views,
+                "uniqueVisitors": statement.excluded.uniqueVisitors,
+                "updatedAt": statement.excluded.updatedAt,
+            },
+        )
+        async with engine.begin() as connection:
+            await connection.execute(statement)
+        return len(rows)
+
+
+analytics_rollups = AnalyticsRollups(redis_client)
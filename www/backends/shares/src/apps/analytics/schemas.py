@@ -1,9 +1,17 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List, Optional
+from typing import Annotated, List, Optional
 import uuid
 from fastapi import UploadFile
-from pydantic import BaseModel, IPvAnyAddress
+from pydantic import BaseModel, Field, IPvAnyAddress
+
+from src.config.settings import Config
+from src.utils.responses import Serializer
+
+# Postgres text cannot hold NUL, one would fail the whole COPY batch
+EventName = Annotated[str, Field(min_length=1, max_length=2048, pattern=r"^[^\x00]*$")]
+# Absolute, so no page can take the site-wide rollup's pathname
+PagePathname = Annotated[str, Field(min_length=1, max_length=2048, pattern=r"^/[^\x00]*$")]
 
 
 class CreateOrUpdateFAQ(BaseModel):
@@ -70,3 +78,65 @@ class CreateOrUpdatePageView(BaseModel):
     ip: Optional[IPvAnyAddress]
     buttonsClicked: Optional[List[str]]
     timeSpendInSeconds: Optional[int]
+
+
+class PageViewEventCreate(BaseModel):
+    pathname: PagePathname
+    buttonsClicked: List[EventName] = Field(default=[], max_length=Config.ANALYTICS_MAX_CLICKS_PER_EVENT)
+    timeSpentInSeconds: int = Field(default=0, ge=0, le=Config.ANALYTICS_MAX_DWELL_SECONDS)
+
+
+class PageViewEventsAccepted(BaseModel):
+    accepted: int
+
+
+class PageStats(BaseModel):
+    pathname: str
+    views: int
+    uniqueVisitors: int
+
+
+class RankedItem(BaseModel):
+    name: str
+    count: int
+
+
+class AnalyticsDashboard(BaseModel):
+    day: date
+    pages: List[PageStats]
+    topPages: List[RankedItem]
+    topButtons: List[RankedItem]
+
+
+class ButtonClicks(BaseModel):
+    button: str
+    clicks: int
+
+
+class ButtonReport(BaseModel):
+    pathname: str
+    since: date
+    until: date
+    buttons: List[ButtonClicks]
+
+
+class PageDwell(BaseModel):
+    pathname: str
+    views: int
+    averageSeconds: float
+
+
+class DwellReport(BaseModel):
+    since: date
+    until: date
+    pages: List[PageDwell]
+
+
+# Precompiled JSON serializers, see src.utils.responses
+faq_read_serializer = Serializer(ReadFAQ)
+testimonial_read_serializer = Serializer(ReadTestimonial)
+analytics_read_serializer = Serializer(AnalyticsRead)
+analytics_dashboard_serializer = Serializer(AnalyticsDashboard)
+button_report_serializer = Serializer(ButtonReport)
+dwell_report_serializer = Serializer(DwellReport)
+page_view_read_serializer = Serializer(PageViewRead)
@@ -0,0 +1,173 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy import func, inspect
+from sqlalchemy.orm import noload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.apps.analytics.schemas import faq_read_serializer, testimonial_read_serializer
+from src.apps.transactions.schemas import public_plans_read_serializer
+from src.config.settings import Config
+from src.db.db import async_session_factory
+from src.db.models import FAQ, PageButtonDailyRollup, PageDwellDailyRollup, Plans, Testimonial
+from src.db.redis import cache_generation, invalidate_cached, redis_client, store_cached
+from src.utils.caching import SingleFlight, invalidate_after_commit
+
+PUBLIC_CONTENT_MODELS = (FAQ, Testimonial, Plans)
+PUBLIC_CONTENT_KEY = "public_content:{}"
+PUBLIC_CONTENT_EXPIRY = 86400
+LOCAL_CACHE_MAX_SIZE = 1000
+
+
+class PublicContentBundle(NamedTuple):
+    etag: str
+    body: bytes
+
+
+class PublicContentService:
+    """
+    Serves the FAQs, testimonials and plans of a tenant as one pre-serialized JSON bundle.
+
+    The bundle is built once, stored in Redis with its strong ETag and copied into each
+    worker. A worker serves its copy for `PUBLIC_CONTENT_LOCAL_TTL` seconds, then checks the
+    ETag in Redis (one small round trip) and only goes back to the database once the bundle
+    was invalidated by a change to any of the rows.
+    """
+
+    def __init__(self):
+        self._local: "OrderedDict[uuid.UUID, tuple]" = OrderedDict()
+        self._fills = SingleFlight()
+        # Bumped by every invalidation in this worker, a fill that saw another value does not keep its bundle
+        self._generations: Dict[uuid.UUID, int] = {}
+
+    async def get_bundle(self, domain_uid: uuid.UUID) -> PublicContentBundle:
+        cached = self._local.get(domain_uid)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < Config.PUBLIC_CONTENT_LOCAL_TTL:
+            return cached[0]
+
+        key = PUBLIC_CONTENT_KEY.format(domain_uid)
+        if cached is not None:
+            etag = await redis_client.hget(key, "etag")
+            if etag is not None and etag.decode() == cached[0].etag:
+                self._remember(domain_uid, cached[0])
+                return cached[0]
+
+        async with self._fills.lock(domain_uid):
+            local_generation = self._generations.get(domain_uid, 0)
+            stored = await redis_client.hgetall(key)
+            if stored:
+                bundle = PublicContentBundle(stored[b"etag"].decode(), stored[b"body"])
+                cacheable = True
+            else:
+                generation = await cache_generation(key)
+                bundle = await self.build_bundle(domain_uid)
+                # Invalidated while building: the bundle may predate the change, serve it without caching it
+                cacheable = await store_cached(
+                    key, generation, {"etag": bundle.etag, "body": bundle.body}, PUBLIC_CONTENT_EXPIRY
+                )
+        if cacheable and self._generations.get(domain_uid, 0) == local_generation:
+            self._remember(domain_uid, bundle)
+        return bundle
+
+    def _remember(self, domain_uid: uuid.UUID, bundle: PublicContentBundle) -> None:
+        self._local.pop(domain_uid, None)
+        self._local[domain_uid] = (bundle, time.monotonic())
+        if len(self._local) > LOCAL_CACHE_MAX_SIZE:
+            self._local.popitem(last=False)
+
+    async def build_bundle(self, domain_uid: uuid.UUID) -> PublicContentBundle:
+        async with async_session_factory() as session:
+            faqs = await session.exec(
+                select(FAQ).where(FAQ.domainUid == domain_uid).order_by(FAQ.createdAt)
+            )
+            testimonials = await session.exec(
+                select(Testimonial).where(Testimonial.domainUid == domain_uid).order_by(Testimonial.createdAt.desc())
+            )
+            plans = await session.exec(
+                select(Plans)
+                .where(Plans.domainUid == domain_uid)
+                .options(noload(Plans.subscriptions))
+                .order_by(Plans.amount)
+            )
+            # Each section is encoded once by its precompiled serializer and spliced together
+            body = b"".join((
+                b'{"faqs":', faq_read_serializer.dump_many(faqs.all()),
+                b',"testimonials":', testimonial_read_serializer.dump_many(testimonials.all()),
+                b',"plans":', public_plans_read_serializer.dump_many(plans.all()),
+                b"}",
+            ))
+        return PublicContentBundle(f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+
+    async def invalidate(self, domain_uids: Iterable[uuid.UUID]) -> None:
+        domain_uids = [uid for uid in domain_uids if uid is not None]
+        if not domain_uids:
+            return
+        for domain_uid in domain_uids:
+            self._local.pop(domain_uid, None)
+            self._generations[domain_uid] = self._generations.get(domain_uid, 0) + 1
+        await invalidate_cached(PUBLIC_CONTENT_KEY.format(uid) for uid in domain_uids)
+
+    @staticmethod
+    def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+        if not if_none_match:
+            return False
+        return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+public_content_service = PublicContentService()
+
+
+class AnalyticsReportService:
+    """Reports over a date range, read from the daily rollups rather than `page_views`."""
+
+    async def button_clicks(self, domain_uid: uuid.UUID, pathname: str, since: date, until: date, session: AsyncSession):
+        clicks = func.sum(PageButtonDailyRollup.clicks).label("clicks")
+        statement = (
+            select(PageButtonDailyRollup.button, clicks)
+            .where(PageButtonDailyRollup.domainUid == domain_uid)
+            .where(PageButtonDailyRollup.pathname == pathname)
+            .where(PageButtonDailyRollup.day.between(since, until))
+            .group_by(PageButtonDailyRollup.button)
+            .order_by(clicks.desc())
+        )
+        db_result = await session.exec(statement)
+        return [{"button": button, "clicks": count} for button, count in db_result.all()]
+
+    async def dwell_times(self, domain_uid: uuid.UUID, since: date, until: date, session: AsyncSession):
+        """Views and average time spent per page, both from the exact dwell rollup."""
+        views = func.sum(PageDwellDailyRollup.views).label("views")
+        statement = (
+            select(PageDwellDailyRollup.pathname, views, func.sum(PageDwellDailyRollup.totalSeconds))
+            .where(PageDwellDailyRollup.domainUid == domain_uid)
+            .where(PageDwellDailyRollup.day.between(since, until))
+            .group_by(PageDwellDailyRollup.pathname)
+            .order_by(views.desc())
+        )
+        db_result = await session.exec(statement)
+        return [
+            {"pathname": pathname, "views": count, "averageSeconds": round(seconds / count, 2) if count else 0.0}
+            for pathname, count, seconds in db_result.all()
+        ]
+
+
+analytics_report_service = AnalyticsReportService()
+
+
+# Invalidation. The bundles of the tenants of changed rows are dropped once the transaction
+# commits. Bulk UPDATE/DELETE statements bypass the ORM and must call
+# `public_content_service.invalidate` themselves.
+def _public_content_domains(obj: object) -> Iterable[uuid.UUID]:
+    if not isinstance(obj, PUBLIC_CONTENT_MODELS):
+        return ()
+    # Moving a row to another tenant changes both bundles
+    previous = inspect(obj).attrs.domainUid.history.deleted
+    return [uid for uid in (obj.domainUid, *previous) if uid is not None]
+
+
+invalidate_after_commit("Public content", _public_content_domains, public_content_service.invalidate)
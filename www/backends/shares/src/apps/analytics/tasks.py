@@ -0,0 +1,30 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import redis.asyncio as aioredis
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.apps.analytics.rollups import AnalyticsRollups
+from src.celery_tasks import celery_app
+from src.config.settings import Config, broker_url
+
+
+async def _persist_analytics_rollups():
+    # Each task run gets its own event loop, pooled connections cannot outlive it
+    engine = create_async_engine(Config.DATABASE_URL, poolclass=NullPool)
+    redis = aioredis.Redis.from_url(broker_url)
+    try:
+        rollups = AnalyticsRollups(redis)
+        today = datetime.utcnow().date()
+        # Yesterday again so the views counted just before midnight are not left out
+        return {day.isoformat(): await rollups.persist(engine, day) for day in (today - timedelta(days=1), today)}
+    finally:
+        await redis.aclose()
+        await engine.dispose()
+
+
+@celery_app.task(name="analytics.persist_rollups")
+def persist_analytics_rollups():
+    """Copies the live page view counters into page_view_daily_rollups."""
+    return asyncio.run(_persist_analytics_rollups())
@@ -0,0 +1,131 @@
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Annotated, List, Optional, Tuple
+
+from fastapi import APIRouter, Body, Query, Request, Response, status
+
+from src.apps.accounts.dependencies import read_db_dependency, read_tenant_admin_dependency, tenant_dependency
+from src.apps.analytics.ingestion import page_view_buffer, page_view_events, read_event_batch
+from src.apps.analytics.rollups import analytics_rollups
+from src.apps.analytics.schemas import (
+    AnalyticsDashboard,
+    ButtonReport,
+    DwellReport,
+    PageViewEventCreate,
+    PageViewEventsAccepted,
+    analytics_dashboard_serializer,
+    button_report_serializer,
+    dwell_report_serializer,
+)
+from src.apps.analytics.services import analytics_report_service, public_content_service
+from src.config.settings import Config
+from src.errors import EventBatchTooLarge
+from src.utils.network import client_ip
+from src.utils.responses import FastJSONResponse
+
+analytics_router = APIRouter()
+
+REPORT_DEFAULT_DAYS = 7
+
+
+@analytics_router.get("/content", status_code=status.HTTP_200_OK)
+async def tenant_public_content(tenant: tenant_dependency, request: Request):
+    """Public content of the tenant named by the `Domain` header."""
+    return await public_content(tenant.uid, request)
+
+
+@analytics_router.get("/content/{domain_uid}", status_code=status.HTTP_200_OK)
+async def public_content(domain_uid: uuid.UUID, request: Request):
+    """
+    FAQs, testimonials and plans of a tenant in one cached bundle.
+
+    Send the `ETag` back in `If-None-Match` to get an empty `304 Not Modified` while nothing changed.
+    """
+    bundle = await public_content_service.get_bundle(domain_uid)
+    headers = {"ETag": bundle.etag, "Cache-Control": "public, no-cache"}
+    if public_content_service.etag_matches(request.headers.get("If-None-Match"), bundle.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FastJSONResponse(bundle.body, headers=headers)
+
+
+@analytics_router.post("/events", status_code=status.HTTP_202_ACCEPTED, response_model=PageViewEventsAccepted)
+async def record_page_views(
+    tenant: tenant_dependency,
+    request: Request,
+    events: Annotated[List[PageViewEventCreate], Body(max_length=Config.ANALYTICS_MAX_EVENTS_PER_REQUEST)],
+):
+    """
+    Records a batch of page views of the tenant named by the `Domain` header.
+
+    Events are stored in the background, `503` means the backlog is full and the batch should be retried later.
+    """
+    rows = ((event.pathname, event.buttonsClicked, event.timeSpentInSeconds) for event in events)
+    return {"accepted": page_view_buffer.enqueue(page_view_events(tenant.uid, client_ip(request), rows))}
+
+
+@analytics_router.post("/events/batch", status_code=status.HTTP_202_ACCEPTED, response_model=PageViewEventsAccepted)
+async def record_page_view_batch(tenant: tenant_dependency, request: Request):
+    """
+    Records page views and clicks sent in the compact columnar form, optionally with `Content-Encoding: gzip`.
+
+    ```
+    {"paths": ["/", "/pricing"], "buttons": ["signup", "faq"],
+     "path": [0, 1, 1], "seconds": [12, 40, 3], "clicks": [[], [0, 1], [0]]}
+    ```
+
+    Event `i` is the page `paths[path[i]]` viewed for `seconds[i]` seconds, with the buttons listed by index in `clicks[i]`.
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > Config.ANALYTICS_MAX_BATCH_BYTES:
+            raise EventBatchTooLarge()
+    rows = read_event_batch(bytes(body), request.headers.get("Content-Encoding"))
+    return {"accepted": page_view_buffer.enqueue(page_view_events(tenant.uid, client_ip(request), rows))}
+
+
+@analytics_router.get("/dashboard", status_code=status.HTTP_200_OK, response_model=AnalyticsDashboard)
+async def dashboard(
+    tenant: tenant_dependency,
+    admin: read_tenant_admin_dependency,
+    session: read_db_dependency,
+    day: Optional[date] = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 10,
+):
+    """Views, unique visitors, top pages and top buttons of a day (UTC, default today) for the tenant."""
+    summary = await analytics_rollups.dashboard(tenant.uid, day or datetime.utcnow().date(), session, limit)
+    return analytics_dashboard_serializer.response(summary)
+
+
+@analytics_router.get("/reports/buttons", status_code=status.HTTP_200_OK, response_model=ButtonReport)
+async def button_report(
+    tenant: tenant_dependency,
+    admin: read_tenant_admin_dependency,
+    session: read_db_dependency,
+    pathname: str,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+):
+    """Clicks per button on `pathname` between `since` and `until` (inclusive, default the last 7 days)."""
+    since, until = report_range(since, until)
+    buttons = await analytics_report_service.button_clicks(tenant.uid, pathname, since, until, session)
+    return button_report_serializer.response({"pathname": pathname, "since": since, "until": until, "buttons": buttons})
+
+
+@analytics_router.get("/reports/dwell", status_code=status.HTTP_200_OK, response_model=DwellReport)
+async def dwell_report(
+    tenant: tenant_dependency,
+    admin: read_tenant_admin_dependency,
+    session: read_db_dependency,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+):
+    """Views and average time spent per page between `since` and `until` (inclusive, default the last 7 days)."""
+    since, until = report_range(since, until)
+    pages = await analytics_report_service.dwell_times(tenant.uid, since, until, session)
+    return dwell_report_serializer.response({"since": since, "until": until, "pages": pages})
+
+
+def report_range(since: Optional[date], until: Optional[date]) -> Tuple[date, date]:
+    until = until or datetime.utcnow().date()
+    return since or until - timedelta(days=REPORT_DEFAULT_DAYS - 1), until
@@ -0,0 +1,30 @@
+import secrets
+from typing import Annotated, Optional
+
+from fastapi import Depends, Header, status
+from fastapi.exceptions import HTTPException
+
+from src.config.settings import Config
+
+
+async def verify_metrics_token(authorization: Annotated[Optional[str], Header()] = None) -> None:
+    """
+    Scrapers authenticate with `Authorization: Bearer <METRICS_TOKEN>`. Without a token the
+    endpoints are only open in the local environment, everywhere else they refuse every request.
+    """
+    if not Config.METRICS_TOKEN:
+        if Config.ENVIRONMENT == "local":
+            return
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"message": "Metrics are disabled until METRICS_TOKEN is set", "error_code": "invalid_metrics_token"},
+        )
+    expected = f"Bearer {Config.METRICS_TOKEN}"
+    if authorization is None or not secrets.compare_digest(authorization, expected):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"message": "Invalid metrics token", "error_code": "invalid_metrics_token"},
+        )
+
+
+metrics_dependency = Depends(verify_metrics_token)
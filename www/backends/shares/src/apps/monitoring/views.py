@@ -0,0 +1,119 @@
+import asyncio
+import os
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from src.apps.accounts.dependencies import admin_user_dependency
+from src.apps.monitoring.dependencies import metrics_dependency
+from src.db.db import async_engine, pool_status, replica_router
+from src.utils.memory import MEMORY, current_rss
+from src.utils.profiling import get_profile_path, list_profiles
+from src.utils.metrics import METRICS, render_prometheus, summarize
+
+monitoring_router = APIRouter()
+
+
+@monitoring_router.get(
+    "/metrics", status_code=status.HTTP_200_OK, response_class=PlainTextResponse, dependencies=[metrics_dependency]
+)
+async def metrics():
+    """Prometheus scrape endpoint, merged across every worker."""
+    histograms, gauges = await METRICS.collect()
+    return PlainTextResponse(
+        render_prometheus(histograms, gauges),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@monitoring_router.get("/latency", status_code=status.HTTP_200_OK, dependencies=[metrics_dependency])
+async def latency():
+    """p50, p95 and p99 per route, method and status, slowest first."""
+    histograms, gauges = await METRICS.collect()
+    return {
+        "routes": summarize(histograms, "http_request_duration_seconds"),
+        "pool_wait": summarize(histograms, "db_pool_wait_seconds"),
+        "gauges": gauges,
+    }
+
+
+@monitoring_router.get("/pool", status_code=status.HTTP_200_OK, dependencies=[metrics_dependency])
+async def pool():
+    """Connection pools and replica lag as seen by the worker that served the call."""
+    return {"pid": os.getpid(), "primary": pool_status(async_engine), "replicas": replica_router.status()}
+
+
+@monitoring_router.get("/profiles", status_code=status.HTTP_200_OK)
+async def profiles(admin: admin_user_dependency):
+    """Profiles saved by this worker's host, newest first."""
+    return {"profiles": list_profiles()}
+
+
+@monitoring_router.get("/profiles/{name}", status_code=status.HTTP_200_OK, response_class=FileResponse)
+async def profile(name: str, admin: admin_user_dependency):
+    """Downloads a speedscope profile, open it at https://www.speedscope.app."""
+    path = get_profile_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"message": "Profile not found", "error_code": "profile_not_found"},
+        )
+    return FileResponse(path, media_type="application/json", filename=name)
+
+
+# Memory, every answer is for the worker that served the call (see "pid")
+@monitoring_router.get("/memory", status_code=status.HTTP_200_OK)
+async def memory_overview(admin: admin_user_dependency, limit: int = 50):
+    """Per-route RSS deltas and identity map peaks, plus the largest open sessions."""
+    return {
+        "pid": os.getpid(),
+        "rss": current_rss(),
+        "routes": MEMORY.route_report(limit),
+        "sessions": MEMORY.session_report(),
+    }
+
+
+@monitoring_router.post("/memory/tracing", status_code=status.HTTP_200_OK)
+async def memory_tracing(admin: admin_user_dependency, enabled: bool = True, frames: int = 25):
+    """Starts or stops tracemalloc. Tracing slows allocations down, stop it when done."""
+    if enabled:
+        MEMORY.start_tracing(frames)
+    else:
+        MEMORY.stop_tracing()
+    return {"pid": os.getpid(), "tracing": enabled}
+
+
+@monitoring_router.post("/memory/snapshots", status_code=status.HTTP_201_CREATED)
+async def memory_snapshot(admin: admin_user_dependency, label: Optional[str] = None):
+    try:
+        snapshot = await asyncio.to_thread(MEMORY.take_snapshot, label)
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "error_code": "tracing_not_started"},
+        )
+    return {"pid": os.getpid(), **snapshot}
+
+
+@monitoring_router.get("/memory/snapshots", status_code=status.HTTP_200_OK)
+async def memory_snapshots(admin: admin_user_dependency):
+    return {"pid": os.getpid(), "snapshots": [MEMORY.describe_snapshot(i) for i in MEMORY.snapshots]}
+
+
+@monitoring_router.get("/memory/snapshots/{first}/diff/{second}", status_code=status.HTTP_200_OK)
+async def memory_snapshot_diff(
+    first: int,
+    second: int,
+    admin: admin_user_dependency,
+    key_type: Literal["lineno", "filename", "traceback"] = "lineno",
+    limit: int = 25,
+):
+    """Allocation sites that grew the most between two snapshots of this worker."""
+    if first not in MEMORY.snapshots or second not in MEMORY.snapshots:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"message": "Snapshot not found on this worker", "error_code": "snapshot_not_found"},
+        )
+    diff = await asyncio.to_thread(MEMORY.diff_snapshots, first, second, key_type, limit)
+    return {"pid": os.getpid(), "diff": diff}
@@ -0,0 +1,475 @@
+"""
+Price alerts: "notify me when AAPL crosses 200".
+
+An alert fires once, when the price crosses its threshold in its direction: an `Above`
+alert when the price rises from below the threshold to it or over, a `Below` alert when it
+falls to it or under. The direction follows from the price when the alert is created. An
+alert the price is already past when the engine loads it, or learns the first price of its
+symbol, fires at once: the price moved while nobody was watching.
+
+The alert engine runs as its own process (`python -m src.apps.portfolios.alerts`, the
+`alerts` entry of the Procfile) so every alert is evaluated once whatever the number of API
+workers. It keeps every pending alert in memory, per symbol and direction, as a sorted array
+of thresholds with the alert uids alongside. A tick from `previous` to `price` fires exactly
+the thresholds between the two, found with two binary searches and removed as one slice, so
+a tick costs O(log alerts of the symbol + alerts fired) and symbols without alerts cost a
+dict lookup. A million pending alerts take about 60 MB.
+
+Fired alerts are queued and claimed in batches every `PRICE_ALERTS_FLUSH_INTERVAL`: one
+`UPDATE ... WHERE "triggeredAt" IS NULL RETURNING` marks up to `PRICE_ALERTS_BATCH_SIZE`
+alerts triggered, then the claimed ones are queued, grouped by user, as one
+`portfolios.deliver_price_alerts` Celery task. The worker appends them to each user's inbox,
+a capped Redis list read and emptied by `GET /portfolios/alerts/notifications`. The claim
+makes notifications exactly once even when an alert is indexed twice or was deleted before
+it fired. A batch the broker refused is kept and queued again on the next flush.
+
+The API publishes created and deleted alerts on the `alert_changes` channel. The engine
+reloads every pending alert from the database on start and after losing Redis, so it never
+depends on having seen every change.
+"""
+import asyncio
+import signal
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from contextlib import suppress
+from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import orjson
+import redis.asyncio as aioredis
+from redis.asyncio import Redis
+from sqlalchemy import text
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.apps.portfolios.enums import PriceAlertDirection
+from src.apps.portfolios.schemas import PriceAlertCreate
+from src.apps.portfolios.ticks import QUOTES_KEY, TickBus
+from src.celery_tasks import celery_app
+from src.config.settings import Config, broker_url
+from src.db.db import async_engine
+from src.db.models import Portfolio, PriceAlert, User
+from src.db.redis import redis_client
+from src.errors import InvalidPriceAlert, PriceAlertNotFound, TooManyPriceAlerts
+from src.utils.logger import LOGGER
+from src.utils.metrics import METRICS
+
+ALERT_CHANGES_CHANNEL = "alert_changes"
+DELIVER_ALERTS_TASK = "portfolios.deliver_price_alerts"
+# Notifications a user has not read yet, newest first
+ALERT_INBOX_KEY = "price_alerts:inbox:{}"
+ALERT_INBOX_LIMIT = 100
+ALERT_INBOX_TTL = 30 * 24 * 60 * 60
+# Alerts listed per user, newest first
+ALERTS_LIST_LIMIT = 200
+LOAD_CHUNK_SIZE = 10000
+RECONNECT_MAX_DELAY = 30
+
+# Enum columns store the member names, ABOVE and BELOW
+PENDING_ALERTS_SQL = text(
+    'SELECT uid, "assetSymbol", threshold, direction FROM price_alerts WHERE "triggeredAt" IS NULL'
+)
+
+# Duplicated uids update once, deleted or already claimed alerts are left out
+CLAIM_SQL = text("""
+UPDATE price_alerts AS alert
+SET "triggeredAt" = now(), "triggeredPrice" = fired.price
+FROM unnest(CAST(:uids AS UUID[]), CAST(:prices AS FLOAT8[])) AS fired(uid, price)
+WHERE alert.uid = fired.uid AND alert."triggeredAt" IS NULL
+RETURNING alert.uid, alert."userUid", alert."assetSymbol", alert.direction, alert.threshold, fired.price,
+    alert."triggeredAt"
+""")
+
+
+def notification_batch(claimed: list) -> Dict[str, List[dict]]:
+    """Claimed alerts grouped by user uid, as queued for delivery."""
+    users: Dict[str, List[dict]] = defaultdict(list)
+    for uid, user_uid, symbol, direction, threshold, price, triggered_at in claimed:
+        users[str(user_uid)].append({
+            "uid": str(uid),
+            "assetSymbol": symbol,
+            "direction": PriceAlertDirection[direction].value,
+            "threshold": str(threshold),
+            "price": price,
+            "triggeredAt": triggered_at.isoformat(),
+        })
+    return users
+
+
+async def deliver_notifications(redis: Redis, users: Mapping[str, List[dict]]) -> int:
+    """Appends notifications to the inbox of their user. Returns the number delivered."""
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_uid, notifications in users.items():
+            key = ALERT_INBOX_KEY.format(user_uid)
+            pipe.lpush(key, *(orjson.dumps(notification) for notification in notifications))
+            pipe.ltrim(key, 0, ALERT_INBOX_LIMIT - 1)
+            pipe.expire(key, ALERT_INBOX_TTL)
+        await pipe.execute()
+    return sum(len(notifications) for notifications in users.values())
+
+
+class SymbolAlerts:
+    """Pending alerts of one symbol, thresholds in ascending order with their uids at the same index."""
+    __slots__ = ("above", "above_uids", "below", "below_uids")
+
+    def __init__(self):
+        self.above = array("d")
+        self.above_uids: List[int] = []
+        self.below = array("d")
+        self.below_uids: List[int] = []
+
+    def side(self, direction: PriceAlertDirection) -> Tuple[array, List[int]]:
+        if direction == PriceAlertDirection.ABOVE:
+            return self.above, self.above_uids
+        return self.below, self.below_uids
+
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below)
+
+
+class AlertIndex:
+    """Pending alerts by symbol. Uids are kept as ints, a third of the memory of `uuid.UUID`."""
+
+    def __init__(self):
+        self._symbols: Dict[str, SymbolAlerts] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @classmethod
+    def build(cls, rows: List[Tuple[int, str, float, PriceAlertDirection]]) -> "AlertIndex":
+        """Index of (uid, symbol, threshold, direction) rows, sorted once instead of inserted one by one."""
+        index = cls()
+        rows.sort(key=lambda row: (row[1], row[2]))
+        for uid, symbol, threshold, direction in rows:
+            alerts = index._symbols.get(symbol)
+            if alerts is None:
+                alerts = index._symbols[symbol] = SymbolAlerts()
+            thresholds, uids = alerts.side(direction)
+            thresholds.append(threshold)
+            uids.append(uid)
+        index._count = len(rows)
+        return index
+
+    def add(self, uid: int, symbol: str, threshold: float, direction: PriceAlertDirection) -> None:
+        alerts = self._symbols.get(symbol)
+        if alerts is None:
+            alerts = self._symbols[symbol] = SymbolAlerts()
+        thresholds, uids = alerts.side(direction)
+        position = bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        uids.insert(position, uid)
+        self._count += 1
+
+    def remove(self, uid: int, symbol: str, threshold: float, direction: PriceAlertDirection) -> None:
+        alerts = self._symbols.get(symbol)
+        if alerts is None:
+            return
+        thresholds, uids = alerts.side(direction)
+        # Only the alerts at this exact threshold are scanned
+        for position in range(bisect_right(thresholds, threshold) - 1, bisect_left(thresholds, threshold) - 1, -1):
+            if uids[position] == uid:
+                del thresholds[position]
+                del uids[position]
+                self._count -= 1
+        if not alerts:
+            del self._symbols[symbol]
+
+    def crossed(self, symbol: str, previous: float, price: float) -> List[int]:
+        """Removes and returns the alerts whose threshold the move from `previous` to `price` crossed."""
+        alerts = self._symbols.get(symbol)
+        if alerts is None or price == previous:
+            return []
+        if price > previous:
+            # Above thresholds in (previous, price]
+            thresholds, uids = alerts.above, alerts.above_uids
+            start, end = bisect_right(thresholds, previous), bisect_right(thresholds, price)
+        else:
+            # Below thresholds in [price, previous)
+            thresholds, uids = alerts.below, alerts.below_uids
+            start, end = bisect_left(thresholds, price), bisect_left(thresholds, previous)
+        if start == end:
+            return []
+        fired = uids[start:end]
+        del thresholds[start:end]
+        del uids[start:end]
+        self._count -= len(fired)
+        if not alerts:
+            del self._symbols[symbol]
+        return fired
+
+    def past(self, symbol: str, price: float) -> List[int]:
+        """
+        Removes and returns the alerts `price` is already at or past, the `Above` thresholds up
+        to it and the `Below` thresholds from it. For prices no move was seen to.
+        """
+        alerts = self._symbols.get(symbol)
+        if alerts is None:
+            return []
+        above_end = bisect_right(alerts.above, price)
+        below_start = bisect_left(alerts.below, price)
+        fired = alerts.above_uids[:above_end] + alerts.below_uids[below_start:]
+        del alerts.above[:above_end]
+        del alerts.above_uids[:above_end]
+        del alerts.below[below_start:]
+        del alerts.below_uids[below_start:]
+        self._count -= len(fired)
+        if not alerts:
+            del self._symbols[symbol]
+        return fired
+
+
+class AlertEngine:
+    def __init__(self):
+        self.index = AlertIndex()
+        self.prices: Dict[str, float] = {}
+        # (alert uid, price it fired at) waiting to be claimed
+        self._pending: List[Tuple[int, float]] = []
+        # Claimed notifications, grouped by user, the broker has not accepted yet
+        self._undelivered: List[Dict[str, List[dict]]] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._redis: Optional[Redis] = None
+
+    def publish(self, prices: Mapping[str, float]) -> None:
+        """Applies a batch of price ticks, called by the `TickBus`."""
+        for symbol, price in prices.items():
+            previous = self.prices.get(symbol)
+            self.prices[symbol] = price
+            if previous is None:
+                # The first price of a symbol fires what it is already past, like `apply_change`
+                fired = self.index.past(symbol, price)
+            else:
+                fired = self.index.crossed(symbol, previous, price)
+            if fired:
+                self._fire(fired, price)
+
+    def _fire(self, uids: List[int], price: float) -> None:
+        self._pending.extend((uid, price) for uid in uids)
+        METRICS.inc_gauge("price_alerts_fired", len(uids))
+        self._wakeup.set()
+
+    def apply_change(self, message: bytes) -> None:
+        try:
+            change = orjson.loads(message)
+            uid = uuid.UUID(change["uid"]).int
+            symbol, threshold = change["symbol"], float(change["threshold"])
+            direction = PriceAlertDirection.from_str(change["direction"])
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+            LOGGER.warning("Ignored a malformed price alert change")
+            return
+        if change.get("op") == "remove":
+            self.index.remove(uid, symbol, threshold, direction)
+            return
+        price = self.prices.get(symbol)
+        # The price may have moved past the threshold since the API read it
+        if price is not None and (price >= threshold if direction == PriceAlertDirection.ABOVE else price <= threshold):
+            self._fire([uid], price)
+        else:
+            self.index.add(uid, symbol, threshold, direction)
+
+    async def load(self) -> None:
+        """
+        Replaces the index with every pending alert of the database. Alerts the known prices
+        are already past fire at once, the price may have moved while the engine was away.
+        """
+        started = time.perf_counter()
+        rows = []
+        async with async_engine.connect() as connection:
+            result = await connection.stream(PENDING_ALERTS_SQL.execution_options(yield_per=LOAD_CHUNK_SIZE))
+            async for partition in result.partitions():
+                rows.extend(
+                    (uid.int, symbol, float(threshold), PriceAlertDirection[direction])
+                    for uid, symbol, threshold, direction in partition
+                )
+        self.index = AlertIndex.build(rows)
+        for symbol, price in self.prices.items():
+            fired = self.index.past(symbol, price)
+            if fired:
+                self._fire(fired, price)
+        METRICS.set_gauge("price_alerts_pending", len(self.index))
+        LOGGER.info(f"Loaded {len(self.index)} price alerts in {time.perf_counter() - started:.1f}s")
+
+    async def flush(self) -> int:
+        """Claims the fired alerts and queues their notifications. Returns the number claimed."""
+        sent = 0
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:Config.PRICE_ALERTS_BATCH_SIZE]
+                del self._pending[:Config.PRICE_ALERTS_BATCH_SIZE]
+                started = time.perf_counter()
+                try:
+                    async with async_engine.begin() as connection:
+                        claimed = (await connection.execute(CLAIM_SQL, {
+                            "uids": [uuid.UUID(int=uid) for uid, _ in batch],
+                            "prices": [price for _, price in batch],
+                        })).all()
+                except Exception as e:
+                    # Claims are idempotent, the batch is retried on the next flush
+                    self._pending[:0] = batch
+                    LOGGER.warning(f"Unable to claim {len(batch)} price alerts, {len(self._pending)} pending: {e!r}")
+                    break
+                METRICS.observe("price_alerts_flush_seconds", (), time.perf_counter() - started)
+                if claimed:
+                    self._undelivered.append(notification_batch(claimed))
+                sent += len(claimed)
+            await self._deliver()
+        METRICS.set_gauge("price_alerts_pending", len(self.index))
+        return sent
+
+    async def _deliver(self) -> None:
+        while self._undelivered:
+            try:
+                # Publishing to the broker is blocking
+                await asyncio.to_thread(celery_app.send_task, DELIVER_ALERTS_TASK, args=[self._undelivered[0]])
+            except Exception as e:
+                # The alerts are claimed already, only this process still has their notifications
+                LOGGER.warning(f"Unable to queue {len(self._undelivered)} price alert notification batches: {e!r}")
+                return
+            del self._undelivered[0]
+
+    async def _flush_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), Config.PRICE_ALERTS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _listen_changes(self) -> None:
+        delay = 1
+        while True:
+            try:
+                async with self._redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(ALERT_CHANGES_CHANNEL)
+                    # Changes published from now on queue up on the subscription while this loads
+                    await self.load()
+                    delay = 1
+                    while True:
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is not None and message["type"] == "message":
+                            self.apply_change(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.warning(f"Price alert changes unavailable, reloading in {delay}s: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def run(self) -> None:
+        """Evaluates alerts until SIGTERM or SIGINT."""
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopping.set)
+
+        self._redis = aioredis.Redis.from_url(broker_url)
+        METRICS.start()
+        changes = asyncio.create_task(self._listen_changes())
+        flusher = asyncio.create_task(self._flush_forever())
+        tick_bus = TickBus(self)
+        tick_bus.start()
+        try:
+            await stopping.wait()
+        finally:
+            await tick_bus.stop()
+            for task in (changes, flusher):
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+            await self.flush()
+            await METRICS.stop()
+            await self._redis.aclose()
+            await async_engine.dispose()
+
+
+def holding_statement(user_uid: uuid.UUID, symbol: str):
+    """A user's holding of `symbol` and its tenant, served by the (userUid, assetSymbol) index."""
+    return select(Portfolio.uid, Portfolio.domainUid).where(Portfolio.userUid == user_uid, Portfolio.assetSymbol == symbol)
+
+
+class PriceAlertService:
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    async def _publish_change(self, op: str, alert: PriceAlert) -> None:
+        await self.redis.publish(ALERT_CHANGES_CHANNEL, orjson.dumps({
+            "op": op,
+            "uid": str(alert.uid),
+            "symbol": alert.assetSymbol,
+            "threshold": str(alert.threshold),
+            "direction": alert.direction.value,
+        }))
+
+    async def create(self, user: User, data: PriceAlertCreate, session: AsyncSession) -> PriceAlert:
+        holding = (await session.exec(holding_statement(user.uid, data.assetSymbol))).first()
+        if holding is None:
+            raise InvalidPriceAlert()
+        pending = await session.exec(
+            select(func.count())
+            .select_from(PriceAlert)
+            .where(PriceAlert.userUid == user.uid, PriceAlert.triggeredAt.is_(None))
+        )
+        if pending.one() >= Config.PRICE_ALERTS_MAX_PER_USER:
+            raise TooManyPriceAlerts()
+
+        quote = await self.redis.hget(QUOTES_KEY, data.assetSymbol)
+        price = None if quote is None else Decimal(quote.decode())
+        if price is None or price == data.threshold:
+            raise InvalidPriceAlert()
+        direction = PriceAlertDirection.ABOVE if data.threshold > price else PriceAlertDirection.BELOW
+
+        alert = PriceAlert(
+            assetSymbol=data.assetSymbol,
+            direction=direction,
+            threshold=data.threshold,
+            userUid=user.uid,
+            domainUid=holding.domainUid,
+        )
+        session.add(alert)
+        await session.commit()
+        await session.refresh(alert)
+        await self._publish_change("add", alert)
+        return alert
+
+    async def notifications(self, user_uid: uuid.UUID) -> List[dict]:
+        """Takes the notifications delivered to a user and not read yet, newest first."""
+        key = ALERT_INBOX_KEY.format(user_uid)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            notifications, _ = await pipe.execute()
+        return [orjson.loads(notification) for notification in notifications]
+
+    async def list_alerts(self, user_uid: uuid.UUID, session: AsyncSession) -> List[PriceAlert]:
+        db_result = await session.exec(
+            select(PriceAlert)
+            .where(PriceAlert.userUid == user_uid)
+            .order_by(PriceAlert.createdAt.desc())
+            .limit(ALERTS_LIST_LIMIT)
+        )
+        return db_result.all()
+
+    async def delete(self, user_uid: uuid.UUID, alert_uid: uuid.UUID, session: AsyncSession) -> None:
+        db_result = await session.exec(
+            select(PriceAlert).where(PriceAlert.uid == alert_uid, PriceAlert.userUid == user_uid)
+        )
+        alert = db_result.first()
+        if alert is None:
+            raise PriceAlertNotFound()
+        await session.delete(alert)
+        await session.commit()
+        if alert.triggeredAt is None:
+            await self._publish_change("remove", alert)
+
+
+price_alert_service = PriceAlertService(redis_client)
+
+
+if __name__ == "__main__":
+    asyncio.run(AlertEngine().run())
@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class PriceAlertDirection(str, Enum):
+    ABOVE = "Above"
+    BELOW = "Below"
+
+    @classmethod
+    def from_str(cls, enum: str) -> "PriceAlertDirection":
+        try:
+            return cls(enum)
+        except ValueError:
+            raise ValueError(f"'{enum}' is not a valid PriceAlertDirection")
@@ -0,0 +1,166 @@
+"""
+Live portfolio valuations over WebSocket.
+
+`QuoteHub` keeps the latest price of every symbol and, per symbol, the set of sockets
+holding it. A price update walks only the subscriber set of its symbol and marks the symbol
+dirty on each of them, so a tick costs O(subscribers of that symbol) whatever the number of
+connected clients, and nothing polls.
+
+Each socket has one sender task. It wakes when something is dirty, waits
+`LIVE_PUSH_INTERVAL` so bursts of ticks go out as one message, and sends only the holdings
+whose value changed since the last message. Dirty symbols are a set, not a queue: a slow
+client gets fewer, fresher messages instead of a growing backlog, and one that does not
+accept a message within `LIVE_SEND_TIMEOUT` is disconnected.
+
+Messages (JSON text frames):
+
+    {"type": "snapshot", "holdings": {"AAPL": [quantity, price, value]}, "total": 1234.5}
+    {"type": "diff", "holdings": {"AAPL": [price, value]}, "total": 1240.1}
+
+Prices are unknown (null) until the first tick of a symbol reaches this worker.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import suppress
+from typing import Dict, Mapping, Optional, Set
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from src.config.settings import Config
+from src.utils.metrics import METRICS
+
+
+class LiveSubscriber:
+    __slots__ = ("websocket", "quantities", "sent", "dirty", "wakeup", "sender")
+
+    def __init__(self, websocket: WebSocket, quantities: Mapping[str, float]):
+        self.websocket = websocket
+        self.quantities = dict(quantities)
+        # Last value sent per symbol
+        self.sent: Dict[str, Optional[float]] = {}
+        self.dirty: Set[str] = set()
+        self.wakeup = asyncio.Event()
+        self.sender: Optional[asyncio.Task] = None
+
+    def mark(self, symbol: str) -> None:
+        self.dirty.add(symbol)
+        self.wakeup.set()
+
+
+class QuoteHub:
+    def __init__(self):
+        self.prices: Dict[str, float] = {}
+        self._subscribers: Dict[str, Set[LiveSubscriber]] = defaultdict(set)
+        self._connections = 0
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    def publish(self, prices: Mapping[str, float]) -> None:
+        """Applies a batch of price updates and marks them on the sockets holding the symbols."""
+        for symbol, price in prices.items():
+            if self.prices.get(symbol) == price:
+                continue
+            self.prices[symbol] = price
+            for subscriber in self._subscribers.get(symbol, ()):
+                subscriber.mark(symbol)
+
+    def subscribe(self, subscriber: LiveSubscriber) -> None:
+        for symbol in subscriber.quantities:
+            self._subscribers[symbol].add(subscriber)
+        self._connections += 1
+        METRICS.set_gauge("live_sockets", self._connections)
+
+    def unsubscribe(self, subscriber: LiveSubscriber) -> None:
+        for symbol in subscriber.quantities:
+            subscribers = self._subscribers.get(symbol)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[symbol]
+        self._connections -= 1
+        METRICS.set_gauge("live_sockets", self._connections)
+
+    def symbols(self) -> Set[str]:
+        """Symbols held by at least one socket of this worker."""
+        return set(self._subscribers)
+
+    # Messages
+    def _value(self, subscriber: LiveSubscriber, symbol: str) -> Optional[float]:
+        price = self.prices.get(symbol)
+        return None if price is None else round(price * subscriber.quantities[symbol], 2)
+
+    def _total(self, subscriber: LiveSubscriber) -> float:
+        return round(sum(value for value in subscriber.sent.values() if value is not None), 2)
+
+    def snapshot(self, subscriber: LiveSubscriber) -> bytes:
+        holdings = {}
+        for symbol, quantity in subscriber.quantities.items():
+            value = self._value(subscriber, symbol)
+            subscriber.sent[symbol] = value
+            holdings[symbol] = [quantity, self.prices.get(symbol), value]
+        return orjson.dumps({"type": "snapshot", "holdings": holdings, "total": self._total(subscriber)})
+
+    def diff(self, subscriber: LiveSubscriber) -> Optional[bytes]:
+        """The holdings whose value changed since the last message, None when nothing did."""
+        dirty, subscriber.dirty = subscriber.dirty, set()
+        holdings = {}
+        for symbol in dirty:
+            value = self._value(subscriber, symbol)
+            if value != subscriber.sent.get(symbol):
+                subscriber.sent[symbol] = value
+                holdings[symbol] = [self.prices.get(symbol), value]
+        if not holdings:
+            return None
+        return orjson.dumps({"type": "diff", "holdings": holdings, "total": self._total(subscriber)})
+
+    # Sockets
+    async def _send(self, subscriber: LiveSubscriber) -> None:
+        while True:
+            await subscriber.wakeup.wait()
+            # Let a burst of ticks accumulate into one message
+            await asyncio.sleep(Config.LIVE_PUSH_INTERVAL)
+            subscriber.wakeup.clear()
+            message = self.diff(subscriber)
+            if message is None:
+                continue
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(subscriber.websocket.send_text(message.decode()), Config.LIVE_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                METRICS.inc_gauge("live_slow_consumer_disconnects")
+                with suppress(Exception):
+                    await asyncio.wait_for(subscriber.websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), 1)
+                return
+            except Exception:
+                # The socket went away between two messages
+                return
+            METRICS.observe("live_send_seconds", (), time.perf_counter() - started)
+
+    async def serve(self, websocket: WebSocket, quantities: Mapping[str, float]) -> None:
+        """Streams valuations to an accepted socket until it disconnects."""
+        subscriber = LiveSubscriber(websocket, quantities)
+        self.subscribe(subscriber)
+        subscriber.sender = asyncio.create_task(self._send(subscriber))
+        try:
+            await websocket.send_text(self.snapshot(subscriber).decode())
+            # Clients do not send anything, reading only notices the disconnect
+            while True:
+                receive = asyncio.ensure_future(websocket.receive())
+                done, _ = await asyncio.wait({receive, subscriber.sender}, return_when=asyncio.FIRST_COMPLETED)
+                if subscriber.sender in done:
+                    receive.cancel()
+                    return
+                if receive.result()["type"] == "websocket.disconnect":
+                    return
+        except WebSocketDisconnect:
+            pass
+        finally:
+            subscriber.sender.cancel()
+            self.unsubscribe(subscriber)
+
+
+quote_hub = QuoteHub()
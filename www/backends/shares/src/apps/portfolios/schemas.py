@@ -1,8 +1,11 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 import uuid
-from pydantic import BaseModel, condecimal
+from pydantic import BaseModel, Field, condecimal
+
+from src.apps.portfolios.enums import PriceAlertDirection
+from src.utils.responses import Serializer
 
 
 class PortfolioBase(BaseModel):
@@ -35,3 +38,73 @@ class PortfolioRead(PortfolioBase):
 
     class Config:
         from_attributes = True
+
+
+class PortfolioImportRow(BaseModel):
+    """One line of a portfolio CSV import, empty cells take the defaults."""
+    userUid: uuid.UUID
+    assetSymbol: str = Field(min_length=1, max_length=32)
+    assetName: str = Field(min_length=1, max_length=255)
+    balance: Annotated[Decimal, Field(ge=0, decimal_places=2)] = Decimal(0)
+    quantity: Annotated[Decimal, Field(ge=0, decimal_places=2)] = Decimal(0)
+    purchasePrice: Annotated[Decimal, Field(ge=0, decimal_places=6)] = Decimal(0)
+    currentPrice: Annotated[Decimal, Field(ge=0, decimal_places=6)] = Decimal(0)
+    symbol: Optional[str] = None
+    walletAddress: Optional[str] = None
+    exchange: Optional[str] = None
+    dividendYield: Annotated[Decimal, Field(ge=0, decimal_places=6)] = Decimal(0)
+    isCrypto: bool = False
+    isStocks: bool = False
+    purchaseDate: Optional[date] = None
+
+
+class PortfolioImportError(BaseModel):
+    line: int
+    error: str
+
+
+class PortfolioImportStatus(BaseModel):
+    uid: str
+    status: str
+    processed: int = 0
+    imported: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[PortfolioImportError] = []
+    detail: Optional[str] = None
+
+
+class PriceAlertCreate(BaseModel):
+    """The direction is not given, it follows from the current price."""
+    assetSymbol: str = Field(min_length=1, max_length=32)
+    threshold: Annotated[Decimal, Field(gt=0, decimal_places=6)]
+
+
+class PriceAlertRead(BaseModel):
+    uid: uuid.UUID
+    assetSymbol: str
+    direction: PriceAlertDirection
+    threshold: Decimal
+    triggeredPrice: Optional[Decimal]
+    triggeredAt: Optional[datetime]
+    createdAt: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class PriceAlertNotification(BaseModel):
+    uid: uuid.UUID
+    assetSymbol: str
+    direction: PriceAlertDirection
+    threshold: Decimal
+    price: float
+    triggeredAt: datetime
+
+
+# Precompiled JSON serializers, see src.utils.responses
+portfolio_read_serializer = Serializer(PortfolioRead)
+portfolio_import_status_serializer = Serializer(PortfolioImportStatus)
+price_alert_read_serializer = Serializer(PriceAlertRead)
+price_alert_notification_serializer = Serializer(PriceAlertNotification)
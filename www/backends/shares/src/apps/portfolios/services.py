@@ -0,0 +1,293 @@
+"""
+Bulk portfolio imports from CSV.
+
+The upload is spooled to a file under `PORTFOLIO_IMPORT_DIR` chunk by chunk, never held in
+memory whole, and a Celery task imports it from there. API and Celery workers must share the
+directory (same host or a shared volume), only the import uid goes through the broker:
+
+1. The CSV is parsed as a stream, `PORTFOLIO_IMPORT_CHUNK_ROWS` lines at a time. Each line
+   is validated with `PortfolioImportRow`; invalid lines are reported with their line
+   number and skipped, valid ones are COPYed into a temporary staging table.
+2. Staged lines naming users who did not sign up on the tenant's domain, or holdings the
+   user already has on another tenant, are reported and removed.
+3. One `INSERT ... SELECT ... ON CONFLICT ("userUid", "assetSymbol") DO UPDATE` merges the
+   staging table into `portfolio`. The last line wins when a file repeats a holding. The
+   update only applies to holdings of the same tenant, even one created meanwhile.
+
+Everything runs in one transaction, a failed import leaves `portfolio` untouched. Progress
+and errors are kept in the `portfolio_import:<uid>` hash for `PORTFOLIO_IMPORT_TTL` seconds.
+The file is deleted once the import ran, or after `PORTFOLIO_IMPORT_TTL` seconds if it never did.
+"""
+import asyncio
+import csv
+import io
+import os
+import time
+import uuid
+from contextlib import suppress
+from itertools import islice
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import orjson
+from fastapi import UploadFile
+from pydantic import ValidationError
+from redis.asyncio import Redis
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.apps.portfolios.schemas import PortfolioImportRow
+from src.config.settings import Config
+from src.db.redis import redis_client
+from src.errors import InvalidPortfolioImport, PortfolioImportNotFound, PortfolioImportTooLarge
+from src.utils.logger import LOGGER
+
+IMPORT_KEY = "portfolio_import:{}"
+# Line errors kept for the status, the count of failed lines is always exact
+IMPORT_MAX_ERRORS = 1000
+READ_CHUNK_SIZE = 1024 * 1024
+
+IMPORT_COLUMNS = tuple(PortfolioImportRow.model_fields)
+REQUIRED_COLUMNS = {"userUid", "assetSymbol", "assetName"}
+STAGING_TABLE = "portfolio_import_staging"
+
+STAGING_DDL = f"""
+CREATE TEMPORARY TABLE {STAGING_TABLE} (
+    line INTEGER NOT NULL,
+    "userUid" UUID NOT NULL,
+    "assetSymbol" VARCHAR NOT NULL,
+    "assetName" VARCHAR NOT NULL,
+    balance NUMERIC NOT NULL,
+    quantity NUMERIC NOT NULL,
+    "purchasePrice" NUMERIC NOT NULL,
+    "currentPrice" NUMERIC NOT NULL,
+    symbol VARCHAR,
+    "walletAddress" VARCHAR,
+    exchange VARCHAR,
+    "dividendYield" NUMERIC NOT NULL,
+    "isCrypto" BOOLEAN NOT NULL,
+    "isStocks" BOOLEAN NOT NULL,
+    "purchaseDate" DATE
+) ON COMMIT DROP
+"""
+
+# A user belongs to a tenant when they have a `domains` row for the tenant's domain,
+# compared like `normalize_domain` does
+UNKNOWN_USERS_SQL = f"""
+DELETE FROM {STAGING_TABLE} AS staged
+WHERE NOT EXISTS (
+    SELECT 1 FROM domains AS member
+    JOIN domains AS tenant ON tenant.uid = CAST(:domain_uid AS UUID)
+    WHERE member."userUid" = staged."userUid"
+    AND rtrim(lower(btrim(member.domain)), '/') = rtrim(lower(btrim(tenant.domain)), '/')
+)
+RETURNING line, "userUid"
+"""
+
+OTHER_TENANT_HOLDINGS_SQL = f"""
+DELETE FROM {STAGING_TABLE} AS staged
+USING portfolio
+WHERE portfolio."userUid" = staged."userUid" AND portfolio."assetSymbol" = staged."assetSymbol"
+AND portfolio."domainUid" IS DISTINCT FROM CAST(:domain_uid AS UUID)
+RETURNING staged.line, staged."assetSymbol"
+"""
+
+# xmax is 0 on freshly inserted rows and set on the rows the upsert updated
+MERGE_SQL = f"""
+INSERT INTO portfolio (
+    uid, "assetName", "assetSymbol", balance, quantity, "purchasePrice", "currentPrice",
+    symbol, "walletAddress", exchange, "dividendYield", "isCrypto", "isStocks",
+    "userUid", "domainUid", "purchaseDate", "createdAt", "updatedAt"
+)
+SELECT DISTINCT ON ("userUid", "assetSymbol")
+    gen_random_uuid(), "assetName", "assetSymbol", balance, quantity, "purchasePrice", "currentPrice",
+    symbol, "walletAddress", exchange, "dividendYield", "isCrypto", "isStocks",
+    "userUid", CAST(:domain_uid AS UUID), COALESCE("purchaseDate", CURRENT_DATE), now(), now()
+FROM {STAGING_TABLE}
+ORDER BY "userUid", "assetSymbol", line DESC
+ON CONFLICT ("userUid", "assetSymbol") DO UPDATE SET
+    "assetName" = EXCLUDED."assetName",
+    balance = EXCLUDED.balance,
+    quantity = EXCLUDED.quantity,
+    "purchasePrice" = EXCLUDED."purchasePrice",
+    "currentPrice" = EXCLUDED."currentPrice",
+    symbol = EXCLUDED.symbol,
+    "walletAddress" = EXCLUDED."walletAddress",
+    exchange = EXCLUDED.exchange,
+    "dividendYield" = EXCLUDED."dividendYield",
+    "isCrypto" = EXCLUDED."isCrypto",
+    "isStocks" = EXCLUDED."isStocks",
+    "purchaseDate" = EXCLUDED."purchaseDate",
+    "updatedAt" = EXCLUDED."updatedAt"
+WHERE portfolio."domainUid" = EXCLUDED."domainUid"
+RETURNING (xmax = 0) AS inserted
+"""
+
+
+def read_header(data: bytes) -> List[str]:
+    """The column names of a CSV import, raises `InvalidPortfolioImport` without the required ones."""
+    first_line = data.split(b"\n", 1)[0]
+    try:
+        header = next(csv.reader([first_line.decode("utf-8-sig").rstrip("\r")]), [])
+    except (UnicodeDecodeError, csv.Error):
+        raise InvalidPortfolioImport()
+    if not REQUIRED_COLUMNS.issubset(name.strip() for name in header):
+        raise InvalidPortfolioImport()
+    return header
+
+
+def numbered_rows(source: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    """(line number, cells) of every CSV row, read and decoded lazily."""
+    reader = csv.DictReader(io.TextIOWrapper(source, encoding="utf-8-sig", newline=""))
+    reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+    for row in reader:
+        yield reader.line_num, row
+
+
+def import_path(import_uid: str) -> str:
+    return os.path.join(Config.PORTFOLIO_IMPORT_DIR, f"{import_uid}.csv")
+
+
+def discard_import(import_uid: str) -> None:
+    with suppress(FileNotFoundError):
+        os.unlink(import_path(import_uid))
+
+
+def discard_stale_imports() -> None:
+    """Deletes the uploads older than `PORTFOLIO_IMPORT_TTL`, their import never ran."""
+    expired = time.time() - Config.PORTFOLIO_IMPORT_TTL
+    with os.scandir(Config.PORTFOLIO_IMPORT_DIR) as entries:
+        for entry in entries:
+            with suppress(FileNotFoundError):
+                if entry.name.endswith(".csv") and entry.stat().st_mtime < expired:
+                    os.unlink(entry.path)
+
+
+def validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+class PortfolioImportService:
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    async def create(self, upload: UploadFile, domain_uid: uuid.UUID) -> str:
+        """Spools the upload to disk and returns the uid of the import, queue it with `import_portfolios`."""
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        read_header(chunk)
+
+        import_uid = uuid.uuid4().hex
+        await asyncio.to_thread(os.makedirs, Config.PORTFOLIO_IMPORT_DIR, exist_ok=True)
+        await asyncio.to_thread(discard_stale_imports)
+        written = 0
+        try:
+            with open(import_path(import_uid), "wb") as target:
+                while chunk:
+                    written += len(chunk)
+                    if written > Config.PORTFOLIO_IMPORT_MAX_BYTES:
+                        raise PortfolioImportTooLarge()
+                    await asyncio.to_thread(target.write, chunk)
+                    chunk = await upload.read(READ_CHUNK_SIZE)
+        except BaseException:
+            await asyncio.to_thread(discard_import, import_uid)
+            raise
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(IMPORT_KEY.format(import_uid), mapping={"status": "queued", "domainUid": str(domain_uid)})
+            pipe.expire(IMPORT_KEY.format(import_uid), Config.PORTFOLIO_IMPORT_TTL)
+            await pipe.execute()
+        return import_uid
+
+    async def status(self, import_uid: str, domain_uid: Optional[uuid.UUID] = None) -> dict:
+        stored = await self.redis.hgetall(IMPORT_KEY.format(import_uid))
+        state = {key.decode(): value.decode() for key, value in stored.items()}
+        if not state or (domain_uid is not None and state.get("domainUid") != str(domain_uid)):
+            raise PortfolioImportNotFound()
+        state["uid"] = import_uid
+        state["errors"] = orjson.loads(state.get("errors", "[]"))
+        return state
+
+    async def _update(self, import_uid: str, **fields) -> None:
+        if "errors" in fields:
+            fields["errors"] = orjson.dumps(fields["errors"][:IMPORT_MAX_ERRORS])
+        await self.redis.hset(IMPORT_KEY.format(import_uid), mapping=fields)
+
+    async def run(self, import_uid: str, engine: AsyncEngine) -> dict:
+        """Imports a stored upload, called by the Celery task."""
+        state = await self.status(import_uid)
+        try:
+            source = open(import_path(import_uid), "rb")
+        except FileNotFoundError:
+            await self._update(import_uid, status="failed", detail="The uploaded file expired before it was imported")
+            return await self.status(import_uid)
+        try:
+            return await self._import(import_uid, state, source, engine)
+        finally:
+            source.close()
+            discard_import(import_uid)
+
+    async def _import(self, import_uid: str, state: dict, source: BinaryIO, engine: AsyncEngine) -> dict:
+        await self._update(import_uid, status="running")
+        errors: List[dict] = []
+        processed = staged = 0
+        try:
+            async with engine.connect() as connection:
+                async with connection.begin():
+                    await connection.execute(text(STAGING_DDL))
+                    raw = await connection.get_raw_connection()
+
+                    rows = numbered_rows(source)
+                    while chunk := list(islice(rows, Config.PORTFOLIO_IMPORT_CHUNK_ROWS)):
+                        records = []
+                        for line, cells in chunk:
+                            try:
+                                row = PortfolioImportRow.model_validate({
+                                    name: value.strip()
+                                    for name, value in cells.items()
+                                    if name in IMPORT_COLUMNS and value and value.strip()
+                                })
+                            except ValidationError as e:
+                                errors.append({"line": line, "error": validation_message(e)})
+                                continue
+                            records.append((line, *(getattr(row, name) for name in IMPORT_COLUMNS)))
+                        if records:
+                            await raw.driver_connection.copy_records_to_table(
+                                STAGING_TABLE, records=records, columns=("line", *IMPORT_COLUMNS)
+                            )
+                        processed += len(chunk)
+                        staged += len(records)
+                        await self._update(import_uid, processed=processed, failed=len(errors), errors=errors)
+
+                    tenant = {"domain_uid": state["domainUid"]}
+                    for line, user_uid in await connection.execute(text(UNKNOWN_USERS_SQL), tenant):
+                        errors.append({"line": line, "error": f"userUid: unknown user {user_uid}"})
+                        staged -= 1
+                    for line, symbol in await connection.execute(text(OTHER_TENANT_HOLDINGS_SQL), tenant):
+                        errors.append({"line": line, "error": f"assetSymbol: {symbol} is held on another site"})
+                        staged -= 1
+                    merged = (await connection.execute(text(MERGE_SQL), tenant)).scalars().all()
+        except (UnicodeDecodeError, csv.Error) as e:
+            await self._update(import_uid, status="failed", detail=f"Line {processed + 1} and after could not be read: {e}")
+            return await self.status(import_uid)
+        except Exception as e:
+            LOGGER.error(f"Portfolio import {import_uid} failed: {e!r}")
+            await self._update(import_uid, status="failed", detail="The import failed, nothing was saved")
+            raise
+
+        errors.sort(key=lambda error: error["line"])
+        inserted = sum(1 for was_inserted in merged if was_inserted)
+        await self._update(
+            import_uid,
+            status="completed",
+            processed=processed,
+            imported=staged,
+            inserted=inserted,
+            updated=len(merged) - inserted,
+            failed=len(errors),
+            errors=errors,
+        )
+        return await self.status(import_uid)
+
+
+portfolio_import_service = PortfolioImportService(redis_client)
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Dict, List
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.apps.portfolios.alerts import DELIVER_ALERTS_TASK, deliver_notifications
+from src.apps.portfolios.services import PortfolioImportService
+from src.apps.portfolios.ticks import fetch_prices, publish_ticks
+from src.celery_tasks import celery_app
+from src.config.settings import Config, broker_url
+from src.db.redis import acquire_lease, release_lease
+
+
+async def _import_portfolios(import_uid: str):
+    # Each task run gets its own event loop, pooled connections cannot outlive it
+    engine = create_async_engine(Config.DATABASE_URL, poolclass=NullPool)
+    redis = aioredis.Redis.from_url(broker_url)
+    try:
+        return await PortfolioImportService(redis).run(import_uid, engine)
+    finally:
+        await redis.aclose()
+        await engine.dispose()
+
+
+@celery_app.task(name="portfolios.import_portfolios")
+def import_portfolios(import_uid: str):
+    """Imports a portfolio CSV stored by `PortfolioImportService.create`."""
+    return asyncio.run(_import_portfolios(import_uid))
+
+
+HELD_SYMBOLS_SQL = text('SELECT DISTINCT "assetSymbol" FROM portfolio')
+PRICE_TICKS_LEASE_KEY = "portfolios:publish_price_ticks:lease"
+# Seconds the held symbols are reused before being read again
+HELD_SYMBOLS_TTL = 300
+_held_symbols: List[str] = []
+_held_symbols_at = 0.0
+
+
+async def _publish_price_ticks():
+    redis = aioredis.Redis.from_url(broker_url)
+    try:
+        # A run slower than the interval would otherwise overlap the next one and publish
+        # older prices after newer ones
+        lease = await acquire_lease(redis, PRICE_TICKS_LEASE_KEY, Config.PRICE_TICK_LEASE_TTL)
+        if lease is None:
+            return {"skipped": True}
+        try:
+            return await _fetch_and_publish(redis)
+        finally:
+            await release_lease(redis, PRICE_TICKS_LEASE_KEY, lease)
+    finally:
+        await redis.aclose()
+
+
+async def _fetch_and_publish(redis: aioredis.Redis) -> dict:
+    global _held_symbols, _held_symbols_at
+    if time.monotonic() - _held_symbols_at > HELD_SYMBOLS_TTL:
+        engine = create_async_engine(Config.DATABASE_URL, poolclass=NullPool)
+        try:
+            async with engine.connect() as connection:
+                _held_symbols = sorted((await connection.execute(HELD_SYMBOLS_SQL)).scalars().all())
+        finally:
+            await engine.dispose()
+        _held_symbols_at = time.monotonic()
+    # yfinance is blocking
+    prices = await asyncio.to_thread(fetch_prices, _held_symbols)
+    changed = await publish_ticks(redis, prices)
+    return {"symbols": len(_held_symbols), "priced": len(prices), "changed": len(changed)}
+
+
+@celery_app.task(name="portfolios.publish_price_ticks", ignore_result=True)
+def publish_price_ticks():
+    """Fetches every held symbol once and publishes the changed prices to all API workers."""
+    return asyncio.run(_publish_price_ticks())
+
+
+async def _deliver_price_alerts(users: Dict[str, List[dict]]):
+    redis = aioredis.Redis.from_url(broker_url)
+    try:
+        return await deliver_notifications(redis, users)
+    finally:
+        await redis.aclose()
+
+
+@celery_app.task(name=DELIVER_ALERTS_TASK, ignore_result=True, autoretry_for=(RedisError,), retry_backoff=True)
+def deliver_price_alerts(users: Dict[str, List[dict]]):
+    """Delivers the notifications of price alerts claimed by the alert engine, grouped by user uid."""
+    return asyncio.run(_deliver_price_alerts(users))
@@ -0,0 +1,131 @@
+"""
+Price ticks shared by every worker through Redis.
+
+One publisher, the `publish_price_ticks` Celery task, fetches the price of every held
+symbol once per `PRICE_TICK_INTERVAL` and publishes the ones that changed as a single
+batched message on the `ticks` channel. It also keeps the latest price of every symbol in
+the `quotes` hash.
+
+Every API worker runs a `TickBus` that listens on the channel and applies each batch to its
+local quote cache (`quote_hub.prices`), which fans the changes out to the live sockets. On
+start and after every reconnect the bus loads the `quotes` hash first, so ticks published
+while it was not listening are not missed. Upstream is queried once per symbol per tick
+whatever the number of workers.
+"""
+import asyncio
+import time
+from typing import Dict, List, Mapping, Optional
+
+import orjson
+import redis.asyncio as aioredis
+from redis.asyncio import Redis
+
+from src.apps.portfolios.live import QuoteHub, quote_hub
+from src.config.settings import broker_url
+from src.utils.logger import LOGGER
+
+TICKS_CHANNEL = "ticks"
+QUOTES_KEY = "quotes"
+# Symbols per upstream request
+FETCH_CHUNK_SIZE = 200
+RECONNECT_MAX_DELAY = 30
+
+
+def fetch_prices(symbols: List[str]) -> Dict[str, float]:
+    """Latest prices from Yahoo Finance, symbols without a price are left out. Blocking."""
+    # Heavy import, only the process publishing ticks needs it
+    import yfinance as yf
+
+    prices: Dict[str, float] = {}
+    for start in range(0, len(symbols), FETCH_CHUNK_SIZE):
+        chunk = symbols[start:start + FETCH_CHUNK_SIZE]
+        try:
+            data = yf.download(chunk, period="1d", interval="1m", progress=False, threads=True)
+        except Exception as e:
+            LOGGER.warning(f"Unable to fetch prices of {len(chunk)} symbols: {e!r}")
+            continue
+        if data.empty:
+            continue
+        closes = data["Close"]
+        if not hasattr(closes, "columns"):
+            closes = closes.to_frame(chunk[0])
+        for symbol, price in closes.ffill().iloc[-1].items():
+            # NaN when a symbol had no trade in the period
+            if price == price:
+                prices[str(symbol)] = round(float(price), 6)
+    return prices
+
+
+async def publish_ticks(redis: Redis, prices: Mapping[str, float]) -> Dict[str, float]:
+    """Publishes the prices that changed since the last tick. Returns them."""
+    if not prices:
+        return {}
+    symbols = list(prices)
+    previous = await redis.hmget(QUOTES_KEY, symbols)
+    changed = {
+        symbol: prices[symbol]
+        for symbol, old in zip(symbols, previous)
+        if old is None or float(old) != prices[symbol]
+    }
+    if changed:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(QUOTES_KEY, mapping={symbol: repr(price) for symbol, price in changed.items()})
+            pipe.publish(TICKS_CHANNEL, orjson.dumps({"t": time.time(), "p": changed}))
+            await pipe.execute()
+    return changed
+
+
+class TickBus:
+    def __init__(self, hub: QuoteHub):
+        self.hub = hub
+        self._redis: Optional[Redis] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def apply(self, message: bytes) -> None:
+        try:
+            prices = orjson.loads(message)["p"]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            LOGGER.warning("Ignored a malformed price tick")
+            return
+        self.hub.publish(prices)
+
+    async def load_quotes(self) -> None:
+        """Applies the latest price of every symbol, catches up on the ticks missed while not listening."""
+        quotes = await self._redis.hgetall(QUOTES_KEY)
+        self.hub.publish({symbol.decode(): float(price) for symbol, price in quotes.items()})
+
+    async def _listen(self) -> None:
+        delay = 1
+        while True:
+            try:
+                async with self._redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(TICKS_CHANNEL)
+                    await self.load_quotes()
+                    delay = 1
+                    while True:
+                        message = await pubsub.get_message(timeout=1.0)
+                        if message is not None and message["type"] == "message":
+                            self.apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.warning(f"Price ticks unavailable, reconnecting in {delay}s: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def start(self) -> None:
+        if self._listener is None:
+            # Its own connection, a subscribed connection cannot serve other commands
+            self._redis = aioredis.Redis.from_url(broker_url)
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+tick_bus = TickBus(quote_hub)
@@ -0,0 +1,126 @@
+import asyncio
+import uuid
+from typing import List
+
+from fastapi import APIRouter, File, UploadFile, WebSocket, status
+from sqlmodel import select
+
+from src.apps.accounts.dependencies import (
+    current_user_dependency,
+    db_dependency,
+    get_user_from_token,
+    read_user_dependency,
+    tenant_admin_dependency,
+    tenant_dependency,
+)
+from src.apps.portfolios.alerts import price_alert_service
+from src.apps.portfolios.live import quote_hub
+from src.apps.portfolios.schemas import (
+    PortfolioImportStatus,
+    PriceAlertCreate,
+    PriceAlertNotification,
+    PriceAlertRead,
+    portfolio_import_status_serializer,
+    price_alert_notification_serializer,
+    price_alert_read_serializer,
+)
+from src.apps.portfolios.services import portfolio_import_service
+from src.apps.portfolios.tasks import import_portfolios
+from src.config.settings import Config
+from src.db.db import async_session_factory
+from src.db.models import Portfolio
+from src.errors import NextStocksException
+from src.utils.exports import ExportFormat, export_response
+
+portfolios_router = APIRouter()
+
+
+@portfolios_router.get("/export", status_code=status.HTTP_200_OK)
+async def export_portfolios(
+    tenant: tenant_dependency, admin: tenant_admin_dependency, format: ExportFormat = "ndjson", gzip: bool = False
+):
+    """Every portfolio of the tenant as an NDJSON or CSV download, streamed. `gzip=true` compresses it."""
+    table = Portfolio.__table__
+    statement = select(table).where(table.c.domainUid == tenant.uid)
+    return export_response(statement, "portfolios", format, gzip)
+
+
+@portfolios_router.post("/import", status_code=status.HTTP_202_ACCEPTED, response_model=PortfolioImportStatus)
+async def import_portfolio_csv(tenant: tenant_dependency, admin: tenant_admin_dependency, file: UploadFile = File(...)):
+    """
+    Imports holdings from a CSV file into the tenant's portfolios, in the background.
+
+    The header must name `userUid`, `assetSymbol` and `assetName`, and may add any other `Portfolio` field.
+    Existing holdings (same user and asset symbol) are updated. Poll `GET /portfolios/import/{uid}`
+    for progress and per line errors.
+    """
+    import_uid = await portfolio_import_service.create(file, tenant.uid)
+    # Publishing to the broker is blocking
+    await asyncio.to_thread(import_portfolios.delay, import_uid)
+    state = await portfolio_import_service.status(import_uid)
+    return portfolio_import_status_serializer.response(state, status_code=status.HTTP_202_ACCEPTED)
+
+
+@portfolios_router.get("/import/{import_uid}", status_code=status.HTTP_200_OK, response_model=PortfolioImportStatus)
+async def portfolio_import_status(import_uid: str, tenant: tenant_dependency, admin: tenant_admin_dependency):
+    """Progress of a portfolio import, with the lines that could not be imported."""
+    state = await portfolio_import_service.status(import_uid, tenant.uid)
+    return portfolio_import_status_serializer.response(state)
+
+
+@portfolios_router.post("/alerts", status_code=status.HTTP_201_CREATED, response_model=PriceAlertRead)
+async def create_price_alert(data: PriceAlertCreate, user: current_user_dependency, session: db_dependency):
+    """
+    Notifies the signed in user once when the price of a symbol they hold crosses `threshold`.
+
+    The alert is `Above` when the threshold is over the current price and fires when the price
+    rises to it, `Below` otherwise.
+    """
+    alert = await price_alert_service.create(user, data, session)
+    return price_alert_read_serializer.response(alert, status_code=status.HTTP_201_CREATED)
+
+
+@portfolios_router.get("/alerts", status_code=status.HTTP_200_OK, response_model=List[PriceAlertRead])
+async def my_price_alerts(user: current_user_dependency, session: db_dependency):
+    """Price alerts of the signed in user, newest first. Fired alerts carry `triggeredAt` and `triggeredPrice`."""
+    alerts = await price_alert_service.list_alerts(user.uid, session)
+    return price_alert_read_serializer.list_response(alerts)
+
+
+@portfolios_router.get(
+    "/alerts/notifications", status_code=status.HTTP_200_OK, response_model=List[PriceAlertNotification]
+)
+async def my_price_alert_notifications(user: read_user_dependency):
+    """Fired price alerts not read yet, newest first. Reading them empties the list."""
+    notifications = await price_alert_service.notifications(user.uid)
+    return price_alert_notification_serializer.list_response(notifications)
+
+
+@portfolios_router.delete("/alerts/{alert_uid}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_price_alert(alert_uid: uuid.UUID, user: current_user_dependency, session: db_dependency):
+    """Deletes a price alert of the signed in user, pending or fired."""
+    await price_alert_service.delete(user.uid, alert_uid, session)
+
+
+@portfolios_router.websocket("/live")
+async def live_valuations(websocket: WebSocket, token: str):
+    """
+    Live valuation of the signed in user's holdings. Browsers cannot set headers on a
+    WebSocket, so the access token is passed as the `token` query parameter.
+    """
+    if quote_hub.connections >= Config.LIVE_MAX_CONNECTIONS:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    async with async_session_factory() as session:
+        try:
+            user = await get_user_from_token(token, session)
+        except NextStocksException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        db_result = await session.exec(
+            select(Portfolio.assetSymbol, Portfolio.quantity).where(Portfolio.userUid == user.uid)
+        )
+        quantities = {symbol: float(quantity) for symbol, quantity in db_result.all()}
+
+    await websocket.accept()
+    await quote_hub.serve(websocket, quantities)
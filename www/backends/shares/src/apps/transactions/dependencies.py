@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Annotated, NamedTuple, Optional
+
+from fastapi import Depends, Query
+
+from src.apps.transactions.enums import TransactionPaymentMethod, TransactionPaymentType, TransactionStatus
+from src.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+
+class TransactionListParams(NamedTuple):
+    cursor: Optional[str]
+    limit: int
+    status: Optional[TransactionStatus]
+    transactionType: Optional[TransactionPaymentType]
+    method: Optional[TransactionPaymentMethod]
+    createdAfter: Optional[datetime]
+    createdBefore: Optional[datetime]
+
+
+async def get_transaction_list_params(
+    cursor: Annotated[Optional[str], Query(description="`nextCursor` of the previous page")] = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    status: Optional[TransactionStatus] = None,
+    transactionType: Optional[TransactionPaymentType] = None,
+    method: Optional[TransactionPaymentMethod] = None,
+    createdAfter: Annotated[Optional[datetime], Query(description="Only months from this date are read")] = None,
+    createdBefore: Optional[datetime] = None,
+) -> TransactionListParams:
+    return TransactionListParams(cursor, limit, status, transactionType, method, createdAfter, createdBefore)
+
+
+transaction_list_params_dependency = Annotated[TransactionListParams, Depends(get_transaction_list_params)]
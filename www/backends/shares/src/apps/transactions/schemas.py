@@ -9,6 +9,8 @@ from .enums import (
     TransactionPaymentMethod
 )
 
+from src.utils.responses import Serializer
+
 
 # Pydantic model for PlanFeatures
 class PlanFeatureLinksRead(BaseModel):
@@ -56,6 +58,21 @@ class PlansRead(BaseModel):
         from_attributes = True
 
 
+class PublicPlansRead(BaseModel):
+    """Plan details that are safe to show on a tenant's public pages (no subscriptions)."""
+    uid: UUID4
+    name: str
+    description: str
+    trialInDays: int
+    amount: Decimal
+    duration: int  # months
+    createdAt: datetime
+    updatedAt: datetime
+
+    class Config:
+        from_attributes = True
+
+
 # Pydantic model for Subscription
 class CreateOrUpdateSubscription(BaseModel):
     uid: UUID4 = Field(default_factory=uuid.uuid4)
@@ -97,3 +114,17 @@ class TransactionHistoryRead(BaseModel):
     class Config:
         orm_mode = True
 
+
+class TransactionHistoryPage(BaseModel):
+    transactions: List[TransactionHistoryRead]
+    # Opaque, pass it back as `cursor` for the next page. None on the last page.
+    nextCursor: Optional[str] = None
+
+
+# Precompiled JSON serializers, see src.utils.responses
+plan_features_read_serializer = Serializer(PlanFeaturesRead)
+plans_read_serializer = Serializer(PlansRead)
+public_plans_read_serializer = Serializer(PublicPlansRead)
+subscription_read_serializer = Serializer(SubscriptionRead)
+transaction_history_read_serializer = Serializer(TransactionHistoryRead)
+transaction_history_page_serializer = Serializer(TransactionHistoryPage)
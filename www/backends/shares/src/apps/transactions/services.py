@@ -0,0 +1,52 @@
+import uuid
+from typing import Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.apps.transactions.dependencies import TransactionListParams
+from src.db.models import TransactionHistory
+from src.utils.pagination import after_cursor, decode_cursor, paginate
+
+
+def transaction_list_statement(
+    payer_uid: uuid.UUID, params: TransactionListParams, domain_uid: Optional[uuid.UUID] = None
+):
+    """
+    One page of a payer's transactions, newest first, plus one row to tell whether
+    there is a next page. Served by the (payerUid, createdAt, uid) index whatever the
+    page number. Date bounds (and cursors) limit the scan to the monthly partitions
+    they cover. `domain_uid` keeps only the transactions made on that tenant.
+    """
+    statement = select(TransactionHistory).where(TransactionHistory.payerUid == payer_uid)
+    if domain_uid is not None:
+        statement = statement.where(TransactionHistory.domainUid == domain_uid)
+    if params.status is not None:
+        statement = statement.where(TransactionHistory.status == params.status)
+    if params.transactionType is not None:
+        statement = statement.where(TransactionHistory.transactionType == params.transactionType)
+    if params.method is not None:
+        statement = statement.where(TransactionHistory.method == params.method)
+    if params.createdAfter is not None:
+        statement = statement.where(TransactionHistory.createdAt >= params.createdAfter)
+    if params.createdBefore is not None:
+        statement = statement.where(TransactionHistory.createdAt < params.createdBefore)
+
+    statement = after_cursor(
+        statement, TransactionHistory.createdAt, TransactionHistory.uid, decode_cursor(params.cursor)
+    )
+    return statement.limit(params.limit + 1)
+
+
+class TransactionService:
+    async def list_transactions(
+        self,
+        payer_uid: uuid.UUID,
+        params: TransactionListParams,
+        session: AsyncSession,
+        domain_uid: Optional[uuid.UUID] = None,
+    ):
+        """One page of a payer's transactions, newest first."""
+        db_result = await session.exec(transaction_list_statement(payer_uid, params, domain_uid))
+        transactions, next_cursor = paginate(db_result.all(), params.limit)
+        return {"transactions": transactions, "nextCursor": next_cursor}
@@ -0,0 +1,29 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.celery_tasks import celery_app
+from src.config.settings import Config
+from src.db.partitions import TRANSACTIONS_TABLE, archive_partitions, ensure_monthly_partitions
+
+
+async def _maintain_transaction_partitions():
+    # Each task run gets its own event loop, pooled asyncpg connections cannot outlive it
+    engine = create_async_engine(Config.DATABASE_URL, poolclass=NullPool)
+    try:
+        created = await ensure_monthly_partitions(engine, TRANSACTIONS_TABLE, Config.TRANSACTION_PARTITIONS_AHEAD)
+        archived = []
+        if Config.TRANSACTION_RETENTION_MONTHS is not None:
+            archived = await archive_partitions(
+                engine, TRANSACTIONS_TABLE, Config.TRANSACTION_RETENTION_MONTHS, Config.PARTITION_ARCHIVE_SCHEMA
+            )
+        return {"created": created, "archived": archived}
+    finally:
+        await engine.dispose()
+
+
+@celery_app.task(name="transactions.maintain_partitions")
+def maintain_transaction_partitions():
+    """Creates the upcoming monthly partitions and archives the expired ones."""
+    return asyncio.run(_maintain_transaction_partitions())
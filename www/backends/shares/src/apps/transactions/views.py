@@ -0,0 +1,59 @@
+import uuid
+
+from fastapi import APIRouter, status
+from sqlmodel import select
+
+from src.apps.accounts.dependencies import (
+    read_db_dependency,
+    read_tenant_admin_dependency,
+    read_user_dependency,
+    tenant_admin_dependency,
+    tenant_dependency,
+)
+from src.apps.transactions.dependencies import transaction_list_params_dependency
+from src.apps.transactions.schemas import TransactionHistoryPage, transaction_history_page_serializer
+from src.apps.transactions.services import TransactionService
+from src.db.models import TransactionHistory
+from src.utils.exports import ExportFormat, export_response
+
+transaction_service = TransactionService()
+transactions_router = APIRouter()
+
+
+@transactions_router.get("", status_code=status.HTTP_200_OK, response_model=TransactionHistoryPage)
+async def my_transactions(
+    user: read_user_dependency, params: transaction_list_params_dependency, session: read_db_dependency
+):
+    """
+    Transaction history of the signed in user, newest first.
+
+    Pass `nextCursor` from a response as `cursor` to get the following page, it is null on the last one.
+    """
+    page = await transaction_service.list_transactions(user.uid, params, session)
+    return transaction_history_page_serializer.response(page)
+
+
+@transactions_router.get("/users/{user_uid}", status_code=status.HTTP_200_OK, response_model=TransactionHistoryPage)
+async def user_transactions(
+    user_uid: uuid.UUID,
+    tenant: tenant_dependency,
+    admin: read_tenant_admin_dependency,
+    params: transaction_list_params_dependency,
+    session: read_db_dependency,
+):
+    """
+    Transaction history of a user on the tenant, for its owner. Paginated like `GET /transactions`,
+    transactions made on other tenants are left out.
+    """
+    page = await transaction_service.list_transactions(user_uid, params, session, domain_uid=tenant.uid)
+    return transaction_history_page_serializer.response(page)
+
+
+@transactions_router.get("/export", status_code=status.HTTP_200_OK)
+async def export_transactions(
+    tenant: tenant_dependency, admin: tenant_admin_dependency, format: ExportFormat = "ndjson", gzip: bool = False
+):
+    """Every transaction of the tenant as an NDJSON or CSV download, streamed. `gzip=true` compresses it."""
+    table = TransactionHistory.__table__
+    statement = select(table).where(table.c.domainUid == tenant.uid)
+    return export_response(statement, "transactions", format, gzip)
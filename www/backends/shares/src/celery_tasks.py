@@ -15,3 +15,19 @@ celery_app.config_from_object(Config)
 celery_app.autodiscover_tasks(packages=['src.apps.accounts', 'src.apps.portfolios', 'src.apps.analytics', 'src.apps.transactions'], related_name='tasks')
 
 
+celery_app.conf.beat_schedule = {
+    "maintain-transaction-partitions": {
+        "task": "transactions.maintain_partitions",
+        "schedule": 24 * 60 * 60,
+    },
+    "persist-analytics-rollups": {
+        "task": "analytics.persist_rollups",
+        "schedule": 5 * 60,
+    },
+    "publish-price-ticks": {
+        "task": "portfolios.publish_price_ticks",
+        "schedule": Config.PRICE_TICK_INTERVAL,
+        # A tick that could not run in time is superseded by the next one
+        "options": {"expires": Config.PRICE_TICK_INTERVAL},
+    },
+}
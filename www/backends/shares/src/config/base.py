@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 BASE_URL = Path(__file__).resolve().parent.parent.parent
@@ -18,6 +18,113 @@ class BaseConfig(BaseSettings):
     CLOUDINARY_SECRET: str
     CLOUDINARY_URL: str
 
+    # Database connection pool (per worker). DB_POOL_PREWARM defaults to DB_POOL_SIZE, set
+    # DB_TRANSACTION_POOLER behind PgBouncer (or any pooler) running in transaction mode.
+    DB_ECHO: Optional[bool] = False
+    DB_POOL_SIZE: Optional[int] = 10
+    DB_MAX_OVERFLOW: Optional[int] = 10
+    DB_POOL_TIMEOUT: Optional[float] = 10.0
+    DB_POOL_RECYCLE: Optional[int] = 1800
+    DB_POOL_PRE_PING: Optional[bool] = True
+    DB_POOL_PREWARM: Optional[int] = None
+    DB_CONNECT_TIMEOUT: Optional[float] = 10.0
+    DB_COMMAND_TIMEOUT: Optional[float] = 60.0
+    DB_TRANSACTION_POOLER: Optional[bool] = False
+
+    # Read replicas (DATABASE_REPLICA_URLS). Replicas lagging more than REPLICA_MAX_LAG_SECONDS
+    # are skipped, clients that wrote read from the primary for READ_YOUR_WRITES_SECONDS.
+    REPLICA_MAX_LAG_SECONDS: Optional[float] = 5.0
+    REPLICA_LAG_CHECK_INTERVAL: Optional[float] = 5.0
+    READ_YOUR_WRITES_SECONDS: Optional[int] = 10
+
+    # Transactions are partitioned by month. TRANSACTION_PARTITIONS_AHEAD months are created
+    # in advance, partitions older than TRANSACTION_RETENTION_MONTHS (None keeps everything)
+    # are detached into PARTITION_ARCHIVE_SCHEMA.
+    TRANSACTION_PARTITIONS_AHEAD: Optional[int] = 3
+    TRANSACTION_RETENTION_MONTHS: Optional[int] = None
+    PARTITION_ARCHIVE_SCHEMA: Optional[str] = "archive"
+
+    # Logging. LOG_JSON defaults to True in production. 2xx/3xx access logs are sampled
+    # with ACCESS_LOG_SAMPLE_RATE, 4xx/5xx and unhandled errors are always logged.
+    LOG_JSON: Optional[bool] = None
+    LOG_QUEUE_SIZE: Optional[int] = 10000
+    ACCESS_LOG_SAMPLE_RATE: Optional[float] = 1.0
+
+    # Bearer token required by the metrics scrape endpoints. Unset, they only answer when ENVIRONMENT is local
+    METRICS_TOKEN: Optional[str] = None
+
+    # Request profiling. Admins can profile one request with `X-Profile: 1` or `?profile=1`,
+    # PROFILE_SAMPLE_RATE profiles that fraction of all requests (0 disables it).
+    PROFILE_SAMPLE_RATE: Optional[float] = 0.0
+    PROFILE_INTERVAL: Optional[float] = 0.001
+    PROFILES_DIR: Optional[Path] = None
+    PROFILES_MAX_KEPT: Optional[int] = 200
+
+    # Per-route RSS deltas and ORM identity map sizes, see src/utils/memory.py
+    MEMORY_TRACKING_ENABLED: Optional[bool] = False
+
+    # Seconds a worker serves its copy of a tenant's public content before checking Redis again
+    PUBLIC_CONTENT_LOCAL_TTL: Optional[float] = 2.0
+
+    # Tenant resolution from the `Domain` header. Unknown domains are cached for a shorter time
+    TENANT_CACHE_TTL: Optional[int] = 300
+    TENANT_NEGATIVE_CACHE_TTL: Optional[int] = 30
+    TENANT_LOCAL_TTL: Optional[float] = 10.0
+
+    # Uploads. MEDIA_STORAGE is "cloudinary" or "local" (files under MEDIA_ROOT, served at MEDIA_URL)
+    MEDIA_STORAGE: Optional[str] = "cloudinary"
+    MEDIA_ROOT: Optional[str] = "media"
+    MEDIA_URL: Optional[str] = "/media"
+    UPLOAD_MAX_BYTES: Optional[int] = 10 * 1024 * 1024
+    UPLOAD_CONCURRENCY: Optional[int] = 16
+    IMAGE_PROCESS_WORKERS: Optional[int] = 2
+    IMAGE_MAX_DIMENSION: Optional[int] = 1600
+    IMAGE_QUALITY: Optional[int] = 82
+
+    # Page view ingestion. Buffered events are written with COPY once ANALYTICS_BATCH_SIZE are
+    # waiting or every ANALYTICS_FLUSH_INTERVAL seconds. Past ANALYTICS_MAX_PENDING new events
+    # are refused with a 503. A batch failing ANALYTICS_MAX_FLUSH_ATTEMPTS flushes in a row is dropped.
+    ANALYTICS_BATCH_SIZE: Optional[int] = 2000
+    ANALYTICS_FLUSH_INTERVAL: Optional[float] = 2.0
+    ANALYTICS_MAX_PENDING: Optional[int] = 50000
+    ANALYTICS_MAX_FLUSH_ATTEMPTS: Optional[int] = 30
+    ANALYTICS_MAX_EVENTS_PER_REQUEST: Optional[int] = 500
+    # Upper bounds of a single event, larger values are refused rather than stored
+    ANALYTICS_MAX_CLICKS_PER_EVENT: Optional[int] = 100
+    ANALYTICS_MAX_DWELL_SECONDS: Optional[int] = 86400
+    # Decompressed size limit of a columnar event batch
+    ANALYTICS_MAX_BATCH_BYTES: Optional[int] = 512 * 1024
+    # Seconds the live Redis counters of a day are kept, they are persisted every few minutes
+    ANALYTICS_ROLLUP_TTL: Optional[int] = 3 * 86400
+
+    # Portfolio CSV imports, parsed and copied to the staging table PORTFOLIO_IMPORT_CHUNK_ROWS at a time
+    PORTFOLIO_IMPORT_MAX_BYTES: Optional[int] = 20 * 1024 * 1024
+    PORTFOLIO_IMPORT_CHUNK_ROWS: Optional[int] = 5000
+    PORTFOLIO_IMPORT_TTL: Optional[int] = 86400
+    # Uploads wait here for the Celery worker, which must see the same directory
+    PORTFOLIO_IMPORT_DIR: Optional[str] = "imports"
+
+    # Live valuations over WebSocket, see src/apps/portfolios/live.py
+    LIVE_PUSH_INTERVAL: Optional[float] = 0.25
+    LIVE_SEND_TIMEOUT: Optional[float] = 5.0
+    LIVE_MAX_CONNECTIONS: Optional[int] = 20000
+    # Seconds between two price fetches of the tick publisher, see src/apps/portfolios/ticks.py
+    PRICE_TICK_INTERVAL: Optional[float] = 15.0
+    # Seconds a run of the tick publisher holds its lease at most, should it die without releasing it
+    PRICE_TICK_LEASE_TTL: Optional[int] = 120
+
+    # Price alerts, see src/apps/portfolios/alerts.py
+    PRICE_ALERTS_MAX_PER_USER: Optional[int] = 100
+    PRICE_ALERTS_FLUSH_INTERVAL: Optional[float] = 0.5
+    PRICE_ALERTS_BATCH_SIZE: Optional[int] = 1000
+
+    # Rate limiting, limits are written as "<requests>/<second|minute|hour|day>"
+    RATE_LIMIT_ENABLED: Optional[bool] = True
+    RATE_LIMIT_DEFAULT: Optional[str] = "120/minute"
+    RATE_LIMIT_ROUTES: Optional[Dict[str, str]] = {}
+    # Proxies (addresses or CIDR ranges) whose X-Forwarded-For is trusted, see src/utils/network.py
+    FORWARDED_ALLOW_IPS: Optional[List[str]] = ["127.0.0.1", "10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"]
+
     model_config = SettingsConfigDict(
         env_file=".env",
         extra="ignore",
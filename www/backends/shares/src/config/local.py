@@ -1,9 +1,13 @@
+from typing import List
+
 from .base import BaseConfig
 from pydantic_settings import SettingsConfigDict
 
 
 class LocalConfig(BaseConfig):
     DATABASE_URL: str
+    # JSON list of read replica URLs, e.g. '["postgresql+asyncpg://...@replica-1/nextstocks"]'
+    DATABASE_REPLICA_URLS: List[str] = []
     REDIS_URL: str = "redis://localhost:6379/0"
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
@@ -1,8 +1,37 @@
+"""
+Image upload pipeline.
+
+1. The `UploadFile` is streamed to a temporary file in chunks, enforcing `UPLOAD_MAX_BYTES`
+   without holding the whole file in memory.
+2. Pillow decodes, orients, downsizes and re-encodes it (WEBP, metadata stripped) in a
+   process pool so the CPU work never runs on the event loop.
+3. The result is handed to the configured storage backend. Uploads run in a dedicated
+   thread pool, at most `UPLOAD_CONCURRENCY` at a time per worker.
+
+PDF documents skip step 2 and are stored as they are.
+
+`MEDIA_STORAGE=local` stores files under `MEDIA_ROOT` instead of Cloudinary, and tests can
+install any backend with `set_storage`.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
 import cloudinary
-from cloudinary.uploader import upload # type: ignore
-from fastapi import HTTPException, status, UploadFile
-from fastapi.responses import JSONResponse
+from cloudinary.uploader import upload  # type: ignore
+from fastapi import UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
 from src.config.settings import Config
+from src.errors import ImageTooLarge, InvalidImage
+from src.utils.logger import LOGGER
 
 cloudinary.config(
     cloud_name=Config.CLOUDINARY_CLOUD_NAME,
@@ -10,13 +39,176 @@ cloudinary.config(
     api_secret=Config.CLOUDINARY_SECRET,
 )
 
-async def upload_image(image: UploadFile):
-    try:
-        upload_result = upload(image.file)
-        file_url = upload_result["secure_url"]
-        return file_url
-    except Exception as e:
-        raise JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content=f"Error uploading images: {e}"
+CHUNK_SIZE = 1024 * 1024
+IMAGE_FORMAT = "WEBP"
+IMAGE_EXTENSION = ".webp"
+PDF_SIGNATURE = b"%PDF-"
+PDF_EXTENSION = ".pdf"
+# Refuse images that would decode to more than this many pixels (decompression bombs)
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+def process_image(source: str, target: str, max_dimension: int, quality: int) -> Tuple[int, int]:
+    """Runs in the process pool. Returns the size of the written image."""
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        # Saving without `exif=` drops the metadata (camera, GPS) of the original
+        image.save(target, IMAGE_FORMAT, quality=quality, method=4)
+        return image.size
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    async def save(self, path: str, folder: str, name: str, extension: str = IMAGE_EXTENSION) -> str:
+        """Stores the file at `path` and returns its public URL."""
+
+
+class CloudinaryStorage(StorageBackend):
+    async def save(self, path: str, folder: str, name: str, extension: str = IMAGE_EXTENSION) -> str:
+        # The Cloudinary SDK is synchronous. Its own pool keeps slow uploads from starving
+        # the default executor that `asyncio.to_thread` shares with everything else.
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            get_upload_executor(),
+            functools.partial(upload, path, folder=folder, public_id=name, overwrite=True, resource_type="auto"),
+        )
+        return result["secure_url"]
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _copy(self, path: str, folder: str, filename: str) -> None:
+        directory = os.path.join(self.root, folder)
+        os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(path, os.path.join(directory, filename))
+
+    async def save(self, path: str, folder: str, name: str, extension: str = IMAGE_EXTENSION) -> str:
+        filename = f"{name}{extension}"
+        await asyncio.to_thread(self._copy, path, folder, filename)
+        return f"{self.base_url}/{folder}/{filename}"
+
+
+_storage: Optional[StorageBackend] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_upload_executor: Optional[ThreadPoolExecutor] = None
+_upload_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        if Config.MEDIA_STORAGE == "local":
+            _storage = LocalStorage(Config.MEDIA_ROOT, Config.MEDIA_URL)
+        else:
+            _storage = CloudinaryStorage()
+    return _storage
+
+
+def set_storage(storage: Optional[StorageBackend]) -> None:
+    """Replaces the storage backend, None goes back to the configured one."""
+    global _storage
+    _storage = storage
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    # Created on first use so every gunicorn worker gets its own pool after forking. The children
+    # come from a fork server: forking this process would copy the locks held by its event loop,
+    # Redis pool and log writer thread into them, and deadlock
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=Config.IMAGE_PROCESS_WORKERS, mp_context=multiprocessing.get_context("forkserver")
         )
+    return _process_pool
+
+
+def get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+    if _upload_executor is None:
+        _upload_executor = ThreadPoolExecutor(max_workers=Config.UPLOAD_CONCURRENCY, thread_name_prefix="upload")
+    return _upload_executor
+
+
+def shutdown_upload_pools() -> None:
+    global _process_pool, _upload_executor
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _upload_executor is not None:
+        _upload_executor.shutdown(wait=False, cancel_futures=True)
+        _upload_executor = None
+
+
+def _upload_slots() -> asyncio.Semaphore:
+    global _upload_semaphore
+    if _upload_semaphore is None:
+        _upload_semaphore = asyncio.Semaphore(Config.UPLOAD_CONCURRENCY)
+    return _upload_semaphore
+
+
+def _discard(*paths: str) -> None:
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(image: UploadFile, path: str) -> int:
+    """Copies the upload to `path` chunk by chunk. Returns the number of bytes written."""
+    written = 0
+    with open(path, "wb") as target:
+        while chunk := await image.read(CHUNK_SIZE):
+            written += len(chunk)
+            if written > Config.UPLOAD_MAX_BYTES:
+                raise ImageTooLarge()
+            await asyncio.to_thread(target.write, chunk)
+    return written
+
+
+async def upload_image(image: UploadFile, folder: str = "uploads") -> str:
+    """Validates, resizes and stores an uploaded image. Returns its URL."""
+    fd, source = tempfile.mkstemp(prefix="upload-")
+    os.close(fd)
+    target = f"{source}{IMAGE_EXTENSION}"
+    try:
+        if await spool_upload(image, source) == 0:
+            raise InvalidImage()
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                get_process_pool(), process_image, source, target, Config.IMAGE_MAX_DIMENSION, Config.IMAGE_QUALITY
+            )
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+            LOGGER.warning(f"Rejected upload {image.filename!r}: {e}")
+            raise InvalidImage()
+
+        async with _upload_slots():
+            return await get_storage().save(target, folder, uuid.uuid4().hex)
+    finally:
+        await asyncio.to_thread(_discard, source, target)
+
+
+async def upload_document(document: UploadFile, folder: str = "documents") -> str:
+    """Stores a KYC document. Images go through `upload_image`, PDFs are kept as they are."""
+    head = await document.read(len(PDF_SIGNATURE))
+    await document.seek(0)
+    if head != PDF_SIGNATURE:
+        return await upload_image(document, folder)
+
+    fd, source = tempfile.mkstemp(prefix="upload-")
+    os.close(fd)
+    try:
+        await spool_upload(document, source)
+        async with _upload_slots():
+            return await get_storage().save(source, folder, uuid.uuid4().hex, PDF_EXTENSION)
+    finally:
+        await asyncio.to_thread(_discard, source)
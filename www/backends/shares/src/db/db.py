@@ -1,25 +1,339 @@
-from sqlalchemy.orm import sessionmaker
+"""
+Database engines, session factories and connection pool telemetry.
+
+The engine and the session factory are created once per process. Pool sizing and
+timeouts come from `Config` (`DB_*`). Checkout wait times feed the `db_pool_wait_seconds`
+histogram and pool events keep `db_pool_checked_out` / `db_pool_capacity` gauges current,
+so saturation is `db_pool_checked_out / db_pool_capacity`.
+
+With `DB_TRANSACTION_POOLER` (PgBouncer or similar in transaction mode) asyncpg's prepared
+statement caches are disabled and statements get unique names, since consecutive
+transactions may land on different server connections.
+
+Read replicas (`DATABASE_REPLICA_URLS`) get their own engines. `get_read_session` hands
+out a session on a healthy replica in round-robin order. Replicas lagging more than
+`REPLICA_MAX_LAG_SECONDS` are skipped until they catch up. A client whose request wrote
+to the primary reads from the primary for `READ_YOUR_WRITES_SECONDS`, so it always sees
+its own changes.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
 from sqlmodel import SQLModel  # , create_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
+
 from src.config.settings import Config
+from src.db.migrations import apply_migrations
+from src.db.partitions import TRANSACTIONS_TABLE, ensure_monthly_partitions
+from src.db.redis import redis_client
+from src.errors import DatabaseUnavailable
+from src.utils.hashing import bearer_user_uid
+from src.utils.logger import LOGGER
+from src.utils.memory import MEMORY
+from src.utils.metrics import METRICS
+from src.utils.network import client_ip
+
+RECENT_WRITER_KEY = "db:recent_writer:{}"
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def _statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def build_engine(url: str, pool_name: str) -> AsyncEngine:
+    connect_args: dict = {"timeout": Config.DB_CONNECT_TIMEOUT, "command_timeout": Config.DB_COMMAND_TIMEOUT}
+    if Config.DB_TRANSACTION_POOLER:
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _statement_name,
+        })
+
+    engine = create_async_engine(
+        url=url,
+        echo=Config.DB_ECHO,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_recycle=Config.DB_POOL_RECYCLE,
+        pool_pre_ping=Config.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    _instrument_pool(engine, pool_name)
+    return engine
+
+
+def _instrument_pool(engine: AsyncEngine, pool_name: str) -> None:
+    pool = engine.sync_engine.pool
+    checked_out = f'db_pool_checked_out{{pool="{pool_name}"}}'
+    METRICS.set_gauge(f'db_pool_capacity{{pool="{pool_name}"}}', Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW)
+    METRICS.set_gauge(checked_out, 0)
+
+    @event.listens_for(pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        METRICS.inc_gauge(checked_out)
+
+    @event.listens_for(pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        METRICS.inc_gauge(checked_out, -1)
+
+
+def pool_status(engine: AsyncEngine) -> dict:
+    """Current state of this worker's pool."""
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checkedOut": pool.checkedout(),
+        "checkedIn": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "capacity": Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW,
+    }
+
+
+def _session_factory(engine: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+async_engine = build_engine(Config.DATABASE_URL, "primary")
+
+# The one session factory of the process, also used outside of requests
+async_session_factory = _session_factory(async_engine)
+
+
+class Replica:
+    __slots__ = ("name", "engine", "session_factory", "lag", "healthy", "checked_at")
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = build_engine(url, name)
+        self.session_factory = _session_factory(self.engine)
+        self.lag: Optional[float] = None
+        # Trusted until the first lag check says otherwise
+        self.healthy = True
+        self.checked_at: Optional[float] = None
+
+
+class ReplicaRouter:
+    """Picks the session factory for read-only work and keeps replica lag up to date."""
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(f"replica{index}", url) for index, url in enumerate(urls)]
+        self._next = itertools.count()
+        self._checker: Optional[asyncio.Task] = None
+        # client key -> monotonic deadline, saves the Redis lookup for this worker's own writers
+        self._recent_writers: Dict[str, float] = {}
+
+    # Read-your-writes
+    def remember_writer(self, client: str) -> None:
+        """Pins the client to the primary, in this worker right away and in the others via Redis."""
+        now = time.monotonic()
+        self._recent_writers[client] = now + Config.READ_YOUR_WRITES_SECONDS
+        if len(self._recent_writers) > 10000:
+            self._recent_writers = {k: v for k, v in self._recent_writers.items() if v > now}
+        asyncio.get_running_loop().create_task(self._publish_writer(client))
+
+    async def _publish_writer(self, client: str) -> None:
+        try:
+            await redis_client.set(RECENT_WRITER_KEY.format(client), 1, ex=Config.READ_YOUR_WRITES_SECONDS)
+        except Exception as e:
+            LOGGER.warning(f"Unable to record recent writer: {e}")
 
-async_engine = create_async_engine(url=Config.DATABASE_URL, echo=True)
+    async def is_recent_writer(self, client: str) -> bool:
+        deadline = self._recent_writers.get(client)
+        if deadline is not None and deadline > time.monotonic():
+            return True
+        try:
+            return bool(await redis_client.exists(RECENT_WRITER_KEY.format(client)))
+        except Exception:
+            # Without Redis we cannot tell, the primary is always consistent
+            return True
+
+    # Routing
+    def pick(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    async def route(self, client: Optional[str]) -> Optional[Replica]:
+        """The replica for a read, None when it must go to the primary."""
+        if not self.replicas:
+            return None
+        if client is not None and await self.is_recent_writer(client):
+            return None
+        return self.pick()
+
+    # Lag
+    async def check_lag(self) -> None:
+        for replica in self.replicas:
+            error = None
+            try:
+                async with replica.engine.connect() as connection:
+                    lag = await asyncio.wait_for(connection.scalar(REPLICA_LAG_QUERY), Config.REPLICA_LAG_CHECK_INTERVAL)
+                replica.lag = float(lag or 0)
+                healthy = replica.lag <= Config.REPLICA_MAX_LAG_SECONDS
+            except Exception as e:
+                replica.lag = None
+                healthy = False
+                error = e
+            # Only state changes are logged, not every check
+            if healthy != replica.healthy:
+                reason = f"check failed: {error!r}" if error else f"lag: {replica.lag}s"
+                LOGGER.warning(f"Replica {replica.name} is now {'healthy' if healthy else 'unhealthy'} ({reason})")
+            replica.healthy = healthy
+            replica.checked_at = time.time()
+
+    async def _check_forever(self) -> None:
+        while True:
+            await self.check_lag()
+            await asyncio.sleep(Config.REPLICA_LAG_CHECK_INTERVAL)
+
+    def start(self) -> None:
+        if self.replicas and self._checker is None:
+            self._checker = asyncio.create_task(self._check_forever())
+
+    async def stop(self) -> None:
+        if self._checker is not None:
+            self._checker.cancel()
+            self._checker = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def status(self) -> List[dict]:
+        return [
+            {
+                "name": replica.name,
+                "healthy": replica.healthy,
+                "lagSeconds": replica.lag,
+                "checkedAt": replica.checked_at,
+                "pool": pool_status(replica.engine),
+            }
+            for replica in self.replicas
+        ]
+
+
+replica_router = ReplicaRouter(Config.DATABASE_REPLICA_URLS or [])
+
+
+# Read-your-writes. Request sessions carry the client key; a commit after a flush with
+# changes, or after an ORM-enabled INSERT/UPDATE/DELETE, pins that client to the primary.
+@event.listens_for(Session, "after_flush")
+def _flag_flush_write(session: Session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_statement_write(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _pin_writer_to_primary(session: Session) -> None:
+    client = session.info.get("client")
+    if session.info.pop("wrote", False) and client and replica_router.replicas:
+        replica_router.remember_writer(client)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_write_flag(session: Session) -> None:
+    session.info.pop("wrote", None)
+
+
+def client_key(request: Request) -> str:
+    """The user behind a bearer token, else the client address."""
+    user_uid = bearer_user_uid(request.headers.get("Authorization"))
+    if user_uid:
+        return f"user:{user_uid}"
+    return f"ip:{client_ip(request)}"
 
 
 async def init_db() -> None:
     async with async_engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+    await apply_migrations(async_engine)
+    await ensure_monthly_partitions(async_engine, TRANSACTIONS_TABLE, Config.TRANSACTION_PARTITIONS_AHEAD)
+    await asyncio.gather(
+        prewarm_pool(async_engine, Config.DB_POOL_PREWARM),
+        *(prewarm_pool(replica.engine, Config.DB_POOL_PREWARM) for replica in replica_router.replicas),
+    )
 
 
-async def get_session() -> AsyncSession:  # type: ignore
-    Session = sessionmaker(
-        bind=async_engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-        autoflush=False,
-        autocommit=False,
-    )
+async def prewarm_pool(engine: AsyncEngine, count: Optional[int]) -> None:
+    """Opens `count` connections (default: the pool size) so first requests skip the handshake."""
+    count = min(Config.DB_POOL_SIZE if count is None else count, Config.DB_POOL_SIZE)
+    if count <= 0:
+        return
+
+    async def _open():
+        connection = await engine.connect()
+        await connection.execute(text("SELECT 1"))
+        return connection
+
+    connections = await asyncio.gather(*(_open() for _ in range(count)), return_exceptions=True)
+    failed = [c for c in connections if isinstance(c, BaseException)]
+    for connection in connections:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    if failed:
+        LOGGER.warning(f"Pre-warmed {count - len(failed)} of {count} database connections: {failed[0]!r}")
+
+
+@asynccontextmanager
+async def _session_scope(session_factory: async_sessionmaker, pool_name: str) -> AsyncIterator[AsyncSession]:
+    async with session_factory() as session:
+        # Check out the connection up front so the time spent waiting on the pool is measured
+        started = time.perf_counter()
+        try:
+            await session.connection()
+        except PoolTimeoutError:
+            METRICS.inc_gauge(f'db_pool_timeouts{{pool="{pool_name}"}}')
+            raise DatabaseUnavailable()
+        finally:
+            METRICS.observe_pool_wait(pool_name, time.perf_counter() - started)
+
+        if not Config.MEMORY_TRACKING_ENABLED:
+            yield session
+            return
+
+        MEMORY.track_session(session)
+        try:
+            yield session
+        finally:
+            MEMORY.release_session(session)
+
+
+async def get_session(request: Request) -> AsyncSession:  # type: ignore
+    async with _session_scope(async_session_factory, "primary") as session:
+        session.info["client"] = client_key(request)
+        yield session
+
 
-    async with Session() as session:
+async def get_read_session(request: Request) -> AsyncSession:  # type: ignore
+    """
+    A session for read-only work, on a replica when one is healthy and the client did not
+    write recently. Never write through it.
+    """
+    replica = await replica_router.route(client_key(request))
+    if replica is None:
+        async with _session_scope(async_session_factory, "primary") as session:
+            yield session
+        return
+    async with _session_scope(replica.session_factory, replica.name) as session:
         yield session
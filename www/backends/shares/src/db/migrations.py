@@ -0,0 +1,169 @@
+"""
+Schema changes `SQLModel.metadata.create_all` cannot make on an existing database.
+
+`create_all` only creates missing tables, so indexes added to a model's `__table_args__`
+never reach a database created before them. Each migration here brings an existing
+database in line and is idempotent (`IF NOT EXISTS`), so it is a no-op on fresh
+databases where `create_all` already built the same objects.
+
+Migrations run once, in order, from `init_db`. They are recorded in `schema_migrations`
+and serialized across workers with an advisory lock. A migration whose `preflight` query
+finds rows it cannot run with is skipped with a warning and retried on the next start, so
+bad data needs a manual fix instead of stopping every worker from booting. Non-transactional migrations run in
+autocommit mode, which `CREATE INDEX CONCURRENTLY` needs so it does not block writes while
+it builds.
+"""
+import re
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.utils.logger import LOGGER
+
+# Arbitrary key for pg_advisory_lock, shared by every worker running migrations
+MIGRATIONS_LOCK_ID = 7_301_947_226
+
+
+class Migration(NamedTuple):
+    name: str
+    statements: Tuple[str, ...]
+    transactional: bool = True
+    # Counts the rows blocking the migration, it only runs at 0
+    preflight: Optional[str] = None
+
+
+# Holdings a user has twice. Merge or delete them by hand, then restart to build the index.
+DUPLICATE_HOLDINGS_SQL = (
+    'SELECT count(*) FROM (SELECT 1 FROM portfolio WHERE "userUid" IS NOT NULL '
+    'GROUP BY "userUid", "assetSymbol" HAVING count(*) > 1) AS duplicates'
+)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        "0001_hot_lookup_indexes",
+        (
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_known_ips_user_ip ON known_ips ("userUid", ip)',
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_domains_user_domain ON domains ("userUid", domain)',
+            # Tenant resolution looks domains up without a user
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_domains_domain ON domains (domain)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_payer_created "
+            'ON transactions ("payerUid", "createdAt", uid)',
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_portfolio_user_symbol ON portfolio ("userUid", "assetSymbol")',
+        ),
+        transactional=False,
+    ),
+    # 0002 partitioned existing transactions tables here. It locked the table for the whole
+    # copy, so it is now a one-off command: `python -m src.db.partitions attach-legacy`.
+    Migration(
+        "0003_analytics_domain_pathname",
+        (
+            'ALTER TABLE analytics ADD COLUMN IF NOT EXISTS "domainUid" UUID REFERENCES domains (uid)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_analytics_domain_pathname ON analytics ("domainUid", pathname)',
+        ),
+    ),
+    Migration(
+        "0004_page_view_indexes",
+        (
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_page_views_analytics_date ON page_views ("analyticsUid", date)',
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_page_views_buttons_clicked "
+            'ON page_views USING gin ("buttonsClicked")',
+        ),
+        transactional=False,
+    ),
+    # Portfolio imports need this index and fail until it exists
+    Migration(
+        "0005_unique_portfolio_user_symbol",
+        (
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_portfolio_user_symbol "
+            'ON portfolio ("userUid", "assetSymbol")',
+            # Superseded by the unique index
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_portfolio_user_symbol",
+        ),
+        transactional=False,
+        preflight=DUPLICATE_HOLDINGS_SQL,
+    ),
+    # Partial indexes an earlier 0001 built. No query filters on them, they only slowed writes
+    # down. Plain DROP INDEX, CONCURRENTLY is refused on the partitioned transactions table.
+    Migration(
+        "0006_drop_unused_partial_indexes",
+        (
+            "DROP INDEX IF EXISTS ix_transactions_pending_created",
+            "DROP INDEX IF EXISTS ix_transactions_legacy_pending_created",
+            "DROP INDEX IF EXISTS ix_subscription_confirmed_expiry",
+        ),
+    ),
+]
+
+CONCURRENT_INDEX = re.compile(r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
+
+
+async def apply_migrations(engine: AsyncEngine) -> List[str]:
+    """Applies the pending migrations and returns their names."""
+    applied_now: List[str] = []
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+        try:
+            await connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "name VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+            ))
+            applied = set((await connection.execute(text("SELECT name FROM schema_migrations"))).scalars())
+
+            for migration in MIGRATIONS:
+                if migration.name in applied:
+                    continue
+                if migration.preflight is not None:
+                    blocking = (await connection.execute(text(migration.preflight))).scalar()
+                    if blocking:
+                        LOGGER.warning(
+                            f"Skipped migration {migration.name}: its preflight found {blocking} rows to fix by hand"
+                        )
+                        continue
+                LOGGER.info(f"Applying migration {migration.name}")
+                if migration.transactional:
+                    await connection.execute(text("BEGIN"))
+                try:
+                    for statement in migration.statements:
+                        if await _index_exists(connection, statement):
+                            continue
+                        await connection.execute(text(statement))
+                    await connection.execute(
+                        text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                        {"name": migration.name, "applied_at": datetime.utcnow()},
+                    )
+                    if migration.transactional:
+                        await connection.execute(text("COMMIT"))
+                except Exception:
+                    if migration.transactional:
+                        await connection.execute(text("ROLLBACK"))
+                    raise
+                applied_now.append(migration.name)
+        finally:
+            await connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+    return applied_now
+
+
+async def _index_exists(connection: AsyncConnection, statement: str) -> bool:
+    """
+    True for a `CREATE [UNIQUE] INDEX CONCURRENTLY IF NOT EXISTS` whose index is already there.
+    Postgres refuses CONCURRENTLY on partitioned tables before it looks at IF NOT EXISTS.
+
+    An interrupted or failed concurrent build leaves an invalid index behind that IF NOT
+    EXISTS would keep, it is dropped so the build starts over.
+    """
+    match = CONCURRENT_INDEX.match(statement)
+    if match is None:
+        return False
+    result = await connection.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": match.group(1)}
+    )
+    valid = result.scalar()
+    if valid is False:
+        LOGGER.warning(f"Rebuilding invalid index {match.group(1)}")
+        await connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{match.group(1)}"'))
+        return False
+    return bool(valid)
@@ -2,6 +2,7 @@ from datetime import date, datetime
 from decimal import Decimal
 from enum import Enum
 from pydantic import AnyHttpUrl, EmailStr, FileUrl, IPvAnyAddress
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field, Relationship, Column
 import sqlalchemy.dialects.postgresql as pg
 import uuid
@@ -11,6 +12,7 @@ from pydantic_extra_types.routing_number import ABARoutingNumber
 from pydantic_extra_types.payment import PaymentCardBrand, PaymentCardNumber
 
 from src.apps.accounts.enums import UserGender, UserMaritalStatus
+from src.apps.portfolios.enums import PriceAlertDirection
 from src.apps.transactions.enums import TransactionPaymentMethod, TransactionPaymentType, TransactionStatus
 
 # User Specific Models
@@ -119,6 +121,9 @@ class User(SQLModel, table=True):
 
 class KnownIps(SQLModel, table=True):
     __tablename__ = "known_ips"
+    __table_args__ = (
+        Index("ix_known_ips_user_ip", "userUid", "ip"),
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
@@ -139,6 +144,10 @@ class KnownIps(SQLModel, table=True):
 
 class KnownDomains(SQLModel, table=True):
     __tablename__ = "domains"
+    __table_args__ = (
+        Index("ix_domains_user_domain", "userUid", "domain"),
+        Index("ix_domains_domain", "domain"),
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
@@ -306,6 +315,10 @@ class Card(SQLModel, table=True):
 # Portfolio
 class Portfolio(SQLModel, table=True):
     __tablename__ = "portfolio"
+    __table_args__ = (
+        # One holding per asset and user, bulk imports upsert on it
+        Index("ux_portfolio_user_symbol", "userUid", "assetSymbol", unique=True),
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
@@ -349,6 +362,40 @@ class Portfolio(SQLModel, table=True):
     )
 
 
+class PriceAlert(SQLModel, table=True):
+    """Notifies a user once when the price of a held symbol crosses a threshold."""
+    __tablename__ = "price_alerts"
+    __table_args__ = (
+        # The alert engine loads only the pending alerts
+        Index("ix_price_alerts_pending", "assetSymbol", postgresql_where=text('"triggeredAt" IS NULL')),
+        Index("ix_price_alerts_user_created", "userUid", "createdAt"),
+    )
+
+    uid: uuid.UUID = Field(
+        sa_column=Column(
+            pg.UUID, primary_key=True, unique=True, nullable=False, default=uuid.uuid4
+        )
+    )
+
+    assetSymbol: str = Field(nullable=False)
+    # Above when the threshold was over the price at creation, the alert fires when the price rises to it
+    direction: PriceAlertDirection
+    threshold: Decimal = Field(decimal_places=6)
+    triggeredPrice: Optional[Decimal] = Field(default=None, decimal_places=6)
+    triggeredAt: Optional[datetime] = Field(default=None, sa_column=Column(pg.TIMESTAMP, nullable=True))
+
+    domainUid: Optional[uuid.UUID] = Field(default=None, foreign_key="domains.uid")
+    userUid: uuid.UUID = Field(foreign_key="users.uid")
+
+    createdAt: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(pg.TIMESTAMP, default=datetime.now),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PriceAlert {self.assetSymbol} {self.direction.value} {self.threshold}>"
+
+
 class Staking(SQLModel, table=True):
     __tablename__ = "staking"
 
@@ -444,6 +491,10 @@ class CopyTrading(SQLModel, table=True):
 # Analytics Model
 class Analytics(SQLModel, table=True):
     __tablename__ = "analytics"
+    __table_args__ = (
+        # One row per tenant page, page views are attached to it on ingestion
+        Index("ux_analytics_domain_pathname", "domainUid", "pathname", unique=True),
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
@@ -452,6 +503,7 @@ class Analytics(SQLModel, table=True):
     )
 
     pathname: str = Field(nullable=False)
+    domainUid: Optional[uuid.UUID] = Field(default=None, foreign_key="domains.uid")
     createdAt: datetime = Field(
         default_factory=datetime.utcnow,
         sa_column=Column(pg.TIMESTAMP, default=datetime.now),
@@ -468,6 +520,11 @@ class Analytics(SQLModel, table=True):
 
 class PageView(SQLModel, table=True):
     __tablename__ = "page_views"
+    __table_args__ = (
+        Index("ix_page_views_analytics_date", "analyticsUid", "date"),
+        # Containment queries (`"buttonsClicked" @> ARRAY[...]`) on the array
+        Index("ix_page_views_buttons_clicked", "buttonsClicked", postgresql_using="gin"),
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
@@ -476,7 +533,8 @@ class PageView(SQLModel, table=True):
     )
 
     ip: str = Field(nullable=False)
-    buttonsClicked: List[str] = Field(default=[])  # Track buttons clicked
+    # Track buttons clicked
+    buttonsClicked: List[str] = Field(default=[], sa_column=Column(pg.ARRAY(pg.VARCHAR), nullable=False, default=list))
     timeSpentInSeconds: int = Field(default=0)  # Store time spent in seconds
     date: datetime = Field(default_factory=datetime.utcnow, sa_column=Column(pg.DATE, nullable=False))
 
@@ -488,6 +546,61 @@ class PageView(SQLModel, table=True):
         return f"<PageView {self.ip} - {self.date}>"
 
 
+class PageViewDailyRollup(SQLModel, table=True):
+    """
+    Views and unique visitors of a page per day, persisted from the Redis counters.
+
+    Serves a day's dashboard once its Redis counters expire. Unique visitors (HyperLogLog)
+    exist nowhere else. Views duplicate `PageDwellDailyRollup.views`, the exact count, so a
+    past dashboard stays one table read; they can run behind it if Redis missed a batch.
+    """
+    __tablename__ = "page_view_daily_rollups"
+
+    domainUid: uuid.UUID = Field(sa_column=Column(pg.UUID, primary_key=True, nullable=False))
+    pathname: str = Field(sa_column=Column(pg.VARCHAR, primary_key=True, nullable=False))
+    day: date = Field(sa_column=Column(pg.DATE, primary_key=True, nullable=False))
+    views: int = Field(default=0)
+    uniqueVisitors: int = Field(default=0)
+    updatedAt: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column=Column(pg.TIMESTAMP, default=datetime.now),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PageViewDailyRollup {self.pathname} - {self.day}>"
+
+
+class PageDwellDailyRollup(SQLModel, table=True):
+    """
+    Page views and time spent per page per day, updated in the transaction of every ingested
+    batch, so its views are the exact count reports rely on.
+    """
+    __tablename__ = "page_dwell_daily_rollups"
+
+    domainUid: uuid.UUID = Field(sa_column=Column(pg.UUID, primary_key=True, nullable=False))
+    pathname: str = Field(sa_column=Column(pg.VARCHAR, primary_key=True, nullable=False))
+    day: date = Field(sa_column=Column(pg.DATE, primary_key=True, nullable=False))
+    views: int = Field(default=0, sa_column=Column(pg.BIGINT, nullable=False, default=0))
+    totalSeconds: int = Field(default=0, sa_column=Column(pg.BIGINT, nullable=False, default=0))
+
+    def __repr__(self) -> str:
+        return f"<PageDwellDailyRollup {self.pathname} - {self.day}>"
+
+
+class PageButtonDailyRollup(SQLModel, table=True):
+    """Clicks per button per page per day, updated with every ingested batch."""
+    __tablename__ = "page_button_daily_rollups"
+
+    domainUid: uuid.UUID = Field(sa_column=Column(pg.UUID, primary_key=True, nullable=False))
+    pathname: str = Field(sa_column=Column(pg.VARCHAR, primary_key=True, nullable=False))
+    day: date = Field(sa_column=Column(pg.DATE, primary_key=True, nullable=False))
+    button: str = Field(sa_column=Column(pg.VARCHAR, primary_key=True, nullable=False))
+    clicks: int = Field(default=0, sa_column=Column(pg.BIGINT, nullable=False, default=0))
+
+    def __repr__(self) -> str:
+        return f"<PageButtonDailyRollup {self.pathname} {self.button} - {self.day}>"
+
+
 # General Models
 class Testimonial(SQLModel, table=True):
     __tablename__ = "testimonials"
@@ -602,7 +715,6 @@ class Plans(SQLModel, table=True):
 
 class Subscription(SQLModel, table=True):
     __tablename__ = "investment_subscription"
-
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID, primary_key=True, unique=True, nullable=False, default=uuid.uuid4
@@ -642,10 +754,15 @@ class Subscription(SQLModel, table=True):
 
 class TransactionHistory(SQLModel, table=True):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_payer_created", "payerUid", "createdAt", "uid"),
+        # Monthly partitions are created by src.db.partitions, which also partitions older databases
+        {"postgresql_partition_by": 'RANGE ("createdAt")'},
+    )
 
     uid: uuid.UUID = Field(
         sa_column=Column(
-            pg.UUID, primary_key=True, unique=True, nullable=False, default=uuid.uuid4
+            pg.UUID, primary_key=True, nullable=False, default=uuid.uuid4
         )
     )
 
@@ -661,9 +778,10 @@ class TransactionHistory(SQLModel, table=True):
     payerUid: Optional[uuid.UUID] = Field(default=None, foreign_key="users.uid")
     payer: Optional[User] = Relationship(back_populates="transactions")
 
+    # Part of the primary key, a partitioned table's keys must include the partition column
     createdAt: datetime = Field(
         default_factory=datetime.utcnow,
-        sa_column=Column(pg.TIMESTAMP, default=datetime.now),
+        sa_column=Column(pg.TIMESTAMP, primary_key=True, nullable=False, default=datetime.now),
     )
     updatedAt: datetime = Field(
         default_factory=datetime.utcnow,
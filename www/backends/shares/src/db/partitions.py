@@ -0,0 +1,273 @@
+"""
+Monthly range partitions.
+
+`transactions` is partitioned on "createdAt", one partition per calendar month named
+`transactions_yYYYYmMM`. Partitions are created ahead of time (at startup and by the daily
+`maintain_transaction_partitions` task), so there is no default partition: a default
+partition would prevent detaching concurrently.
+
+Retention never DELETEs rows. Months older than the retention window are detached
+(`DETACH PARTITION ... CONCURRENTLY`, which does not block reads or writes) and moved to
+the archive schema, where they can be dumped and dropped.
+
+Databases created before partitioning have a plain `transactions` table. It is converted
+once, by hand, with `python -m src.db.partitions attach-legacy` (see `attach_legacy_table`):
+the old table becomes the `transactions_legacy` partition holding every month up to the
+newest row, without copying rows or blocking writes for more than a catalog update. Until
+then partition maintenance skips the table. The legacy partition is not archived, detach
+it by hand once its months are past the retention window.
+"""
+import argparse
+import asyncio
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.config.settings import Config
+from src.utils.logger import LOGGER
+
+TRANSACTIONS_TABLE = "transactions"
+PARTITIONS_LOCK_ID = 7_301_947_227
+PARTITION_NAME = re.compile(r"_y(\d{4})m(\d{2})$")
+PARTITION_UPPER_BOUND = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})")
+LEGACY_BACKFILL_BATCH_SIZE = 10000
+# The swap waits at most this long for its locks rather than queueing every query behind it
+LEGACY_SWAP_LOCK_TIMEOUT = "5s"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def legacy_name(table: str) -> str:
+    return f"{table}_legacy"
+
+
+async def is_partitioned(connection: AsyncConnection, table: str) -> bool:
+    result = await connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+    )
+    return result.first() is not None
+
+
+async def legacy_partition_end(connection: AsyncConnection, table: str) -> Optional[date]:
+    """Exclusive upper bound of the attached legacy partition, None without one."""
+    result = await connection.execute(
+        text(
+            "SELECT pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass) AND child.relname = :legacy"
+        ),
+        {"table": table, "legacy": legacy_name(table)},
+    )
+    bound = result.scalar()
+    match = PARTITION_UPPER_BOUND.search(bound or "")
+    return date.fromisoformat(match.group(1)) if match else None
+
+
+async def list_partitions(connection: AsyncConnection, table: str) -> List[Tuple[str, date]]:
+    """Monthly partitions attached to `table`, oldest first."""
+    result = await connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for (name,) in result:
+        match = PARTITION_NAME.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def ensure_monthly_partitions(
+    engine: AsyncEngine, table: str, months_ahead: int, today: Optional[date] = None
+) -> List[str]:
+    """
+    Creates the partitions of this month and the next `months_ahead` ones, except the months
+    the legacy partition already covers.
+    """
+    current = month_start(today or date.today())
+    created = []
+    async with engine.begin() as connection:
+        # Every worker runs this at startup
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITIONS_LOCK_ID})
+        if not await is_partitioned(connection, table):
+            LOGGER.warning(f"{table} is not partitioned yet, run `python -m src.db.partitions attach-legacy`")
+            return []
+        existing = {name for name, _ in await list_partitions(connection, table)}
+        legacy_end = await legacy_partition_end(connection, table)
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(table, month)
+            if name in existing or (legacy_end is not None and month < legacy_end):
+                continue
+            await connection.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+    if created:
+        LOGGER.info(f"Created partitions {', '.join(created)}")
+    return created
+
+
+async def archive_partitions(
+    engine: AsyncEngine, table: str, keep_months: int, schema: str, today: Optional[date] = None
+) -> List[str]:
+    """
+    Detaches the partitions older than `keep_months` full months and moves them to `schema`.
+    """
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    async with engine.connect() as connection:
+        # DETACH ... CONCURRENTLY cannot run inside a transaction block
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        expired = [name for name, month in await list_partitions(connection, table) if month < cutoff]
+        if not expired:
+            return []
+        await connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+        for name in expired:
+            await connection.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" CONCURRENTLY'))
+            await connection.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{schema}"'))
+            LOGGER.info(f"Archived partition {name} to schema {schema}")
+    return expired
+
+
+async def attach_legacy_table(engine: AsyncEngine, table: str, months_ahead: int, today: Optional[date] = None) -> bool:
+    """
+    Turns an unpartitioned `table` into a partitioned one whose first partition is the old
+    table, renamed `<table>_legacy`, covering every month up to the newest row. Returns False
+    when the table is already partitioned.
+
+    Nothing is copied. The slow steps (backfilling "createdAt", validating a CHECK constraint
+    matching the partition bound, building the (uid, "createdAt") unique index) run first and
+    take no lock that blocks reads or writes. The swap itself is one short transaction of
+    catalog changes: the validated constraint lets Postgres skip the scans `SET NOT NULL` and
+    `ATTACH PARTITION` would otherwise make, and the existing indexes are attached as they are.
+    """
+    legacy = legacy_name(table)
+    async with engine.connect() as connection:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        if await is_partitioned(connection, table):
+            return False
+
+        while True:
+            result = await connection.execute(text(
+                f'UPDATE "{table}" SET "createdAt" = COALESCE("updatedAt", now()) WHERE ctid IN '
+                f'(SELECT ctid FROM "{table}" WHERE "createdAt" IS NULL LIMIT {LEGACY_BACKFILL_BATCH_SIZE})'
+            ))
+            if result.rowcount == 0:
+                break
+
+        # Covers the newest row, future-dated ones included, and the current month, which
+        # keeps receiving rows until the swap
+        latest = today or date.today()
+        newest = (await connection.execute(text(f'SELECT max("createdAt") FROM "{table}"'))).scalar()
+        if newest is not None:
+            latest = max(latest, newest.date())
+        end = add_months(month_start(latest), 1)
+        bound = f"{table}_partition_bound"
+        await connection.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{bound}"'))
+        await connection.execute(text(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{bound}" '
+            f"CHECK (\"createdAt\" IS NOT NULL AND \"createdAt\" < '{end.isoformat()}') NOT VALID"
+        ))
+        await connection.execute(text(f'ALTER TABLE "{table}" VALIDATE CONSTRAINT "{bound}"'))
+        await connection.execute(text(
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{table}_uid_created" ON "{table}" (uid, "createdAt")'
+        ))
+        LOGGER.info(f"Attaching {table} as {legacy}, up to {end.isoformat()}")
+
+        await connection.execute(text("BEGIN"))
+        try:
+            await connection.execute(text(f"SET LOCAL lock_timeout = '{LEGACY_SWAP_LOCK_TIMEOUT}'"))
+            await connection.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+            # Free the constraint and index names for the partitioned table
+            await connection.execute(text(f"""
+                DO $$
+                DECLARE item record;
+                BEGIN
+                    FOR item IN SELECT conname FROM pg_constraint WHERE conrelid = '"{legacy}"'::regclass LOOP
+                        EXECUTE format('ALTER TABLE "{legacy}" RENAME CONSTRAINT %I TO %I',
+                            item.conname, replace(item.conname, '{table}', '{legacy}'));
+                    END LOOP;
+                    FOR item IN SELECT indexname FROM pg_indexes WHERE tablename = '{legacy}'
+                            AND indexname LIKE '%{table}%' AND indexname NOT LIKE '%{legacy}%' LOOP
+                        EXECUTE format('ALTER INDEX %I RENAME TO %I',
+                            item.indexname, replace(item.indexname, '{table}', '{legacy}'));
+                    END LOOP;
+                END $$
+            """))
+            # The partitioned key includes "createdAt", so must the partition's
+            await connection.execute(text(f'ALTER TABLE "{legacy}" ALTER COLUMN "createdAt" SET NOT NULL'))
+            await connection.execute(text(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{legacy}_pkey"'))
+            await connection.execute(text(
+                f'ALTER TABLE "{legacy}" ADD CONSTRAINT "{legacy}_pkey" PRIMARY KEY USING INDEX "{legacy}_uid_created"'
+            ))
+
+            await connection.execute(text(
+                f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) PARTITION BY RANGE ("createdAt")'
+            ))
+            await connection.execute(text(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (uid, "createdAt")'
+            ))
+            await connection.execute(text(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_domainUid_fkey" '
+                'FOREIGN KEY ("domainUid") REFERENCES domains (uid)'
+            ))
+            await connection.execute(text(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_payerUid_fkey" '
+                'FOREIGN KEY ("payerUid") REFERENCES users (uid)'
+            ))
+            # Same definitions as the legacy indexes, which are attached instead of rebuilt
+            await connection.execute(text(
+                f'CREATE INDEX ix_{table}_payer_created ON "{table}" ("payerUid", "createdAt", uid)'
+            ))
+            await connection.execute(text(
+                f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" '
+                f"FOR VALUES FROM (MINVALUE) TO ('{end.isoformat()}')"
+            ))
+            # Implied by the partition bound from now on
+            await connection.execute(text(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{legacy}_partition_bound"'))
+            await connection.execute(text("COMMIT"))
+        except Exception:
+            await connection.execute(text("ROLLBACK"))
+            raise
+
+    await ensure_monthly_partitions(engine, table, months_ahead, today)
+    return True
+
+
+async def _attach_legacy() -> None:
+    engine = create_async_engine(Config.DATABASE_URL, poolclass=NullPool)
+    try:
+        if await attach_legacy_table(engine, TRANSACTIONS_TABLE, Config.TRANSACTION_PARTITIONS_AHEAD):
+            LOGGER.info(f"{TRANSACTIONS_TABLE} is partitioned")
+        else:
+            LOGGER.info(f"{TRANSACTIONS_TABLE} was already partitioned, nothing to do")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition maintenance run by hand.")
+    parser.add_argument("command", choices=["attach-legacy"], help="partition an unpartitioned transactions table")
+    parser.parse_args()
+    asyncio.run(_attach_legacy())
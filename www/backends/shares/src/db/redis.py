@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 import uuid
 import redis.asyncio as aioredis
 from src.config.settings import (
@@ -11,6 +11,8 @@ REDIS_TIMEOUT = 5
 JTI_EXPIRY = 3600
 VERIFICATION_CODE_EXPIRY = 900  # 15 minutes
 SECURITY_EXPIRY = 2592000  # 1 month
+# Outlives every cached value guarded by a generation
+CACHE_GENERATION_EXPIRY = 604800  # 1 week
 
 # Initialize Redis with connection pooling
 redis_pool = aioredis.ConnectionPool.from_url(
@@ -19,6 +21,117 @@ redis_pool = aioredis.ConnectionPool.from_url(
 redis_client = aioredis.Redis(connection_pool=redis_pool)
 
 
+# Server side scripts. Each one runs atomically and costs a single EVALSHA
+# round trip (the script body is only sent again after a SCRIPT FLUSH).
+
+# KEYS[1] = new_ip key, KEYS[2] = allowed key, ARGV[1] = ip
+ALLOW_IP_SCRIPT = redis_client.register_script(
+    """
+    redis.call('DEL', KEYS[1])
+    redis.call('SET', KEYS[2], ARGV[1])
+    return 1
+    """
+)
+
+# KEYS[1] = verification hash. Only flips the flag while the code is still
+# alive so an expired code is not recreated without a TTL.
+MARK_VERIFIED_SCRIPT = redis_client.register_script(
+    """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('HSET', KEYS[1], 'verified', 'true')
+        return 1
+    end
+    return 0
+    """
+)
+
+
+# Cache fills. KEYS[1] = generation counter, KEYS[2] = cached hash, ARGV[1] = generation
+# read before the value was built, ARGV[2] = ttl, ARGV[3..] = field, value pairs. Nothing
+# is stored when an invalidation bumped the generation while the value was being built.
+STORE_CACHED_SCRIPT = redis_client.register_script(
+    """
+    if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[2], unpack(ARGV, 3))
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return 1
+    """
+)
+
+# Leases. KEYS[1] = lease key, ARGV[1] = token of the holder. Only the holder releases
+# the lease, one that expired and was taken by another run is left alone.
+RELEASE_LEASE_SCRIPT = redis_client.register_script(
+    """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+)
+
+# Token buckets. KEYS = one bucket hash per identity (ip, user) for the route,
+# ARGV[1] = capacity, ARGV[2] = refill rate in tokens per second, ARGV[3] = cost.
+# A request is only charged when every bucket can pay for it. Uses the server
+# clock so all workers agree on the refill time.
+# Returns {allowed, lowest remaining, retry after ms, ms until full}.
+TOKEN_BUCKET_SCRIPT = redis_client.register_script(
+    """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local ttl = math.ceil(capacity / rate * 1000)
+
+    local levels = {}
+    local allowed = 1
+    local remaining = capacity
+    local retry_after = 0
+    for i, key in ipairs(KEYS) do
+        local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + (math.max(0, now - ts) / 1000) * rate)
+        levels[i] = tokens
+        if tokens < cost then
+            allowed = 0
+            retry_after = math.max(retry_after, math.ceil((cost - tokens) / rate * 1000))
+        end
+        remaining = math.min(remaining, tokens)
+    end
+
+    if allowed == 1 then
+        remaining = remaining - cost
+    end
+    for i, key in ipairs(KEYS) do
+        local tokens = levels[i]
+        if allowed == 1 then
+            tokens = tokens - cost
+        end
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+        redis.call('PEXPIRE', key, ttl)
+    end
+
+    local reset = math.ceil((capacity - remaining) / rate * 1000)
+    return {allowed, math.floor(remaining), retry_after, reset}
+    """
+)
+
+
+def _new_ip_key(user_id: uuid.UUID, ip: str) -> str:
+    return f"new_ip:{user_id}:{ip}"
+
+
+def _allowed_ip_key(user_id: uuid.UUID, ip: str) -> str:
+    return f"allowed:{user_id}:{ip}"
+
+
+def _verification_key(user_id: uuid.UUID) -> str:
+    return f"verification_code:{user_id}"
+
+
 # Password Reset Code
 async def store_password_reset_code(
     user_id: uuid.UUID, code: str, expiry: int = VERIFICATION_CODE_EXPIRY
@@ -29,25 +142,57 @@ async def store_password_reset_code(
 async def store_new_ip(
     user_id: uuid.UUID, new_ip: str, attempts: int
 ):
-    await redis_client.set(f"new_ip:{user_id}:{new_ip}", attempts, ex=SECURITY_EXPIRY)
+    await redis_client.set(_new_ip_key(user_id, new_ip), attempts, ex=SECURITY_EXPIRY)
 
 async def store_allowed_ip(
     user_id: uuid.UUID, new_ip: str
 ):
-    banned_ip = await redis_client.get(f"new_ip:{user_id}:{new_ip}")
-    if banned_ip:
-        delete_ip_security(user_id,new_ip)
-    await redis_client.set(f"allowed:{user_id}:{new_ip}", new_ip, ex=None)
+    """Clears any pending security record for the ip and marks it as allowed in one round trip."""
+    await ALLOW_IP_SCRIPT(
+        keys=[_new_ip_key(user_id, new_ip), _allowed_ip_key(user_id, new_ip)],
+        args=[new_ip],
+    )
+
+async def store_allowed_ips(
+    user_id: uuid.UUID, ips: Iterable[str]
+):
+    """Bulk variant of `store_allowed_ip` sent as a single MULTI/EXEC pipeline."""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for ip in ips:
+            pipe.delete(_new_ip_key(user_id, ip))
+            pipe.set(_allowed_ip_key(user_id, ip), ip)
+        await pipe.execute()
 
 async def delete_ip_security(
     user_id: uuid.UUID, new_ip: str
 ):
-    await redis_client.delete(f"new_ip:{user_id}:{new_ip}")
+    await redis_client.delete(_new_ip_key(user_id, new_ip))
 
 async def delete_allowed_ip(
     user_id: uuid.UUID, new_ip: str
 ):
-    await redis_client.delete(f"allowed:{user_id}:{new_ip}")
+    await redis_client.delete(_allowed_ip_key(user_id, new_ip))
+
+async def get_ip_security_status(
+    user_id: uuid.UUID, ips: List[str]
+) -> Dict[str, dict]:
+    """
+    Checks many ips for a user with a single MGET.
+
+    Returns a mapping of ip -> {"allowed": bool, "attempts": Optional[int]}.
+    """
+    if not ips:
+        return {}
+    keys = [_allowed_ip_key(user_id, ip) for ip in ips] + [_new_ip_key(user_id, ip) for ip in ips]
+    values = await redis_client.mget(keys)
+    allowed, attempts = values[:len(ips)], values[len(ips):]
+    return {
+        ip: {
+            "allowed": allowed[i] is not None,
+            "attempts": int(attempts[i]) if attempts[i] is not None else None,
+        }
+        for i, ip in enumerate(ips)
+    }
 
 # Get the reset code from Redis
 async def get_password_reset_code(user_id: uuid.UUID) -> Optional[str]:
@@ -57,21 +202,22 @@ async def get_password_reset_code(user_id: uuid.UUID) -> Optional[str]:
 # Email Verification Code
 async def store_verification_code(user_id: uuid.UUID, code: str) -> None:
     """Stores the verification code in Redis with an expiry time."""
-    await redis_client.hset(
-        f"verification_code:{user_id}", mapping={"code": code, "verified": "false"}
-    )
-    await redis_client.expire(f"verification_code:{user_id}", VERIFICATION_CODE_EXPIRY)
+    key = _verification_key(user_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={"code": code, "verified": "false"})
+        pipe.expire(key, VERIFICATION_CODE_EXPIRY)
+        await pipe.execute()
 
 
 async def get_verification_status(user_id: uuid.UUID) -> dict:
     """Retrieves the verification code and status from Redis."""
-    data = await redis_client.hgetall(f"verification_code:{user_id}")
+    data = await redis_client.hgetall(_verification_key(user_id))
     return {k.decode("utf-8"): v.decode("utf-8") for k, v in data.items()}
 
 
-async def mark_email_verified(user_id: uuid.UUID) -> None:
-    """Marks the email as verified."""
-    await redis_client.hset(f"verification_code:{user_id}", "verified", "true")
+async def mark_email_verified(user_id: uuid.UUID) -> bool:
+    """Marks the email as verified. Returns False when the code has already expired."""
+    return await MARK_VERIFIED_SCRIPT(keys=[_verification_key(user_id)]) == 1
 
 
 # Blacklisting
@@ -81,8 +227,85 @@ async def add_jti_to_blocklist(jti: str) -> None:
     await redis_client.set(jti, "", ex=JTI_EXPIRY)
 
 
+async def add_jtis_to_blocklist(jtis: Iterable[str]) -> None:
+    """Adds many JTIs to the blocklist in a single pipelined round trip."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for jti in jtis:
+            pipe.set(jti, "", ex=JTI_EXPIRY)
+        await pipe.execute()
+
+
 async def token_in_blocklist(jti: str) -> bool:
     """Checks if a JTI (JWT ID) is in the Redis blocklist."""
     # Use 'exists' instead of 'get' for better performance
     is_blocked = await redis_client.exists(jti)
     return is_blocked == 1
+
+
+async def tokens_in_blocklist(jtis: List[str]) -> Dict[str, bool]:
+    """Checks many JTIs against the blocklist in a single pipelined round trip."""
+    if not jtis:
+        return {}
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for jti in jtis:
+            pipe.exists(jti)
+        results = await pipe.execute()
+    return {jti: result == 1 for jti, result in zip(jtis, results)}
+
+
+# Cache fills guarded by a generation counter, see STORE_CACHED_SCRIPT
+def _generation_key(key: str) -> str:
+    return f"{key}:generation"
+
+
+async def cache_generation(key: str) -> str:
+    """Read before building a cached value, then passed to `store_cached`."""
+    generation = await redis_client.get(_generation_key(key))
+    return generation.decode() if generation is not None else ""
+
+
+async def store_cached(key: str, generation: str, mapping: Dict[str, object], ttl: int) -> bool:
+    """Caches the hash unless `key` was invalidated since `generation` was read. Returns whether it was stored."""
+    fields = [item for pair in mapping.items() for item in pair]
+    return await STORE_CACHED_SCRIPT(keys=[_generation_key(key), key], args=[generation, ttl, *fields]) == 1
+
+
+async def invalidate_cached(keys: Iterable[str]) -> None:
+    """Drops the cached values and bumps their generation so fills already running do not store stale data."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.incr(_generation_key(key))
+            pipe.expire(_generation_key(key), CACHE_GENERATION_EXPIRY)
+            pipe.delete(key)
+        await pipe.execute()
+
+
+# Rate limiting
+async def consume_rate_limit_tokens(
+    keys: List[str], capacity: int, refill_rate: float, cost: int = 1
+) -> Tuple[bool, int, float, float]:
+    """
+    Atomically charges every token bucket in `keys` in one round trip.
+
+    Returns (allowed, remaining, retry_after_seconds, reset_seconds).
+    """
+    allowed, remaining, retry_after, reset = await TOKEN_BUCKET_SCRIPT(
+        keys=keys, args=[capacity, refill_rate, cost]
+    )
+    return allowed == 1, int(remaining), retry_after / 1000, reset / 1000
+
+
+# Leases, held by one run of a periodic job at a time across every worker
+async def acquire_lease(redis: aioredis.Redis, key: str, ttl: int) -> Optional[str]:
+    """
+    Takes the lease with SET NX EX. Returns the token to release it with, None while
+    another run holds it. The lease expires after `ttl` seconds if it is never released.
+    """
+    token = uuid.uuid4().hex
+    if await redis.set(key, token, nx=True, ex=ttl):
+        return token
+    return None
+
+
+async def release_lease(redis: aioredis.Redis, key: str, token: str) -> None:
+    await RELEASE_LEASE_SCRIPT(keys=[key], args=[token], client=redis)
@@ -67,6 +67,27 @@ class AccountNotVerified(NextStocksException):
     pass
 
 
+class DomainNotFound(NextStocksException):
+    """The domain sent in the `Domain` header is not a known tenant."""
+    pass
+
+
+class DatabaseUnavailable(NextStocksException):
+    """No database connection became free within `DB_POOL_TIMEOUT`."""
+    pass
+
+
+# Upload Errors
+class InvalidImage(NextStocksException):
+    """The uploaded file is empty or not an image Pillow can read."""
+    pass
+
+
+class ImageTooLarge(NextStocksException):
+    """The uploaded file is larger than `UPLOAD_MAX_BYTES`."""
+    pass
+
+
 # Transaction-related Errors
 class TransactionNotFound(NextStocksException):
     """Transaction not found."""
@@ -93,6 +114,56 @@ class InsufficientFunds(NextStocksException):
     pass
 
 
+class InvalidCursor(NextStocksException):
+    """The pagination cursor is malformed or was issued for another listing."""
+    pass
+
+
+class AnalyticsBacklogFull(NextStocksException):
+    """The analytics event buffer is full and the database is not keeping up."""
+    pass
+
+
+class InvalidEventBatch(NextStocksException):
+    """The analytics event batch is malformed or its columns do not line up."""
+    pass
+
+
+class EventBatchTooLarge(NextStocksException):
+    """The analytics event batch exceeds the size or event count limit."""
+    pass
+
+
+class InvalidPortfolioImport(NextStocksException):
+    """The portfolio import file is not a CSV with the required columns."""
+    pass
+
+
+class PortfolioImportTooLarge(NextStocksException):
+    """The portfolio import file exceeds `PORTFOLIO_IMPORT_MAX_BYTES`."""
+    pass
+
+
+class PortfolioImportNotFound(NextStocksException):
+    """No portfolio import with this id, or it expired."""
+    pass
+
+
+class InvalidPriceAlert(NextStocksException):
+    """The alert is not on a held symbol with a known price, or its threshold is the current price."""
+    pass
+
+
+class TooManyPriceAlerts(NextStocksException):
+    """The user already has `PRICE_ALERTS_MAX_PER_USER` pending alerts."""
+    pass
+
+
+class PriceAlertNotFound(NextStocksException):
+    """No price alert with this id for the user."""
+    pass
+
+
 # New Error Classes for Additional Scenarios
 
 class AnalysisDataUnavailable(NextStocksException):
@@ -237,6 +308,166 @@ def register_all_errors(app: FastAPI):
         ),
     )
 
+    app.add_exception_handler(
+        DomainNotFound,
+        create_exception_handler(
+            status_code=status.HTTP_404_NOT_FOUND,
+            initial_detail={
+                "message": "This domain is not registered",
+                "error_code": "domain_not_found",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        DatabaseUnavailable,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail={
+                "message": "The service is busy, please try again shortly",
+                "error_code": "database_unavailable",
+            },
+        ),
+    )
+
+    # Upload Errors
+    app.add_exception_handler(
+        InvalidImage,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "The uploaded file is not a valid image",
+                "error_code": "invalid_image",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        ImageTooLarge,
+        create_exception_handler(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            initial_detail={
+                "message": "The uploaded image is too large",
+                "error_code": "image_too_large",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        InvalidCursor,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "The pagination cursor is invalid, start again from the first page",
+                "error_code": "invalid_cursor",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        AnalyticsBacklogFull,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail={
+                "message": "Too many analytics events are waiting to be stored, retry later",
+                "error_code": "analytics_backlog_full",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        InvalidEventBatch,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "The event batch is malformed",
+                "error_code": "invalid_event_batch",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        EventBatchTooLarge,
+        create_exception_handler(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            initial_detail={
+                "message": "The event batch is too large, send fewer events per request",
+                "error_code": "event_batch_too_large",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        InvalidPortfolioImport,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": (
+                    "The import must be a UTF-8 CSV file with a header naming at least userUid, assetSymbol and assetName"
+                ),
+                "error_code": "invalid_portfolio_import",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        PortfolioImportTooLarge,
+        create_exception_handler(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            initial_detail={
+                "message": "The import file is too large, split it into several files",
+                "error_code": "portfolio_import_too_large",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        PortfolioImportNotFound,
+        create_exception_handler(
+            status_code=status.HTTP_404_NOT_FOUND,
+            initial_detail={
+                "message": "Portfolio import not found",
+                "error_code": "portfolio_import_not_found",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        InvalidPriceAlert,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": (
+                    "Alerts can only be set on a symbol you hold, once its price is known, "
+                    "at a threshold other than the current price"
+                ),
+                "error_code": "invalid_price_alert",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        TooManyPriceAlerts,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "You have reached the maximum number of pending price alerts, delete some first",
+                "error_code": "too_many_price_alerts",
+            },
+        ),
+    )
+
+    app.add_exception_handler(
+        PriceAlertNotFound,
+        create_exception_handler(
+            status_code=status.HTTP_404_NOT_FOUND,
+            initial_detail={
+                "message": "Price alert not found",
+                "error_code": "price_alert_not_found",
+            },
+        ),
+    )
+
     # Analysis and Page View Data Errors
     app.add_exception_handler(
         AnalysisDataUnavailable,
@@ -1,41 +1,173 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, status
 from fastapi.requests import Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from starlette.routing import Match
+import random
 import time
 import logging
 
+from src.apps.accounts.dependencies import get_user_from_token
+from src.config.settings import Config
+from src.db.db import async_session_factory
+from src.errors import NextStocksException
 from src.utils.logger import LOGGER
+from src.utils.memory import MEMORY, RequestMemory, current_request_memory, current_rss
+from src.utils.metrics import METRICS, UNMATCHED_ROUTE
+from src.utils.network import client_ip
+from src.utils.profiling import profiling_requested, save_profile, start_profiler
+from src.utils.ratelimit import rate_limiter
 
 logger = logging.getLogger("uvicorn.access")
 logger.disabled = True
 
+ACCESS_LOGGER = LOGGER.bind(access=True)
+ACCESS_LOG_MESSAGE = "{client} - {method} - {path} - {status} completed after {duration_ms}ms"
+
+
+def match_route_template(request: Request) -> str:
+    """
+    Template of the route the request is dispatched to, e.g. /v1/users/{uid}, so rate limits and
+    metrics get one bucket and one series per route rather than per id. Unrouted requests share
+    one label. Once routed the router's match is used, before that (rate limiting runs before
+    routing) the routes are matched here the same way the router will match them.
+    """
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path_format
+    partial = None
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path_format
+        # The path matches but not the method, the router answers 405 from this route
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path_format
+    return partial or UNMATCHED_ROUTE
+
+
+def record_request(request: Request, status_code: int, processing_time: float):
+    """Adds the request to the latency histogram of its route template (not the raw path)."""
+    METRICS.observe_request(match_route_template(request), request.method, status_code, processing_time)
+
+
+def log_access(request: Request, status_code: int, processing_time: float, exception: bool = False):
+    """Emits one structured access record, the fields are kept under `extra` for the JSON sink."""
+    log = ACCESS_LOGGER.opt(exception=True) if exception else ACCESS_LOGGER
+    level = "ERROR" if status_code >= 500 else "WARNING" if status_code >= 400 else "INFO"
+    log.log(
+        level,
+        ACCESS_LOG_MESSAGE,
+        client=client_ip(request),
+        method=request.method,
+        path=request.url.path,
+        status=status_code,
+        duration_ms=round(processing_time * 1000, 3),
+    )
+
+
+async def is_admin_request(request: Request) -> bool:
+    authorization = request.headers.get("Authorization") or ""
+    if not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        async with async_session_factory() as session:
+            user = await get_user_from_token(authorization[7:], session)
+    # A validly signed token with an unexpected payload fails on its keys or its uid
+    except (NextStocksException, KeyError, TypeError, ValueError, AttributeError):
+        return False
+    return user.isAdmin or user.isSuperuser
+
 
 def register_middleware(app: FastAPI):
 
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        # Near zero cost when off: one header lookup and, if sampling is configured, one random draw
+        sampled = bool(Config.PROFILE_SAMPLE_RATE) and random.random() < Config.PROFILE_SAMPLE_RATE
+        if not sampled and not (profiling_requested(request) and await is_admin_request(request)):
+            return await call_next(request)
+
+        profiler = start_profiler()
+        if profiler is None:
+            return await call_next(request)
+
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            profile = await save_profile(profiler, request.method, request.url.path, started)
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile.name
+        return response
+
+    @app.middleware("http")
+    async def rate_limit(request: Request, call_next):
+        if not Config.RATE_LIMIT_ENABLED or request.method == "OPTIONS":
+            return await call_next(request)
+
+        try:
+            # Buckets are per route template, /users/{uid} is one scope whatever the uid
+            result = await rate_limiter.hit(
+                match_route_template(request), client_ip(request), request.headers.get("Authorization")
+            )
+        except Exception as e:
+            # Fail open, an unavailable Redis must not take the API down with it
+            LOGGER.warning(f"Rate limiter unavailable: {e}")
+            return await call_next(request)
+
+        headers = rate_limiter.headers(result)
+        if not result.allowed:
+            return JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "message": "Too many requests, please slow down",
+                    "error_code": "rate_limit_exceeded",
+                },
+                headers=headers,
+            )
+
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
     @app.middleware("http")
     async def custom_logging(request: Request, call_next):
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         # Check if the request URL is the root "/"
         if request.url.path == "/":
             # Redirect to /api/v1/redocs
             return RedirectResponse(url="/v1")
 
-        response = await call_next(request)
-        processing_time = time.time() - start_time
-
-        host = request.client.host
-        port = request.client.port
-        method = request.method
-        path = request.url.path
+        memory = None
+        if Config.MEMORY_TRACKING_ENABLED:
+            memory = RequestMemory()
+            memory_token = current_request_memory.set(memory)
+            rss_before = current_rss()
 
-        message = f"""
-{host}:{port} - {method} - {path} - {response.status_code} completed after {processing_time}s
-        """
+        METRICS.inc_gauge("http_requests_in_flight")
+        try:
+            response = await call_next(request)
+        except Exception:
+            processing_time = time.perf_counter() - start_time
+            record_request(request, 500, processing_time)
+            log_access(request, 500, processing_time, exception=True)
+            raise
+        finally:
+            METRICS.inc_gauge("http_requests_in_flight", -1)
+            if memory is not None:
+                current_request_memory.reset(memory_token)
+                rss_after = current_rss()
+                rss_delta = rss_after - rss_before if rss_after is not None and rss_before is not None else 0
+                MEMORY.observe_request(memory, match_route_template(request), rss_delta)
 
-        LOGGER.info(message)
+        processing_time = time.perf_counter() - start_time
+        status_code = response.status_code
+        record_request(request, status_code, processing_time)
+        if status_code >= 400 or random.random() < Config.ACCESS_LOG_SAMPLE_RATE:
+            log_access(request, status_code, processing_time)
         return response
 
     app.add_middleware(
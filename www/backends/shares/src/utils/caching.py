@@ -0,0 +1,86 @@
+"""
+Helpers shared by the read-through caches (tenants, public content).
+
+`SingleFlight` lets concurrent misses on one key share a single fill. `invalidate_after_commit`
+registers the session hooks that collect the keys changed by a flush and invalidate them once
+the transaction commits, nothing is invalidated for a rolled back transaction.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.utils.logger import LOGGER
+
+# Running invalidations, the event loop only keeps weak references to tasks
+_invalidations: Set[asyncio.Task] = set()
+
+
+class SingleFlight:
+    """Per-key locks. A key's lock is dropped once nobody holds or waits on it."""
+
+    def __init__(self):
+        # key -> [lock, callers holding or waiting on it]
+        self._locks: Dict[Hashable, List] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+def _invalidation_done(task: asyncio.Task) -> None:
+    _invalidations.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        LOGGER.warning(f"Cache invalidation failed, entries expire on their own: {task.exception()!r}")
+
+
+def invalidate_after_commit(
+    name: str,
+    collect: Callable[[object], Iterable[Hashable]],
+    invalidate: Callable[[Set[Hashable]], Awaitable[None]],
+) -> None:
+    """
+    Calls `invalidate` with the keys `collect` returns for every object flushed in a
+    transaction, once it commits. `collect` returns nothing for unrelated objects. Bulk
+    UPDATE/DELETE statements bypass the ORM and must invalidate themselves.
+    """
+    info_key = f"invalidate:{name}"
+
+    @event.listens_for(Session, "after_flush")
+    def _collect_changes(session: Session, flush_context) -> None:
+        changed: Set[Hashable] = session.info.setdefault(info_key, set())
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            changed.update(collect(obj))
+
+    @event.listens_for(Session, "after_commit")
+    def _invalidate(session: Session) -> None:
+        changed = session.info.pop(info_key, None)
+        if not changed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            LOGGER.warning(f"{name} changed outside of the event loop, cached entries expire on their own")
+            return
+        task = loop.create_task(invalidate(changed))
+        _invalidations.add(task)
+        task.add_done_callback(_invalidation_done)
+
+    @event.listens_for(Session, "after_rollback")
+    def _discard_changes(session: Session) -> None:
+        session.info.pop(info_key, None)
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import random
 import uuid
+from typing import Optional
 from itsdangerous import URLSafeTimedSerializer
 import jwt  # type: ignore
 
@@ -142,6 +143,23 @@ def decode_token(token: str) -> dict:
         LOGGER.exception(e)
         return None
 
+def bearer_user_uid(authorization: Optional[str]) -> Optional[str]:
+    """
+    The user uid of a valid bearer token in an `Authorization` header, None otherwise. Unlike
+    `decode_token` it does not log failures: it runs on every request, for rate limiting and
+    replica routing, where expired or foreign tokens are routine.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization[7:], key=Config.SECRET_KEY, algorithms=[Config.ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    user = payload.get("user") if isinstance(payload, dict) else None
+    user_uid = user.get("user_uid") if isinstance(user, dict) else None
+    return str(user_uid) if user_uid else None
+
+
 def generate_verification_code() -> str:
     """
     The function generates a random 6-digit verification code for a given email address.
@@ -1,11 +1,24 @@
 from __future__ import absolute_import, unicode_literals
 
 """Custom logger configuration."""
+import atexit
+import json
+import queue
+import sys
+import threading
+import traceback
 from logging import Logger
-from sys import stdout
+from typing import Optional, TextIO
 
 from loguru import logger as custom_logger # type: ignore
 
+from src.config.base import BaseConfigSettings
+
+# Records at or above this level are counted apart when dropped, the drop notice reports them
+WARNING_LEVEL_NO = 30
+# Records at or above this level are never dropped, they are written by the caller when the queue is full
+ERROR_LEVEL_NO = 40
+
 
 def log_formatter(record: dict) -> str:
     """
@@ -33,21 +46,155 @@ def log_formatter(record: dict) -> str:
         return "<fg #70acde>{time:MM-DD-YYYY HH:mm:ss}</fg #70acde> | <fg #ae2c2c>{level}</fg #ae2c2c>: <light-white>{message}</light-white>\n"
     return "<fg #70acde>{time:MM-DD-YYYY HH:mm:ss}</fg #70acde> | <fg #b3cfe7>{level}</fg #b3cfe7>: <light-white>{message}</light-white>\n"
 
+def json_record(record: dict) -> dict:
+    """
+    The function `json_record` picks the fields of a loguru record that are written out as a JSON
+    log line. Values bound with `LOGGER.bind(...)` (e.g. the access log fields) end up under `extra`.
+
+    :param record: The loguru record dictionary attached to every message
+    :type record: dict
+    :return: A plain dictionary that is safe to hand over to the background writer thread.
+    """
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+    }
+    if record["extra"]:
+        payload["extra"] = record["extra"]
+    if record["exception"] is not None:
+        payload["exception"] = record["exception"]
+    return payload
+
+
+class QueueSink:
+    """
+    A loguru sink that hands messages over to a background thread which does the actual writing,
+    so log calls made on the event loop never wait on stdout.
+
+    The queue is bounded. When it is full records below ERROR are dropped and counted, never waited
+    on: log calls run on the event loop and a flood of debug output must not stall it. The writer
+    reports how many records, and how many warnings among them, were lost. Errors are written by the
+    caller instead, ahead of the backlog. Once stopped, every record is written by the caller.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, maxsize: int = 10000, serialize: bool = False):
+        self.stream = stream
+        self.serialize = serialize
+        self.dropped = 0
+        self.dropped_warnings = 0
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[object]]" = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._worker, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message) -> None:
+        record = message.record
+        payload = json_record(record) if self.serialize else str(message)
+        if not self._stopped:
+            try:
+                self._queue.put_nowait(payload)
+                return
+            except queue.Full:
+                if record["level"].no < ERROR_LEVEL_NO:
+                    self.dropped += 1
+                    if record["level"].no >= WARNING_LEVEL_NO:
+                        self.dropped_warnings += 1
+                    return
+        self._write(payload)
+        if self._stopped:
+            self.output.flush()
+
+    def _write(self, payload, rendered: bool = False) -> None:
+        text = payload if rendered else self._render(payload)
+        with self._lock:
+            self.output.write(text)
+
+    @property
+    def output(self) -> TextIO:
+        # Without a stream, sys.stdout is looked up on every write: it may be swapped after the sink
+        # is created (test runners capturing output) and the swapped one closed before exit
+        return self.stream if self.stream is not None else sys.stdout
+
+    def _render(self, payload) -> str:
+        if not self.serialize:
+            return payload
+        exception = payload.pop("exception", None)
+        if exception is not None:
+            payload["exception"] = "".join(
+                traceback.format_exception(exception.type, exception.value, exception.traceback)
+            )
+        return json.dumps(payload, default=str) + "\n"
+
+    def _worker(self) -> None:
+        while True:
+            payload = self._queue.get()
+            if payload is None:
+                break
+            self._write(payload)
+            # Only flush once the backlog has been written out
+            if self._queue.empty():
+                self._report_dropped()
+                self.output.flush()
+        self._report_dropped()
+        self.output.flush()
+
+    def _report_dropped(self) -> None:
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warnings, self.dropped_warnings = self.dropped_warnings, 0
+            self._write(f"log queue full, dropped {dropped} records ({warnings} warnings)\n", rendered=True)
+
+    def stop(self) -> None:
+        """Writes out the queued records and stops the writer. Safe to call more than once."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+# The sink `create_logger` installed, stopped on shutdown
+LOG_SINK: Optional[QueueSink] = None
+
+
 def create_logger() -> Logger: # type: ignore
     """
     The function `create_logger` sets up a custom logger with specific configurations.
     :return: The function `create_logger` is returning a custom logger object after removing any
-    existing logger, adding a new logger that outputs to standard output with colorization and a
-    specific log format, and then returning this custom logger object.
+    existing logger and adding a new queue backed sink that writes to standard output from a background
+    thread. Production writes one JSON object per line, otherwise the colorized `log_formatter` is used.
     """
+    serialize = BaseConfigSettings.LOG_JSON
+    if serialize is None:
+        serialize = BaseConfigSettings.ENVIRONMENT == "production"
+
+    global LOG_SINK
+    sink = LOG_SINK = QueueSink(maxsize=BaseConfigSettings.LOG_QUEUE_SIZE, serialize=serialize)
+    # Processes without a lifespan (Celery workers, scripts) still get their backlog written out
+    atexit.register(sink.stop)
+
     custom_logger.remove()
-    custom_logger.add(stdout, colorize=True, format=log_formatter)
+    if serialize:
+        custom_logger.add(sink, colorize=False, format="{message}", backtrace=False, diagnose=False, catch=True)
+    else:
+        custom_logger.add(sink, colorize=True, format=log_formatter)
     return custom_logger
 
 
+def stop_logger() -> None:
+    """Writes out the records still queued, called last on shutdown."""
+    if LOG_SINK is not None:
+        LOG_SINK.stop()
+
+
 # `LOGGER = create_logger()` is creating a custom logger object with specific configurations. This
-# custom logger is set up to output log messages to the standard output (stdout) with colorization
-# based on the log level and a specific log format defined in the `log_formatter` function. The
-# `create_logger` function removes any existing logger, adds a new logger with the specified
-# configurations, and then returns this custom logger object.
+# custom logger is set up to output log messages to the standard output (stdout) through a background
+# writer thread, either colorized based on the log level with the `log_formatter` format, or as JSON
+# lines in production. The `create_logger` function removes any existing logger, adds a new logger
+# with the specified configurations, and then returns this custom logger object.
 LOGGER: Logger = create_logger()
@@ -0,0 +1,192 @@
+"""
+Memory instrumentation for a single worker process.
+
+* tracemalloc snapshots taken on demand and diffed to find what is growing
+* per-route RSS deltas, to tie growth to specific endpoints
+* ORM identity map sizes per session, to spot endpoints that load large object graphs
+
+All numbers are per worker (the responses include the pid). RSS deltas are approximate
+when requests overlap on the event loop, which is why the peak and the mean are both kept.
+"""
+import contextvars
+import os
+import time
+import tracemalloc
+import weakref
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SNAPSHOTS_MAX_KEPT = 10
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size in bytes, read from /proc (Linux only, None elsewhere)."""
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RequestMemory:
+    """Per request holder shared with the sessions opened while handling it."""
+
+    __slots__ = ("route", "identity_map_peak", "__weakref__")
+
+    def __init__(self):
+        self.route: Optional[str] = None
+        self.identity_map_peak = 0
+
+
+current_request_memory: contextvars.ContextVar[Optional[RequestMemory]] = contextvars.ContextVar(
+    "current_request_memory", default=None
+)
+
+
+class RouteMemoryStats:
+    __slots__ = ("count", "rss_delta_total", "rss_delta_peak", "identity_map_peak", "identity_map_total")
+
+    def __init__(self):
+        self.count = 0
+        self.rss_delta_total = 0
+        self.rss_delta_peak = 0
+        self.identity_map_peak = 0
+        self.identity_map_total = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.count,
+            "rss_delta_peak": self.rss_delta_peak,
+            "rss_delta_mean": self.rss_delta_total / self.count if self.count else 0,
+            "identity_map_peak": self.identity_map_peak,
+            "identity_map_mean": self.identity_map_total / self.count if self.count else 0,
+        }
+
+
+class MemoryInstrumentation:
+    def __init__(self):
+        self.routes: Dict[str, RouteMemoryStats] = defaultdict(RouteMemoryStats)
+        self.snapshots: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_snapshot_id = 1
+        self._sessions: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    # Per route
+    def observe_request(self, memory: RequestMemory, route: str, rss_delta: int) -> None:
+        memory.route = route
+        stats = self.routes[route]
+        stats.count += 1
+        stats.rss_delta_total += rss_delta
+        stats.rss_delta_peak = max(stats.rss_delta_peak, rss_delta)
+        self._observe_identity_map(stats, memory.identity_map_peak)
+
+    def _observe_identity_map(self, stats: RouteMemoryStats, size: int) -> None:
+        stats.identity_map_peak = max(stats.identity_map_peak, size)
+        stats.identity_map_total += size
+
+    def route_report(self, limit: int = 50) -> List[dict]:
+        rows = [{"route": route, **stats.as_dict()} for route, stats in self.routes.items()]
+        return sorted(rows, key=lambda row: row["rss_delta_peak"], reverse=True)[:limit]
+
+    # Sessions
+    def track_session(self, session) -> None:
+        memory = current_request_memory.get()
+        self._sessions[session] = {"opened": time.monotonic(), "request": memory}
+
+    def release_session(self, session) -> None:
+        """Called before the session closes, while its identity map is still populated."""
+        info = self._sessions.pop(session, None)
+        memory = info and info["request"]
+        if memory is None:
+            return
+        size = len(session.sync_session.identity_map)
+        if memory.route is None:
+            # Still inside the request, the middleware records the peak once it finishes
+            memory.identity_map_peak = max(memory.identity_map_peak, size)
+        else:
+            # Dependency teardown ran after the response was sent
+            stats = self.routes[memory.route]
+            stats.identity_map_peak = max(stats.identity_map_peak, size)
+
+    def session_report(self, limit: int = 20) -> List[dict]:
+        """The largest identity maps among the sessions that are currently open."""
+        now = time.monotonic()
+        rows = []
+        for session, info in list(self._sessions.items()):
+            identity_map = session.sync_session.identity_map
+            by_class = Counter(type(obj).__name__ for obj in identity_map.values())
+            memory = info["request"]
+            rows.append({
+                "route": memory.route if memory else None,
+                "age_seconds": round(now - info["opened"], 3),
+                "identity_map_size": len(identity_map),
+                "by_class": dict(by_class.most_common()),
+            })
+        return sorted(rows, key=lambda row: row["identity_map_size"], reverse=True)[:limit]
+
+    # tracemalloc
+    @staticmethod
+    def start_tracing(frames: int = 25) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop_tracing(self) -> None:
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+    def take_snapshot(self, label: Optional[str] = None) -> dict:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing, start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        snapshot_id = self._next_snapshot_id
+        self._next_snapshot_id += 1
+        self.snapshots[snapshot_id] = {
+            "snapshot": snapshot,
+            "label": label,
+            "takenAt": datetime.utcnow(),
+            "rss": current_rss(),
+        }
+        while len(self.snapshots) > SNAPSHOTS_MAX_KEPT:
+            self.snapshots.popitem(last=False)
+        return self.describe_snapshot(snapshot_id)
+
+    def describe_snapshot(self, snapshot_id: int) -> dict:
+        entry = self.snapshots[snapshot_id]
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        return {
+            "id": snapshot_id,
+            "label": entry["label"],
+            "takenAt": entry["takenAt"],
+            "rss": entry["rss"],
+            "tracedSize": sum(stat.size for stat in entry["snapshot"].statistics("filename")),
+            "tracedCurrent": traced,
+            "tracedPeak": peak,
+        }
+
+    def diff_snapshots(self, first: int, second: int, key_type: str = "lineno", limit: int = 25) -> List[dict]:
+        """Top allocation sites that grew between two snapshots."""
+        older, newer = self.snapshots[first]["snapshot"], self.snapshots[second]["snapshot"]
+        return [
+            {
+                "location": str(stat.traceback),
+                "size": stat.size,
+                "sizeDiff": stat.size_diff,
+                "count": stat.count,
+                "countDiff": stat.count_diff,
+            }
+            for stat in newer.compare_to(older, key_type)[:limit]
+        ]
+
+
+MEMORY = MemoryInstrumentation()
@@ -0,0 +1,216 @@
+"""
+In-process request metrics merged across gunicorn workers through Redis.
+
+Each worker keeps plain counters (histogram buckets, sums and counts) and adds the
+deltas into shared Redis hashes every few seconds, so a scrape on any worker sees
+the totals of all of them. Gauges are published per worker with a TTL and summed.
+"""
+import asyncio
+import os
+import socket
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.db.redis import redis_client
+from src.utils.logger import LOGGER
+
+# Upper bounds in seconds, the implicit last bucket is +Inf
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 5
+WORKER_TTL = FLUSH_INTERVAL * 3
+
+HISTOGRAMS_KEY = "metrics:histograms"
+WORKERS_KEY_PREFIX = "metrics:worker:"
+SEPARATOR = "\t"
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("buckets", "sum", "count")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Counters for a single worker process.
+
+    Histograms are keyed by (metric name, labels) where labels is a tuple of
+    (name, value) pairs, e.g. ("http_request_duration_seconds", (("route", ...), ...)).
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._pending: Dict[Tuple[str, tuple], Histogram] = defaultdict(Histogram)
+        self._gauges: Dict[str, float] = defaultdict(float)
+        self._flusher: Optional[asyncio.Task] = None
+
+    # Recording
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        self._pending[(name, labels)].observe(value)
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float) -> None:
+        self.observe(
+            "http_request_duration_seconds",
+            (("route", route), ("method", method), ("status", str(status))),
+            seconds,
+        )
+
+    def observe_pool_wait(self, pool: str, seconds: float) -> None:
+        self.observe("db_pool_wait_seconds", (("pool", pool),), seconds)
+
+    def inc_gauge(self, name: str, amount: float = 1) -> None:
+        self._gauges[name] += amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self._gauges[name] = value
+
+    # Cross worker merge
+    async def flush(self) -> None:
+        """Adds the pending deltas to the shared hashes in one pipelined round trip."""
+        pending, self._pending = self._pending, defaultdict(Histogram)
+        worker_key = f"{WORKERS_KEY_PREFIX}{self.worker_id}"
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for (name, labels), histogram in pending.items():
+                    prefix = SEPARATOR.join([name, *(f"{k}={v}" for k, v in labels)])
+                    for index, count in enumerate(histogram.buckets):
+                        if count:
+                            pipe.hincrby(HISTOGRAMS_KEY, f"{prefix}{SEPARATOR}b{index}", count)
+                    pipe.hincrbyfloat(HISTOGRAMS_KEY, f"{prefix}{SEPARATOR}sum", histogram.sum)
+                    pipe.hincrby(HISTOGRAMS_KEY, f"{prefix}{SEPARATOR}count", histogram.count)
+                if self._gauges:
+                    pipe.hset(worker_key, mapping=dict(self._gauges))
+                    pipe.expire(worker_key, WORKER_TTL)
+                await pipe.execute()
+        except Exception as e:
+            # Put the deltas back so nothing is lost while Redis is unavailable
+            for key, histogram in pending.items():
+                merged = self._pending[key]
+                merged.buckets = [a + b for a, b in zip(merged.buckets, histogram.buckets)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+            LOGGER.warning(f"Unable to flush metrics: {e}")
+
+    async def _flush_forever(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_forever())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await redis_client.delete(f"{WORKERS_KEY_PREFIX}{self.worker_id}")
+        self._gauges.clear()
+        await self.flush()
+
+    async def collect(self) -> Tuple[Dict[Tuple[str, tuple], Histogram], Dict[str, float]]:
+        """Returns the histograms and gauges merged across every live worker."""
+        await self.flush()
+        raw = await redis_client.hgetall(HISTOGRAMS_KEY)
+
+        histograms: Dict[Tuple[str, tuple], Histogram] = defaultdict(Histogram)
+        for field, value in raw.items():
+            name, *labels, kind = field.decode().split(SEPARATOR)
+            histogram = histograms[(name, tuple(tuple(label.split("=", 1)) for label in labels))]
+            if kind == "sum":
+                histogram.sum = float(value)
+            elif kind == "count":
+                histogram.count = int(value)
+            else:
+                histogram.buckets[int(kind[1:])] = int(value)
+
+        gauges: Dict[str, float] = defaultdict(float)
+        async for key in redis_client.scan_iter(match=f"{WORKERS_KEY_PREFIX}*", count=100):
+            for name, value in (await redis_client.hgetall(key)).items():
+                gauges[name.decode()] += float(value)
+        return histograms, gauges
+
+
+def quantile(histogram: Histogram, q: float) -> Optional[float]:
+    """Estimates a quantile by linear interpolation inside the bucket it falls in."""
+    if histogram.count == 0:
+        return None
+    rank = q * histogram.count
+    seen = 0
+    for index, count in enumerate(histogram.buckets):
+        if seen + count >= rank and count:
+            lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+            if index == len(LATENCY_BUCKETS):
+                return lower
+            upper = LATENCY_BUCKETS[index]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return LATENCY_BUCKETS[-1]
+
+
+def _labels(labels: Iterable[Tuple[str, str]], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus(histograms: Dict[Tuple[str, tuple], Histogram], gauges: Dict[str, float]) -> str:
+    """Renders the Prometheus text exposition format."""
+    lines: List[str] = []
+    by_name: Dict[str, list] = defaultdict(list)
+    for (name, labels), histogram in sorted(histograms.items()):
+        by_name[name].append((labels, histogram))
+
+    for name, series in by_name.items():
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for index, count in enumerate(histogram.buckets):
+                cumulative += count
+                le = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else "+Inf"
+                le_label = f'le="{le}"'
+                lines.append(f"{name}_bucket{_labels(labels, le_label)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    # Gauge names may carry their labels, e.g. 'db_pool_checked_out{pool="primary"}'
+    typed = set()
+    for name, value in sorted(gauges.items()):
+        base = name.split("{", 1)[0]
+        if base not in typed:
+            typed.add(base)
+            lines.append(f"# TYPE {base} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize(histograms: Dict[Tuple[str, tuple], Histogram], name: str) -> List[dict]:
+    """p50/p95/p99 per label set for one histogram, slowest p99 first."""
+    rows = []
+    for (metric, labels), histogram in histograms.items():
+        if metric != name:
+            continue
+        rows.append({
+            **dict(labels),
+            "count": histogram.count,
+            "mean": histogram.sum / histogram.count if histogram.count else None,
+            "p50": quantile(histogram, 0.50),
+            "p95": quantile(histogram, 0.95),
+            "p99": quantile(histogram, 0.99),
+        })
+    return sorted(rows, key=lambda row: row["p99"] or 0, reverse=True)
+
+
+METRICS = Metrics()
@@ -0,0 +1,36 @@
+"""Client addresses of requests that reach the API through a reverse proxy."""
+import ipaddress
+from functools import lru_cache
+
+from fastapi import Request
+
+from src.config.settings import Config
+
+TRUSTED_PROXIES = tuple(ipaddress.ip_network(network, strict=False) for network in Config.FORWARDED_ALLOW_IPS or ())
+
+
+@lru_cache(maxsize=4096)
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_ip(request: Request) -> str:
+    """
+    The address of the client. Each trusted proxy appends the address it received the request
+    from to `X-Forwarded-For`, so the header is read from the right and the first address that
+    is not a trusted proxy is the client. Entries left of it come from the client itself and
+    are ignored, they can be forged.
+    """
+    host = request.client.host if request.client else "-"
+    if not is_trusted_proxy(host):
+        return host
+    forwarded = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",") if address.strip()]
+    for address in reversed(forwarded):
+        if not is_trusted_proxy(address):
+            return address
+    # Only proxies in the chain, the one closest to the client is the best guess
+    return forwarded[0] if forwarded else host
@@ -0,0 +1,90 @@
+"""On-demand sampling profiles of single requests, saved as speedscope (flame graph) files."""
+import asyncio
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from pyinstrument import Profiler  # type: ignore
+from pyinstrument.renderers import SpeedscopeRenderer  # type: ignore
+
+from src.config.settings import Config
+from src.utils.logger import LOGGER
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_SUFFIX = ".speedscope.json"
+PROFILE_NAME_PATTERN = re.compile(r"^[\w.\-]+\.speedscope\.json$")
+
+
+def profiles_dir() -> Path:
+    return Path(Config.PROFILES_DIR or Config.BASE_DIR / "profiles")
+
+
+# Only one sampling profiler can run per thread, so a worker profiles one request at a time
+_active_profiler: Optional[Profiler] = None
+
+
+def profiling_requested(request) -> bool:
+    """Cheap check for the explicit switch, a header or `?profile=1`."""
+    if request.headers.get(PROFILE_HEADER) == "1":
+        return True
+    return b"profile=" in request.scope["query_string"] and request.query_params.get(PROFILE_QUERY_PARAM) == "1"
+
+
+def start_profiler() -> Optional[Profiler]:
+    """Starts a profiler, or returns None when this worker is already profiling a request."""
+    global _active_profiler
+    if _active_profiler is not None:
+        return None
+    # async_mode="enabled" only attributes samples to the task (context) that started the profiler,
+    # so concurrent requests handled by the same worker do not pollute the profile.
+    _active_profiler = Profiler(interval=Config.PROFILE_INTERVAL, async_mode="enabled")
+    _active_profiler.start()
+    return _active_profiler
+
+
+def _write_profile(profiler: Profiler, method: str, path: str, duration: float) -> Path:
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    slug = re.sub(r"[^\w\-]+", "_", path.strip("/")) or "root"
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{method}-{slug[:80]}-{int(duration * 1000)}ms{PROFILE_SUFFIX}"
+    target = directory / name
+    target.write_text(profiler.output(renderer=SpeedscopeRenderer()))
+
+    # Keep the directory bounded, oldest profiles go first
+    profiles = sorted(directory.glob(f"*{PROFILE_SUFFIX}"))
+    for stale in profiles[:max(len(profiles) - Config.PROFILES_MAX_KEPT, 0)]:
+        stale.unlink(missing_ok=True)
+    return target
+
+
+async def save_profile(profiler: Profiler, method: str, path: str, started: float) -> Optional[Path]:
+    """Stops the profiler and renders it off the event loop."""
+    global _active_profiler
+    profiler.stop()
+    _active_profiler = None
+    try:
+        return await asyncio.to_thread(_write_profile, profiler, method, path, time.perf_counter() - started)
+    except Exception as e:
+        LOGGER.warning(f"Unable to save profile for {method} {path}: {e}")
+        return None
+
+
+def list_profiles() -> List[dict]:
+    directory = profiles_dir()
+    if not directory.exists():
+        return []
+    return [
+        {"name": profile.name, "size": profile.stat().st_size}
+        for profile in sorted(directory.glob(f"*{PROFILE_SUFFIX}"), reverse=True)
+    ]
+
+
+def get_profile_path(name: str) -> Optional[Path]:
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    target = profiles_dir() / name
+    return target if target.is_file() else None
@@ -0,0 +1,141 @@
+"""Token bucket rate limiting backed by Redis with an in-process pre-check."""
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.config.settings import Config
+from src.db.redis import consume_rate_limit_tokens
+from src.utils.hashing import bearer_user_uid
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Paths are relative to the version prefix. Anything listed in
+# `Config.RATE_LIMIT_ROUTES` overrides these defaults.
+DEFAULT_ROUTE_LIMITS: Dict[str, str] = {
+    "/auth/token": "10/minute",
+    "/auth/signup": "5/minute",
+}
+
+LOCAL_BUCKETS_MAX_SIZE = 10000
+
+
+class RateLimit(NamedTuple):
+    capacity: int
+    refill_rate: float  # tokens per second
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: RateLimit
+    remaining: int
+    retry_after: float
+    reset: float
+
+
+def parse_rate_limit(value: str) -> RateLimit:
+    """
+    Parses limits written as "<requests>/<period>", e.g. "10/minute".
+    """
+    amount, _, period = value.partition("/")
+    seconds = PERIODS[period.strip().lower().rstrip("s")]
+    capacity = int(amount)
+    return RateLimit(capacity=capacity, refill_rate=capacity / seconds)
+
+
+class LocalTokenBuckets:
+    """
+    Per-worker mirror of the Redis buckets.
+
+    A worker only sees a share of the traffic, so its own consumption is a lower
+    bound of the global consumption: when the local bucket is empty the caller is
+    certainly over the limit and can be rejected without talking to Redis.
+    """
+
+    def __init__(self, max_size: int = LOCAL_BUCKETS_MAX_SIZE):
+        self.max_size = max_size
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def consume(self, key: str, limit: RateLimit, cost: int = 1) -> Optional[float]:
+        """Charges the local bucket. Returns the retry-after in seconds when it is empty."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(limit.capacity), now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+
+        retry_after = None
+        if tokens < cost:
+            retry_after = (cost - tokens) / limit.refill_rate
+        else:
+            tokens -= cost
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def refund(self, key: str, cost: int = 1) -> None:
+        """Gives back tokens Redis refused to charge so the local view never runs ahead of it."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets[key] = (bucket[0] + cost, bucket[1])
+
+
+class RateLimiter:
+    def __init__(self, default: str, routes: Dict[str, str], prefix: str = ""):
+        self.prefix = prefix
+        self.default = parse_rate_limit(default)
+        self.routes = {
+            f"{prefix}{path}": parse_rate_limit(value)
+            for path, value in {**DEFAULT_ROUTE_LIMITS, **routes}.items()
+        }
+        self.local = LocalTokenBuckets()
+
+    def limit_for(self, route: str) -> Tuple[str, RateLimit]:
+        """Returns the bucket scope and its limit for a route template."""
+        route = route.rstrip("/") or "/"
+        return route, self.routes.get(route, self.default)
+
+    def bucket_keys(self, scope: str, ip: str, user_uid: Optional[str]) -> List[str]:
+        keys = [f"ratelimit:{scope}:ip:{ip}"]
+        if user_uid:
+            keys.append(f"ratelimit:{scope}:user:{user_uid}")
+        return keys
+
+    async def hit(self, route: str, ip: str, authorization: Optional[str] = None) -> RateLimitResult:
+        scope, limit = self.limit_for(route)
+        keys = self.bucket_keys(scope, ip, bearer_user_uid(authorization))
+
+        local_retry = [self.local.consume(key, limit) for key in keys]
+        if any(retry is not None for retry in local_retry):
+            for key, retry in zip(keys, local_retry):
+                if retry is None:
+                    self.local.refund(key)
+            retry_after = max(retry for retry in local_retry if retry is not None)
+            return RateLimitResult(False, limit, 0, retry_after, limit.capacity / limit.refill_rate)
+
+        allowed, remaining, retry_after, reset = await consume_rate_limit_tokens(
+            keys, limit.capacity, limit.refill_rate
+        )
+        if not allowed:
+            for key in keys:
+                self.local.refund(key)
+        return RateLimitResult(allowed, limit, remaining, retry_after, reset)
+
+    @staticmethod
+    def headers(result: RateLimitResult) -> Dict[str, str]:
+        """Standard `RateLimit-*` headers, plus `Retry-After` when rejected."""
+        headers = {
+            "RateLimit-Limit": str(result.limit.capacity),
+            "RateLimit-Remaining": str(max(result.remaining, 0)),
+            "RateLimit-Reset": str(int(result.reset + 0.999)),
+            "RateLimit-Policy": f"{result.limit.capacity};w={int(result.limit.capacity / result.limit.refill_rate)}",
+        }
+        if not result.allowed:
+            headers["Retry-After"] = str(max(int(result.retry_after + 0.999), 1))
+        return headers
+
+
+rate_limiter = RateLimiter(
+    default=Config.RATE_LIMIT_DEFAULT,
+    routes=Config.RATE_LIMIT_ROUTES or {},
+    prefix=f"/{Config.VERSION}",
+)
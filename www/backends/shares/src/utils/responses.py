@@ -0,0 +1,73 @@
+"""
+Fast JSON responses.
+
+`FastJSONResponse` is the project wide response class: it renders with orjson, which
+handles UUID, datetime, date and enums natively, Decimal through `_default`, and embeds
+pydantic models as already encoded JSON fragments.
+
+`Serializer` wraps a read schema in precompiled pydantic-core serializers so ORM rows (or
+lists of them) go straight to JSON bytes in Rust, without the intermediate dicts built by
+`jsonable_encoder`. Endpoints that return `serializer.response(rows)` skip FastAPI's
+response model encoding entirely.
+"""
+from decimal import Decimal
+from typing import Any, Generic, Iterable, List, Type, TypeVar
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return orjson.Fragment(value.__pydantic_serializer__.to_json(value))
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        # Content produced by a `Serializer` is already encoded
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
+
+
+class Serializer(Generic[SchemaT]):
+    """Precompiled JSON serializers for one read schema and for lists of it."""
+
+    def __init__(self, schema: Type[SchemaT]):
+        self.schema = schema
+        self._one = TypeAdapter(schema)
+        self._many = TypeAdapter(List[schema])  # type: ignore[valid-type]
+
+    def validate(self, obj: Any) -> SchemaT:
+        if isinstance(obj, self.schema):
+            return obj
+        return self._one.validate_python(obj, from_attributes=True)
+
+    def dump(self, obj: Any) -> bytes:
+        """Encodes a schema instance, a dict or an ORM object."""
+        return self._one.dump_json(self.validate(obj))
+
+    def dump_many(self, objs: Iterable[Any]) -> bytes:
+        return self._many.dump_json(self._many.validate_python(list(objs), from_attributes=True))
+
+    def response(self, obj: Any, status_code: int = 200, **kwargs) -> FastJSONResponse:
+        return FastJSONResponse(self.dump(obj), status_code=status_code, **kwargs)
+
+    def list_response(self, objs: Iterable[Any], status_code: int = 200, **kwargs) -> FastJSONResponse:
+        return FastJSONResponse(self.dump_many(objs), status_code=status_code, **kwargs)
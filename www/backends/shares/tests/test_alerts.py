@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from src.apps.portfolios import alerts
+from src.apps.portfolios.alerts import AlertEngine, AlertIndex, PriceAlertService, deliver_notifications
+from src.apps.portfolios.enums import PriceAlertDirection
+
+ABOVE, BELOW = PriceAlertDirection.ABOVE, PriceAlertDirection.BELOW
+USER = uuid.uuid4()
+
+
+@pytest.fixture
+def index() -> AlertIndex:
+    return AlertIndex.build([
+        (1, "AAPL", 200.0, ABOVE),
+        (2, "AAPL", 210.0, ABOVE),
+        (3, "AAPL", 180.0, BELOW),
+        (4, "AAPL", 170.0, BELOW),
+        (5, "MSFT", 400.0, ABOVE),
+    ])
+
+
+def test_crossed_rising(index):
+    assert index.crossed("AAPL", 190.0, 205.0) == [1]
+    assert len(index) == 4
+    # Fired alerts are gone
+    assert index.crossed("AAPL", 190.0, 205.0) == []
+
+
+def test_crossed_reaching_threshold(index):
+    assert index.crossed("AAPL", 190.0, 210.0) == [1, 2]
+    assert index.crossed("AAPL", 190.0, 180.0) == [3]
+
+
+def test_crossed_falling(index):
+    assert sorted(index.crossed("AAPL", 190.0, 160.0)) == [3, 4]
+    assert index.crossed("AAPL", 160.0, 190.0) == []
+
+
+def test_crossed_keeps_other_symbols(index):
+    assert index.crossed("MSFT", 390.0, 401.0) == [5]
+    assert index.crossed("MSFT", 390.0, 401.0) == []
+    assert index.crossed("TSLA", 1.0, 1000.0) == []
+    assert len(index) == 4
+
+
+def test_add_and_remove(index):
+    index.add(6, "AAPL", 205.0, ABOVE)
+    assert len(index) == 6
+    index.remove(1, "AAPL", 200.0, ABOVE)
+    # Unknown alerts are ignored
+    index.remove(7, "AAPL", 200.0, ABOVE)
+    index.remove(2, "TSLA", 210.0, ABOVE)
+    assert len(index) == 5
+    assert index.crossed("AAPL", 190.0, 220.0) == [6, 2]
+
+
+def test_past(index):
+    assert sorted(index.past("AAPL", 205.0)) == [1]
+    assert sorted(index.past("AAPL", 175.0)) == [3]
+    assert index.past("AAPL", 190.0) == []
+    assert index.past("TSLA", 190.0) == []
+    assert len(index) == 3
+
+
+class ClaimingEngine:
+    """Stands in for the database: claims every pending alert it is asked to, once."""
+
+    def __init__(self, alerts_by_uid):
+        self.pending = dict(alerts_by_uid)
+
+    @asynccontextmanager
+    async def begin(self):
+        yield self
+
+    async def execute(self, statement, params):
+        now = datetime.now(timezone.utc)
+        rows = [
+            (uid, USER, *self.pending.pop(uid), price, now)
+            for uid, price in zip(params["uids"], params["prices"]) if uid in self.pending
+        ]
+        return type("Result", (), {"all": lambda _: rows})()
+
+
+class Broker:
+    def __init__(self):
+        self.tasks = []
+        self.down = False
+
+    def send_task(self, name, args):
+        if self.down:
+            raise ConnectionError("broker unavailable")
+        self.tasks.append((name, args))
+
+
+@pytest.fixture
+def broker(monkeypatch) -> Broker:
+    broker = Broker()
+    monkeypatch.setattr(alerts, "celery_app", broker)
+    return broker
+
+
+def test_crossed_alert_is_delivered(monkeypatch, broker):
+    alert = uuid.uuid4()
+    monkeypatch.setattr(alerts, "async_engine", ClaimingEngine({alert: ("AAPL", "ABOVE", 200)}))
+    engine = AlertEngine()
+    engine.index = AlertIndex.build([(alert.int, "AAPL", 200.0, ABOVE)])
+    redis = FakeAsyncRedis()
+
+    async def run():
+        engine.publish({"AAPL": 190.0})
+        engine.publish({"AAPL": 205.0})
+        assert await engine.flush() == 1
+        # The worker runs the queued task
+        [(name, [users])] = broker.tasks
+        assert name == alerts.DELIVER_ALERTS_TASK
+        assert await deliver_notifications(redis, users) == 1
+        return await PriceAlertService(redis).notifications(USER)
+
+    [notification] = asyncio.run(run())
+    assert notification["uid"] == str(alert)
+    assert (notification["assetSymbol"], notification["direction"], notification["price"]) == ("AAPL", "Above", 205.0)
+    # Read notifications are gone
+    assert asyncio.run(PriceAlertService(redis).notifications(USER)) == []
+
+
+def test_undelivered_notifications_are_retried(monkeypatch, broker):
+    alert = uuid.uuid4()
+    monkeypatch.setattr(alerts, "async_engine", ClaimingEngine({alert: ("AAPL", "BELOW", 180)}))
+    engine = AlertEngine()
+    engine.index = AlertIndex.build([(alert.int, "AAPL", 180.0, BELOW)])
+    engine.publish({"AAPL": 190.0})
+    engine.publish({"AAPL": 170.0})
+
+    broker.down = True
+    assert asyncio.run(engine.flush()) == 1
+    assert broker.tasks == []
+    broker.down = False
+    # Nothing left to claim, the kept batch goes out
+    assert asyncio.run(engine.flush()) == 0
+    [(_, [users])] = broker.tasks
+    assert [notification["uid"] for notification in users[str(USER)]] == [str(alert)]
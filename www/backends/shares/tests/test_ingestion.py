@@ -0,0 +1,87 @@
+import gzip
+
+import orjson
+import pytest
+
+from src.apps.analytics.ingestion import MAX_NAME_LENGTH, read_event_batch
+from src.config.settings import Config
+from src.errors import EventBatchTooLarge, InvalidEventBatch
+
+
+def batch(**columns) -> bytes:
+    body = {"paths": ["/", "/pricing"], "buttons": ["signup", "faq"], "path": [0, 1], "seconds": [12, 40],
+            "clicks": [[], [0, 1]]}
+    body.update(columns)
+    return orjson.dumps(body)
+
+
+def test_reads_columns():
+    assert read_event_batch(batch(), None) == [("/", [], 12), ("/pricing", ["signup", "faq"], 40)]
+
+
+def test_reads_gzip():
+    assert read_event_batch(gzip.compress(batch()), "gzip") == read_event_batch(batch(), "identity")
+
+
+def test_clicks_are_optional():
+    body = orjson.dumps({"paths": ["/"], "buttons": [], "path": [0, 0], "seconds": [1, 2]})
+    assert read_event_batch(body, None) == [("/", [], 1), ("/", [], 2)]
+
+
+def test_rejects_gzip_bomb():
+    # A few KB on the wire, far over the limit once decompressed
+    body = gzip.compress(b" " * (Config.ANALYTICS_MAX_BATCH_BYTES * 4) + batch())
+    with pytest.raises(EventBatchTooLarge):
+        read_event_batch(body, "gzip")
+
+
+@pytest.mark.parametrize("body, encoding", [
+    (b"not gzip", "gzip"),
+    (batch(), "br"),
+    (b"{", None),
+    (b"[]", None),
+    (orjson.dumps({"paths": ["/"], "buttons": []}), None),
+])
+def test_rejects_undecodable(body, encoding):
+    with pytest.raises(InvalidEventBatch):
+        read_event_batch(body, encoding)
+
+
+@pytest.mark.parametrize("columns", [
+    {"seconds": [12]},
+    {"clicks": [[]]},
+    {"path": [0, 1, 1]},
+    {"path": {"0": 0}},
+])
+def test_rejects_misaligned_columns(columns):
+    with pytest.raises(InvalidEventBatch):
+        read_event_batch(batch(**columns), None)
+
+
+@pytest.mark.parametrize("columns", [
+    {"path": [0, 2]},
+    {"path": [0, -1]},
+    {"path": [0, 1.0]},
+    {"clicks": [[], [2]]},
+    {"clicks": [[], [-1]]},
+    {"clicks": [[], [True]]},
+    {"seconds": [12, -1]},
+    {"seconds": [12, Config.ANALYTICS_MAX_DWELL_SECONDS + 1]},
+    {"seconds": [12, "40"]},
+    {"clicks": [[], [0] * (Config.ANALYTICS_MAX_CLICKS_PER_EVENT + 1)]},
+    {"paths": ["/", ""]},
+    {"paths": ["/", "/" * (MAX_NAME_LENGTH + 1)]},
+    {"paths": ["/", "/pri\x00cing"]},
+    {"paths": ["/", "*"]},
+    {"paths": ["/", "pricing"]},
+    {"buttons": ["signup", None]},
+])
+def test_rejects_out_of_range(columns):
+    with pytest.raises(InvalidEventBatch):
+        read_event_batch(batch(**columns), None)
+
+
+def test_rejects_too_many_events():
+    count = Config.ANALYTICS_MAX_EVENTS_PER_REQUEST + 1
+    with pytest.raises(EventBatchTooLarge):
+        read_event_batch(batch(path=[0] * count, seconds=[1] * count, clicks=[[]] * count), None)
@@ -0,0 +1,52 @@
+import orjson
+
+from src.apps.portfolios.live import LiveSubscriber, QuoteHub
+
+
+def subscribed(hub: QuoteHub, quantities) -> LiveSubscriber:
+    subscriber = LiveSubscriber(None, quantities)
+    hub.subscribe(subscriber)
+    hub.snapshot(subscriber)
+    return subscriber
+
+
+def test_diff_sends_changed_values():
+    hub = QuoteHub()
+    hub.publish({"AAPL": 200.0, "MSFT": 400.0})
+    subscriber = subscribed(hub, {"AAPL": 2, "MSFT": 1})
+    assert hub.diff(subscriber) is None
+
+    hub.publish({"AAPL": 201.0})
+    assert orjson.loads(hub.diff(subscriber)) == {"type": "diff", "holdings": {"AAPL": [201.0, 402.0]}, "total": 802.0}
+    # Nothing new since the last message
+    assert hub.diff(subscriber) is None
+
+
+def test_diff_skips_unchanged_values():
+    hub = QuoteHub()
+    hub.publish({"AAPL": 200.0})
+    subscriber = subscribed(hub, {"AAPL": 0.001})
+    # Marked dirty, but the value rounds to the one already sent
+    hub.publish({"AAPL": 200.001})
+    assert subscriber.dirty == {"AAPL"}
+    assert hub.diff(subscriber) is None
+
+
+def test_diff_ignores_symbols_not_held():
+    hub = QuoteHub()
+    subscriber = subscribed(hub, {"AAPL": 1})
+    hub.publish({"MSFT": 400.0})
+    assert hub.diff(subscriber) is None
+
+    # The first price of a held symbol is sent
+    hub.publish({"AAPL": 200.0})
+    assert orjson.loads(hub.diff(subscriber))["holdings"] == {"AAPL": [200.0, 200.0]}
+
+
+def test_unsubscribed_sockets_are_not_marked():
+    hub = QuoteHub()
+    subscriber = subscribed(hub, {"AAPL": 1})
+    hub.unsubscribe(subscriber)
+    hub.publish({"AAPL": 200.0})
+    assert hub.diff(subscriber) is None
+    assert hub.symbols() == set()
@@ -0,0 +1,52 @@
+import io
+import threading
+
+import pytest
+from loguru import logger
+
+from src.utils.logger import QueueSink
+
+
+class BlockedStream(io.StringIO):
+    """A stream the writer thread waits on until `release` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text: str) -> int:
+        if threading.current_thread().name == "log-writer":
+            self.release.wait(5)
+        return super().write(text)
+
+
+@pytest.fixture
+def sink():
+    stream = BlockedStream()
+    sink = QueueSink(stream, maxsize=1)
+    handler = logger.add(sink, format="{level} {message}")
+    yield sink
+    stream.release.set()
+    # Stops the sink too
+    logger.remove(handler)
+
+
+def test_full_queue_drops_below_error(sink):
+    for number in range(5):
+        logger.debug(f"debug {number}")
+    logger.warning("warning")
+    logger.error("error")
+    # Written by the caller while the writer thread is still blocked
+    assert sink.stream.getvalue() == "ERROR error\n"
+    assert sink.dropped >= 4
+    assert sink.dropped_warnings == 1
+
+
+def test_stop_writes_the_backlog(sink):
+    logger.info("queued")
+    sink.stream.release.set()
+    sink.stop()
+    logger.info("after stop")
+    lines = sink.stream.getvalue().splitlines()
+    assert lines[0] == "INFO queued"
+    assert lines[-1] == "INFO after stop"
@@ -0,0 +1,46 @@
+import uuid
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import pytest
+
+from src.errors import InvalidCursor
+from src.utils.pagination import Cursor, decode_cursor, encode_cursor, paginate
+
+
+class Row(NamedTuple):
+    createdAt: datetime
+    uid: uuid.UUID
+
+
+def test_cursor_round_trip():
+    created_at, uid = datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc), uuid.uuid4()
+    cursor = encode_cursor(created_at, uid)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == Cursor(created_at, uid)
+
+
+def test_no_cursor():
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    "e30",  # {}
+    encode_cursor(datetime(2024, 3, 1), uuid.uuid4())[:-4],
+    "WyJub3QgYSBkYXRlIiwgIjEiXQ",  # ["not a date", "1"]
+    "WzEsIDJd",  # [1, 2]
+])
+def test_rejects_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_paginate():
+    rows = [Row(datetime(2024, 3, day), uuid.uuid4()) for day in (3, 2, 1)]
+    page, cursor = paginate(rows, 2)
+    assert page == rows[:2]
+    assert decode_cursor(cursor) == Cursor(rows[1].createdAt, rows[1].uid)
+    assert paginate(rows, 3) == (rows, None)
+    assert paginate([], 3) == ([], None)
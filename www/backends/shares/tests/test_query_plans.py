@@ -0,0 +1,13 @@
+import asyncio
+import os
+
+import pytest
+
+QUERY_PLAN_DATABASE_URL = os.environ.get("QUERY_PLAN_DATABASE_URL")
+
+
+@pytest.mark.skipif(not QUERY_PLAN_DATABASE_URL, reason="needs a throwaway database in QUERY_PLAN_DATABASE_URL")
+def test_hot_queries_use_indexes():
+    from benchmarks.query_plans import check_plans
+
+    assert asyncio.run(check_plans(QUERY_PLAN_DATABASE_URL, rows=20000)) == {}
@@ -0,0 +1,69 @@
+import pytest
+
+from src.utils import ratelimit
+from src.utils.ratelimit import LocalTokenBuckets, RateLimit, parse_rate_limit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_parse_rate_limit():
+    assert parse_rate_limit("10/minute") == RateLimit(capacity=10, refill_rate=10 / 60)
+    assert parse_rate_limit("5 / Seconds") == RateLimit(capacity=5, refill_rate=5)
+
+
+def test_empties_then_refills(clock):
+    buckets, limit = LocalTokenBuckets(), RateLimit(capacity=2, refill_rate=1)
+    assert buckets.consume("a", limit) is None
+    assert buckets.consume("a", limit) is None
+    assert buckets.consume("a", limit) == pytest.approx(1)
+    clock.now += 0.5
+    assert buckets.consume("a", limit) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.consume("a", limit) is None
+
+
+def test_refills_up_to_capacity(clock):
+    buckets, limit = LocalTokenBuckets(), RateLimit(capacity=2, refill_rate=1)
+    buckets.consume("a", limit)
+    clock.now += 60
+    assert buckets.consume("a", limit, cost=2) is None
+    assert buckets.consume("a", limit) is not None
+
+
+def test_keys_are_independent(clock):
+    buckets, limit = LocalTokenBuckets(), RateLimit(capacity=1, refill_rate=1)
+    assert buckets.consume("a", limit) is None
+    assert buckets.consume("b", limit) is None
+    assert buckets.consume("a", limit) is not None
+
+
+def test_refund(clock):
+    buckets, limit = LocalTokenBuckets(), RateLimit(capacity=1, refill_rate=1)
+    buckets.consume("a", limit)
+    buckets.refund("a")
+    assert buckets.consume("a", limit) is None
+    # Unknown keys are not created
+    buckets.refund("b")
+    assert len(buckets._buckets) == 1
+
+
+def test_evicts_least_recently_used(clock):
+    buckets, limit = LocalTokenBuckets(max_size=2), RateLimit(capacity=1, refill_rate=1)
+    buckets.consume("a", limit)
+    buckets.consume("b", limit)
+    buckets.consume("a", limit)
+    buckets.consume("c", limit)
+    assert list(buckets._buckets) == ["a", "c"]